@@ -0,0 +1,406 @@
+"""
+Offline benchmarks of feed pipeline stages.
+t.me pages and YouTube API responses are served by local stand-ins (see `tests/fake_upstream.py`),
+so results don't depend on network and upstream changes.
+
+    PYTHONPATH="./" python -m benchmarks.bench               # Compare with stored baseline
+    PYTHONPATH="./" python -m benchmarks.bench --save        # Store results as new baseline
+    PYTHONPATH="./" python -m benchmarks.bench parse_page    # Only stages with matching names
+
+Stages ending with "_bytes" measure memory held by their result instead of time.
+Stages with "_latency" get stand-in responses delayed by UPSTREAM_LATENCY, to time concurrent requests.
+Besides baseline, each run checks SPEEDUPS: relations between stages, that hold on any machine.
+
+Env is loaded same as for tests (`.env`, YT api enabled).
+Baseline is machine dependent: regenerate it on the same machine before comparing changes.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import types
+from typing import (
+    Callable,
+    Iterator,
+)
+from unittest import (
+    mock,
+)
+
+import httpx
+from fastapi.testclient import (
+    TestClient,
+)
+
+from src import (
+    main,
+    tg_api,
+    utils,
+    yt_api,
+)
+from src.base import (
+    ApiChannel,
+)
+from src.conditional import (
+    FeedValidatorsCache,
+)
+from src.feed_store import (
+    feed_store,
+)
+from src.http_cache import (
+    HttpCache,
+    MemoryCacheBackend,
+)
+from src.metadata_cache import (
+    MetadataCache,
+)
+from src.parsing import (
+    BS4PageParser,
+    LxmlPageParser,
+    ParsePool,
+    page_parser,
+)
+from src.rss import (
+    RssFormat,
+    channel_gen_rss,
+)
+from src.tg_api import (
+    TGApiChannel,
+    TGPost,
+)
+from src.yt_api import (
+    YTApiChannel,
+    YTVideo,
+)
+from src.yt_quota import (
+    QuotaManager,
+)
+from tests.fake_upstream import (
+    TG_PAGE_SIZE,
+    FakeSession,
+    FakeTelegram,
+    FakeYouTube,
+    async_client_for,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+BENCH_REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "1.3"))  # Slowdown ratio reported as regression
+
+TG_POSTS_COUNT = 200
+YT_VIDEOS_COUNT = 200
+FEED_ENTRIES_COUNT = 100
+HISTORY_POSTS_COUNT = 10_000
+UPSTREAM_LATENCY = 0.01  # Seconds
+LATENCY_CHANNELS_COUNT = 5
+
+# (faster stage, slower stage, min ratio of their times)
+SPEEDUPS = [
+    ("parse_page_lxml", "parse_page_bs4", 3.0),
+    ("tg_fetch_all_latency_parallel_pages", "tg_fetch_all_latency_serial_pages", 1.4),
+    ("tg_fetch_channels_latency_gathered", "tg_fetch_channels_latency_serial", 2.0),
+]
+
+bench_parse_pool = ParsePool(workers=os.cpu_count() or 1)
+
+
+class Upstream:
+    """
+    Single handler for t.me and YouTube API stand-ins
+    """
+
+    def __init__(self):
+        self.tg = FakeTelegram("bench_channel", posts_count=TG_POSTS_COUNT)
+        self.yt = FakeYouTube(videos_count=YT_VIDEOS_COUNT)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.startswith("/s/"):
+            return self.tg.handle(request)
+        return self.yt.handle(request)
+
+
+@contextlib.contextmanager
+def offline_env(upstream: Upstream) -> Iterator[None]:
+    """
+    Route requests to stand-ins, and disable stores and caches, so every run does the same work
+    """
+    with contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as feeds_path:
+        for obj, attr, value in [
+            (utils, "session", FakeSession(upstream.handle)),
+            (utils, "_async_client", async_client_for(upstream.handle)),
+            (utils, "http_cache", HttpCache(MemoryCacheBackend(64 * 1024 * 1024), default_ttl=60)),
+            (ApiChannel, "item_store", None),
+            (ApiChannel, "metadata_cache", None),
+            (yt_api, "videos_cache", MetadataCache(ttl=0)),
+            (yt_api, "yt_quota", QuotaManager(keys=["x"], daily_quota=10**12)),
+            (feed_store, "path", feeds_path),
+            (main, "feed_validators_cache", FeedValidatorsCache(ttl=datetime.timedelta(0))),
+        ]:
+            stack.enter_context(mock.patch.object(obj, attr, value))
+        stack.callback(bench_parse_pool.shutdown)
+        yield
+
+
+def reset_caches():
+    """Forget upstream responses and rendered feeds, kept between runs"""
+    utils.http_cache.clear()
+    shutil.rmtree(feed_store.path)
+    os.makedirs(feed_store.path)
+
+
+def stages(upstream: Upstream) -> dict[str, Callable[[], object]]:
+    """
+    :returns: Callables, each running single stage once
+    """
+    html = upstream.tg.render_page()
+    bs4_parser, lxml_parser = BS4PageParser(), LxmlPageParser()
+    lxml_posts = lxml_parser.parse_page(html).posts
+    bs4_posts = bs4_parser.parse_page(html).posts
+
+    video_ids = [f"v{i}" for i in range(YT_VIDEOS_COUNT, 0, -1)]
+    videos_json = [{"id": i, "snippet": upstream.yt.video_snippet(int(i[1:]))} for i in video_ids]
+
+    tg_channel = TGApiChannel(upstream.tg.username)
+    tg_items = tg_channel.fetch_items(entries_count=FEED_ENTRIES_COUNT)
+
+    client = TestClient(main.app)
+
+    latency_channels = {
+        f"/s/latency_channel{i}": FakeTelegram(f"latency_channel{i}") for i in range(LATENCY_CHANNELS_COUNT)
+    }
+
+    async def delayed_handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        fake = latency_channels.get(request.url.path)
+        return fake.handle(request) if fake else upstream.handle(request)
+
+    latency_client = async_client_for(delayed_handle)
+
+    def fetch_tg():
+        reset_caches()
+        return TGApiChannel(upstream.tg.username).fetch_items(entries_count=FEED_ENTRIES_COUNT)
+
+    def fetch_tg_async():
+        reset_caches()
+        return asyncio.run(
+            TGApiChannel(upstream.tg.username, with_metadata=False).fetch_items_async(entries_count=FEED_ENTRIES_COUNT)
+        )
+
+    def fetch_tg_all_async(parse_pool: ParsePool):
+        reset_caches()
+        with mock.patch.object(tg_api, "parse_pool", parse_pool):
+            return asyncio.run(
+                TGApiChannel(upstream.tg.username, with_metadata=False).fetch_items_async(fetch_all=True)
+            )
+
+    def fetch_tg_all_latency(parallel_pages: int):
+        reset_caches()
+        with (
+            mock.patch.object(utils, "_async_client", latency_client),
+            mock.patch.object(tg_api, "TG_PARALLEL_PAGES", parallel_pages),
+            mock.patch.object(tg_api, "parse_pool", ParsePool(workers=0)),
+        ):
+            return asyncio.run(
+                TGApiChannel(upstream.tg.username, with_metadata=False).fetch_items_async(fetch_all=True)
+            )
+
+    def fetch_tg_channels_latency(gathered: bool):
+        reset_caches()
+
+        async def fetch(fake: FakeTelegram):
+            return await TGApiChannel(fake.username, with_metadata=False).fetch_items_async()
+
+        async def fetch_channels():
+            if gathered:
+                return await asyncio.gather(*[fetch(i) for i in latency_channels.values()])
+            return [await fetch(i) for i in latency_channels.values()]
+
+        with mock.patch.object(utils, "_async_client", latency_client):
+            return asyncio.run(fetch_channels())
+
+    def fetch_yt():
+        reset_caches()
+        return YTApiChannel(upstream.yt.channel_id).fetch_items(entries_count=FEED_ENTRIES_COUNT)
+
+    def get_feed(username: str, bridge_type: str):
+        reset_caches()
+        resp = client.get(f"/rss-feed/{username}", params={"bridge_type": bridge_type, "count": FEED_ENTRIES_COUNT})
+        assert resp.status_code == 200, resp.text
+
+    return {
+        "parse_page_bs4": lambda: bs4_parser.parse_page(html),
+        "parse_page_lxml": lambda: lxml_parser.parse_page(html),
+        "tg_post_from_raw_data_bs4": lambda: [TGPost.from_raw_data(i) for i in bs4_posts],
+        "tg_post_from_raw_data_lxml": lambda: [TGPost.from_raw_data(i) for i in lxml_posts],
+        "yt_video_from_raw_data": lambda: [YTVideo.from_raw_data(i) for i in videos_json],
+        "tg_fetch_items": fetch_tg,
+        "tg_fetch_items_async": fetch_tg_async,
+        "tg_fetch_all_async": lambda: fetch_tg_all_async(ParsePool(workers=0)),
+        "tg_fetch_all_async_parse_pool": lambda: fetch_tg_all_async(bench_parse_pool),
+        "tg_fetch_all_latency_serial_pages": lambda: fetch_tg_all_latency(1),
+        "tg_fetch_all_latency_parallel_pages": lambda: fetch_tg_all_latency(4),
+        "tg_fetch_channels_latency_serial": lambda: fetch_tg_channels_latency(gathered=False),
+        "tg_fetch_channels_latency_gathered": lambda: fetch_tg_channels_latency(gathered=True),
+        "yt_fetch_items": fetch_yt,
+        "channel_gen_rss_atom": lambda: channel_gen_rss(tg_channel, tg_items, RssFormat.ATOM),
+        "channel_gen_rss_rss": lambda: channel_gen_rss(tg_channel, tg_items, RssFormat.RSS),
+        "get_feed_tg": lambda: get_feed(upstream.tg.username, "tg"),
+        "get_feed_yt": lambda: get_feed(upstream.yt.channel_id, "yt"),
+    }
+
+
+def memory_stages() -> dict[str, Callable[[], object]]:
+    """
+    :returns: Callables, each building objects to be measured
+    """
+    history = FakeTelegram("history_channel", posts_count=HISTORY_POSTS_COUNT)
+    pages = [history.render_page(before) for before in range(HISTORY_POSTS_COUNT + 1, 1, -TG_PAGE_SIZE)]
+
+    def tg_items():
+        return [
+            item
+            for html in pages
+            for item in (TGPost.from_raw_data(i) for i in page_parser.parse_page(html).posts)
+            if item
+        ]
+
+    return {
+        "tg_items_10k_bytes": tg_items,  # Whole channel history kept in memory
+    }
+
+
+def measure_memory(build: Callable[[], object]) -> float:
+    """
+    :returns: Total size of objects reachable from result of `build` (shared ones are counted once,
+    classes and modules are skipped)
+    """
+    seen: set[int] = set()
+    stack = [build()]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+
+def measure(func: Callable[[], object], repeat: int = BENCH_REPEAT) -> float:
+    """
+    :returns: Best time of single call, seconds
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(names: list[str] | None = None) -> dict[str, float]:
+    upstream = Upstream()
+    res = {}
+    with offline_env(upstream):
+        for name, func in stages(upstream).items():
+            if names and not any(i in name for i in names):
+                continue
+            res[name] = measure(func)
+
+    for name, build in memory_stages().items():
+        if names and not any(i in name for i in names):
+            continue
+        res[name] = measure_memory(build)
+    return res
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict[str, float]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results: dict[str, float], path: str = BASELINE_PATH):
+    baseline = {**load_baseline(path), **{k: round(v, 7) for k, v in results.items()}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(baseline.items())), f, indent=2)
+        f.write("\n")
+
+
+def _format(name: str, value: float | None) -> str:
+    if value is None:
+        return "-"
+    return f"{value / 1024:.1f} KiB" if name.endswith("_bytes") else f"{value * 1000:.3f} ms"
+
+
+def report(results: dict[str, float], baseline: dict[str, float], tolerance: float = BENCH_TOLERANCE) -> list[str]:
+    """
+    Print results table
+
+    :returns: Names of stages slower (or using more memory) than baseline by more than `tolerance` times
+    """
+    regressions = []
+    print(f"{'stage':<40}{'value':>16}{'baseline':>16}{'ratio':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        ratio = value / base if base else None
+        mark = ""
+        if ratio and ratio > tolerance:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(
+            f"{name:<40}{_format(name, value):>16}{_format(name, base):>16}"
+            f"{ratio if ratio else float('nan'):>8.2f}{mark}"
+        )
+    return regressions
+
+
+def check_speedups(results: dict[str, float], speedups: list[tuple[str, str, float]] = SPEEDUPS) -> list[str]:
+    """
+    Print relations between measured stages
+
+    :returns: Names of faster stages, that are not faster enough
+    """
+    failed = []
+    for fast, slow, min_ratio in speedups:
+        if fast not in results or slow not in results:
+            continue
+        ratio = results[slow] / results[fast]
+        mark = ""
+        if ratio < min_ratio:
+            failed.append(fast)
+            mark = f"  EXPECTED >= {min_ratio}"
+        print(f"{fast} is {ratio:.2f}x faster than {slow}{mark}")
+    return failed
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stages", nargs="*", help="Run only stages with names containing any of given substrings")
+    parser.add_argument("--save", action="store_true", help="Store results as baseline")
+    args = parser.parse_args()
+
+    results = run(args.stages)
+    regressions = report(results, load_baseline())
+    failed_speedups = check_speedups(results)
+    if args.save:
+        save_baseline(results)
+        print(f"Baseline saved: {BASELINE_PATH}")
+    elif regressions:
+        print(f"Slower than baseline by more than {BENCH_TOLERANCE}x: {', '.join(regressions)}")
+    if failed_speedups:
+        print(f"Not faster enough: {', '.join(failed_speedups)}")
+    if failed_speedups or (regressions and not args.save):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,62 @@
+import datetime
+import hashlib
+import heapq
+import os
+from typing import (
+    Iterable,
+    List,
+    Sequence,
+)
+
+from src.base import (
+    ApiChannel,
+    Item,
+)
+from src.utils import (
+    DEFAULT_TZ,
+    date_to_datetime,
+)
+
+AGGREGATE_MAX_CHANNELS = int(os.getenv("AGGREGATE_MAX_CHANNELS", "20"))
+AGGREGATE_MAX_CONCURRENCY = int(os.getenv("AGGREGATE_MAX_CONCURRENCY", "4"))
+
+_OLDEST = datetime.datetime.min.replace(tzinfo=DEFAULT_TZ)
+
+
+class ChannelsGroup(ApiChannel):
+    """
+    Several channels, merged into single feed. Holds only metadata used in feed header, items are fetched
+    by each channel and merged with `merge_items`.
+    """
+
+    def __init__(self, channels: Sequence[ApiChannel]):
+        self.channels = channels
+
+        store_keys = "|".join(i.store_key for i in channels)
+        super().__init__(url=f"urn:sha1:{hashlib.sha1(store_keys.encode()).hexdigest()}", with_metadata=False)
+
+        self.username = "+".join(i.username or "unknown" for i in channels)
+        self.full_name = " + ".join(i.full_name or i.username or "unknown" for i in channels)
+        self.description = "Aggregated feed of: " + ", ".join(i.url for i in channels)
+
+
+def merge_items(
+    items_lists: Iterable[Sequence[Item]],
+    entries_count: int | None = None,
+    after_date: datetime.date | None = None,
+) -> List[Item]:
+    """
+    K-way merge of items lists, each ordered by pub_date descending (as returned by `fetch_items`)
+
+    :returns: Merged items ordered by pub_date descending, cut by entries_count and after_date
+    """
+    cutoff = date_to_datetime(after_date) if after_date else None
+
+    res: List[Item] = []
+    for item in heapq.merge(*items_lists, key=lambda i: i.pub_date or _OLDEST, reverse=True):
+        if entries_count and len(res) >= entries_count:
+            break
+        if cutoff and item.pub_date and item.pub_date < cutoff:
+            break
+        res.append(item)
+    return res
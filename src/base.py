@@ -1,38 +1,68 @@
+import dataclasses
 import datetime
+from collections import (
+    deque,
+)
 from dataclasses import (
     dataclass,
 )
 from typing import (
     Any,
-    Generator,
+    Deque,
+    Iterator,
     List,
     Optional,
+    Self,
     Sequence,
 )
 
+from .metadata_cache import (
+    MetadataCache,
+    metadata_cache,
+)
+from .store import (
+    ItemStore,
+    item_store,
+)
 from .utils import (
     date_to_datetime,
 )
 
 
-@dataclass
+@dataclass(slots=True)
 class Item:
     """
-    Base interface defining Feed.fetch_items() return type
+    Base interface defining Feed.fetch_items() return type.
+    Slotted, and content is stored in single representation (see `text_content`, `html_content`),
+    so whole channel histories can be kept in memory.
     """
 
     # id: int  # Unique attr
     url: str | None
     pub_date: datetime.datetime | None
     title: str | None = None
-    text_content: str | None = None
-    html_content: str | None = None
     preview_media_url: str | None = None
 
+    @property
+    def text_content(self) -> str | None:
+        return None
+
+    @property
+    def html_content(self) -> str | None:
+        return None
+
     @classmethod
     def from_raw_data(cls, _: Any) -> Optional["Item"]:
         pass
 
+    @classmethod
+    def from_fields(cls, fields: dict[str, Any]) -> Self:
+        """
+        Inverse of `dataclasses.asdict`, unknown fields (e.g. stored by previous versions) are skipped
+        """
+        names = {i.name for i in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in fields.items() if k in names})
+
 
 # TODO
 # ItemDataclassType = TypeVar("ItemDataclassType", bound=Item)
@@ -46,103 +76,338 @@ class ApiChannel:
     # Fetching related attrs
     SUPPORT_FILTER_BY_DATE = False  # If api supports fetching items filtered by date > self._published_after_param
     _published_after_param: Optional[datetime.date]
-    q: List = []
+    q: Deque  # Raw items of fetched pages, converted to ItemClass lazily (set per instance, see reset_fetch_fields)
     max_requests = float("inf")
 
+    # Items store related attrs
+    item_store: ItemStore | None = item_store
+    _fetch_query: tuple = (False, None, None)  # (fetch_all, entries_count, after_date) of current fetch
+    _fetched_count: int = 0
+    _last_fetched_item: Item | None = None
+    _is_connected_to_store = False  # Reached item that is already stored
+    _is_stopped_by_store = False
+    _is_stopped_by_limit = False
+    _is_upstream_unavailable = False  # Paging stopped as upstream can't be requested (e.g. api quota is spent)
+
     # Metadata
+    METADATA_FIELDS: tuple[str, ...] = ("full_name", "logo_url", "description")  # Cached attrs
+    metadata_cache: MetadataCache | None = metadata_cache
     username: str | None = None
     full_name: str | None = None
     logo_url: str | None = None
     description: str | None = None
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, with_metadata: bool = True):
         self.url = url
         self.reset_fetch_fields()
-        if not self.is_fetched_metadata():
+        if with_metadata and not self.is_fetched_metadata() and not self.load_cached_metadata():
             self.fetch_metadata()
 
+    @classmethod
+    async def create(cls, url_or_alias: str) -> "ApiChannel":
+        """
+        Async constructor, fetches metadata without blocking event loop
+        """
+        channel = cls(url_or_alias, False)
+        if not channel.is_fetched_metadata() and not channel.load_cached_metadata():
+            await channel.fetch_metadata_async()
+        return channel
+
+    @classmethod
+    def can_refresh_in_background(cls) -> bool:
+        """Whether feeds of this api may be fetched without reader request (e.g. api quota allows it)"""
+        return True
+
     def reset_fetch_fields(self):
-        self.q = []
+        self.q = deque()
         self.max_requests = float("inf")
         self._published_after_param = None
 
+        self._fetch_query = (False, None, None)
+        self._fetched_count = 0
+        self._last_fetched_item = None
+        self._is_connected_to_store = False
+        self._is_stopped_by_store = False
+        self._is_stopped_by_limit = False
+        self._is_upstream_unavailable = False
+
+    @property
+    def store_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.url}"
+
+    @property
+    def metadata_key(self) -> str:
+        return self.store_key
+
     def is_fetched_metadata(self):
         pass
 
+    def load_cached_metadata(self) -> bool:
+        cached = self.metadata_cache.get(self.metadata_key) if self.metadata_cache else None
+        if cached is None:
+            return False
+
+        for k, v in cached.items():
+            setattr(self, k, v)
+        return True
+
+    def cache_metadata(self):
+        if self.metadata_cache:
+            self.metadata_cache.put(self.metadata_key, {i: getattr(self, i) for i in self.METADATA_FIELDS})
+
     def fetch_metadata(self):
-        print("\nMETADATA | ", end="")
+        pass
+
+    async def fetch_metadata_async(self):
+        pass
 
     def fetch_next(self):
         pass
 
-    # @my_lru_cache
-    def fetch_items(
+    async def fetch_next_async(self):
+        pass
+
+    def _setup_fetch_limits(
         self,
         fetch_all=False,
         entries_count: int | None = None,
         max_requests: int | None = None,
         after_date: datetime.date | None = None,
-    ) -> Sequence[ItemClass]:  # type: ignore  # noqa
+    ) -> datetime.date | None:
         """
-        Base function to get new updates from given feed.
-
         When no params passed, set max_requests = 1,
         to limit made requests count
 
-        :returns: list of fetched entries
+        :returns: after_date to be checked on client side (None if it is passed to api)
         """
-
         if not (fetch_all or entries_count or max_requests or after_date or self._published_after_param):
             self.max_requests = 1
         elif max_requests:
             self.max_requests = max_requests
 
+        self._fetch_query = (fetch_all, entries_count, after_date)
+
         if after_date and self.SUPPORT_FILTER_BY_DATE:
             self._published_after_param = after_date
-            return self.fetch_items(fetch_all=fetch_all, entries_count=entries_count, after_date=None)
-
-        def inner() -> Generator:
-            try:
-                i = 0
-                c: Item
-                while c := self.__next():
-                    if entries_count and i >= entries_count:  # Limited by max count of entries
-                        return
-                    if after_date and c.pub_date and c.pub_date > date_to_datetime(after_date):  # Limited by min date
-                        return
-                    yield c
-                    i += 1
-            except StopIteration:
-                return
+            return None
+        return after_date
 
-        res = list(inner())
-        self.reset_fetch_fields()
-        return res
+    # --- Items store related funcs ---
+    def _on_item_fetched(self, item: Item):
+        self._fetched_count += 1
+        self._last_fetched_item = item
 
-    def is_iteration_ended(self):
-        pass
+        if self.item_store and not self._is_connected_to_store:
+            self._is_connected_to_store = self.item_store.contains(self.store_key, item.url)
+
+    def _can_answer_from_store(self) -> bool:
+        """
+        Whether the rest of requested items (older than already fetched) is stored,
+        so there is no need to fetch next pages.
+        Requests limited only by `max_requests` are always fetched from api.
+        """
+        if not (self.item_store and self._is_connected_to_store):
+            return False
+
+        fetch_all, entries_count, after_date = self._fetch_query
+        if not (fetch_all or entries_count or after_date):
+            return False
+
+        if self.item_store.is_complete(self.store_key):
+            return True
+        if fetch_all:
+            return False
+
+        if entries_count:
+            before = self._last_fetched_item.pub_date if self._last_fetched_item else None
+            if self._fetched_count + self.item_store.count_older(self.store_key, before) >= entries_count:
+                return True
 
-    def __next(self):  # -> T:  # TODO Maybe change this method
-        if len(self.q) > 0:
-            head_post = self.q.pop(0)
-            # try:
-            dataclass_item = self.ItemClass.from_raw_data(head_post)
-            # except Exception:
-            #     dataclass_item = None
+        if after_date:
+            oldest = self.item_store.oldest_pub_date(self.store_key)
+            if oldest and oldest <= date_to_datetime(after_date):
+                return True
 
-            return dataclass_item if dataclass_item else self.__next()
+        return False
 
-        if self.is_iteration_ended():
+    def _should_stop_paging(self) -> bool:
+        if self._can_answer_from_store():
+            self._is_stopped_by_store = True
+        return self._is_stopped_by_store
+
+    def _sync_with_store(self, res: List[Item]) -> List[Item]:
+        """
+        Save fetched items, and complete them with stored ones if paging was stopped by store,
+        or upstream became unavailable
+        """
+        if not self.item_store:
+            return res
+
+        # Whole channel history is fetched
+        is_ended = (
+            not self._is_stopped_by_limit
+            and not self._is_upstream_unavailable
+            and not self._published_after_param
+            and not self.q
+            and bool(self.is_iteration_ended())
+        )
+
+        if self._is_connected_to_store:
+            self.item_store.save(self.store_key, res, complete=True if is_ended else None)
+        elif not self._is_upstream_unavailable:  # Stored items (if any) are not contiguous with fetched ones
+            self.item_store.save(self.store_key, res, replace=True, complete=is_ended)
+        # Else: incomplete fetch must not replace stored items, they are served as they are
+
+        if not (self._is_stopped_by_store or self._is_upstream_unavailable):
+            return res
+
+        _, entries_count, after_date = self._fetch_query
+        stored = self.item_store.query(
+            self.store_key,
+            self.ItemClass,
+            before=res[-1].pub_date if res else None,
+            after_date=after_date,
+            limit=entries_count - len(res) if entries_count else None,
+        )
+        return res + stored
+
+    @staticmethod
+    def _is_limit_reached(
+        item: Item,
+        fetched_count: int,
+        entries_count: int | None = None,
+        after_date: datetime.date | None = None,
+    ) -> bool:
+        if entries_count and fetched_count >= entries_count:  # Limited by max count of entries
+            return True
+        if after_date and item.pub_date and item.pub_date < date_to_datetime(after_date):  # Limited by min date
+            return True
+        return False
+
+    # --- Iterator related funcs ---
+    def _is_paging_ended(self) -> bool:
+        if self._is_upstream_unavailable:
+            return True
+
+        _, entries_count, _ = self._fetch_query
+        if entries_count and self._fetched_count >= entries_count:  # Don't fetch page, that won't be used
+            self._is_stopped_by_limit = True
+            return True
+        return bool(self.is_iteration_ended()) or self.max_requests <= 0 or self._should_stop_paging()
+
+    def _accept_item(
+        self,
+        raw: Any,
+        entries_count: int | None = None,
+        after_date: datetime.date | None = None,
+    ) -> Item | None:
+        """
+        Convert raw queued item to ItemClass
+
+        :returns: None if item is skipped (has no content) or fetch limit is reached (self._is_stopped_by_limit set)
+        """
+        item = self.ItemClass.from_raw_data(raw)
+        if item is None:
+            return None
+        if self._is_limit_reached(item, self._fetched_count, entries_count, after_date):
+            self._is_stopped_by_limit = True
+            return None
+        self._on_item_fetched(item)
+        return item
+
+    def iter_raw(self) -> Iterator[Any]:
+        """
+        Raw items of all pages, next page is fetched only when queue is drained
+        """
+        while True:
+            while self.q:
+                yield self.q.popleft()
+
+            if self._is_paging_ended():
+                return
+
+            self.fetch_next()
+            self.max_requests -= 1
+
+    def iter_items(
+        self,
+        fetch_all=False,
+        entries_count: int | None = None,
+        max_requests: int | None = None,
+        after_date: datetime.date | None = None,
+    ) -> Iterator[Item]:
+        """
+        Lazy version of `fetch_items`: items are yielded as soon as their page is parsed
+        """
+        after_date = self._setup_fetch_limits(fetch_all, entries_count, max_requests, after_date)
+
+        fetched: List[Item] = []
+        try:
+            for raw in self.iter_raw():
+                item = self._accept_item(raw, entries_count, after_date)
+                if self._is_stopped_by_limit:
+                    break
+                if item:
+                    fetched.append(item)
+                    yield item
+
+            yield from self._sync_with_store(fetched)[len(fetched) :]
+        finally:
             self.reset_fetch_fields()
-            raise StopIteration
 
-        # else:  # No left fetched posts in queue
-        if self.max_requests <= 0:
-            raise StopIteration
+    # @my_lru_cache
+    def fetch_items(
+        self,
+        fetch_all=False,
+        entries_count: int | None = None,
+        max_requests: int | None = None,
+        after_date: datetime.date | None = None,
+    ) -> Sequence[ItemClass]:  # type: ignore  # noqa
+        """
+        Base function to get new updates from given feed.
 
-        self.fetch_next()
-        self.max_requests -= 1
-        return self.__next()
+        When no params passed, set max_requests = 1,
+        to limit made requests count
+
+        :returns: list of fetched entries
+        """
+        return list(self.iter_items(fetch_all, entries_count, max_requests, after_date))
+
+    async def fetch_items_async(
+        self,
+        fetch_all=False,
+        entries_count: int | None = None,
+        max_requests: int | None = None,
+        after_date: datetime.date | None = None,
+    ) -> Sequence[ItemClass]:  # type: ignore  # noqa
+        """
+        Same as `fetch_items`, but pages are fetched with `fetch_next_async`,
+        so waiting for upstream does not block event loop
+        """
+
+        after_date = self._setup_fetch_limits(fetch_all, entries_count, max_requests, after_date)
+
+        res: List[Item] = []
+        try:
+            while not self._is_stopped_by_limit:
+                if not self.q:
+                    if self._is_paging_ended():
+                        break
+
+                    await self.fetch_next_async()
+                    self.max_requests -= 1
+                    continue
+
+                item = self._accept_item(self.q.popleft(), entries_count, after_date)
+                if item:
+                    res.append(item)
+
+            return self._sync_with_store(res)
+        finally:
+            self.reset_fetch_fields()
+
+    def is_iteration_ended(self):
+        pass
 
 
 class ApiItem:
@@ -0,0 +1,140 @@
+import datetime
+import email.utils
+import hashlib
+import json
+import time
+from typing import (
+    NamedTuple,
+    Sequence,
+)
+
+from src.base import (
+    Item,
+)
+from src.http_cache import (
+    CacheBackend,
+)
+from src.utils import (
+    DEFAULT_TZ,
+    HTTP_CACHE_EXPIRE_AFTER,
+    RUN_IDENTIFIER,
+    shared_cache,
+)
+
+
+class FeedValidators(NamedTuple):
+    etag: str
+    last_modified: datetime.datetime | None = None
+
+    def headers(self) -> dict[str, str]:
+        res = {"ETag": self.etag}
+        if self.last_modified:
+            res["Last-Modified"] = email.utils.format_datetime(
+                self.last_modified.astimezone(datetime.timezone.utc), usegmt=True
+            )
+        return res
+
+
+def feed_request_key(*params) -> str:
+    """Normalized representation of feed request params"""
+    return "|".join("" if i is None else str(getattr(i, "value", i)) for i in params)
+
+
+def make_feed_validators(request_key: str, items: Sequence[Item]) -> FeedValidators:
+    """
+    Validators derived from request params and fetched items
+    (newest and oldest item, as both ends of window may change), without rendering the feed
+    """
+    newest = items[0] if items else None
+    oldest = items[-1] if items else None
+
+    etag_base = "|".join(
+        str(i)
+        for i in (
+            RUN_IDENTIFIER,  # Part of feed title
+            request_key,
+            len(items),
+            newest.url if newest else None,
+            newest.pub_date if newest else None,
+            oldest.url if oldest else None,
+        )
+    )
+    etag = f'W/"{hashlib.sha1(etag_base.encode()).hexdigest()}"'
+
+    last_modified = max((i.pub_date for i in items if i.pub_date), default=None)
+    return FeedValidators(etag, last_modified.replace(microsecond=0) if last_modified else None)
+
+
+def _etag_value(s: str) -> str:
+    s = s.strip()
+    return s[2:] if s.startswith("W/") else s
+
+
+def is_not_modified(
+    validators: FeedValidators,
+    if_none_match: str | None = None,
+    if_modified_since: str | None = None,
+) -> bool:
+    """
+    Evaluate conditional request headers, If-None-Match takes precedence (RFC 9110, 13.2.2)
+    """
+    if if_none_match:
+        etag = _etag_value(validators.etag)
+        return any(i.strip() == "*" or _etag_value(i) == etag for i in if_none_match.split(","))
+
+    if if_modified_since and validators.last_modified:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=DEFAULT_TZ)
+        return validators.last_modified <= since
+
+    return False
+
+
+class FeedValidatorsCache:
+    """
+    Remembers validators of recently served feeds.
+    While upstream responses are cached anyway, matching conditional request
+    can be answered with 304 without fetching and rendering.
+    With `backend` given, validators are shared by worker processes.
+    """
+
+    def __init__(self, ttl: datetime.timedelta = HTTP_CACHE_EXPIRE_AFTER, backend: CacheBackend | None = None):
+        self.ttl = ttl.total_seconds()
+        self.backend = backend
+        self._data: dict[str, tuple[float, FeedValidators]] = {}
+
+    def get(self, request_key: str) -> FeedValidators | None:
+        if self.backend:
+            data = self.backend.get(f"validators:{request_key}")
+            if data is None:
+                return None
+            etag, last_modified = json.loads(data)
+            return FeedValidators(etag, datetime.datetime.fromisoformat(last_modified) if last_modified else None)
+
+        cached = self._data.get(request_key)
+        if not cached:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._data[request_key]
+            return None
+        return cached[1]
+
+    def put(self, request_key: str, validators: FeedValidators):
+        if self.backend:
+            last_modified = validators.last_modified.isoformat() if validators.last_modified else None
+            self.backend.set(
+                f"validators:{request_key}", json.dumps([validators.etag, last_modified]).encode(), self.ttl
+            )
+            return
+
+        now = time.monotonic()
+        for k in [k for k, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[k]
+        self._data[request_key] = (now + self.ttl, validators)
+
+
+feed_validators_cache = FeedValidatorsCache(backend=shared_cache)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+from typing import (
+    Iterable,
+    NamedTuple,
+)
+
+import httpx
+import magic
+
+from src.metrics import (
+    ENCLOSURE_PROBES,
+)
+from src.utils import (
+    SRC_PATH,
+    get_async_client,
+)
+
+ENCLOSURES_CACHE_PATH = os.getenv("ENCLOSURES_CACHE_PATH", os.path.join(SRC_PATH, "enclosures_cache.sqlite"))
+ENCLOSURES_CACHE_MAX_ENTRIES = int(os.getenv("ENCLOSURES_CACHE_MAX_ENTRIES", "100000"))
+ENCLOSURES_MAX_WORKERS = int(os.getenv("ENCLOSURES_MAX_WORKERS", "8"))
+ENCLOSURES_SNIFF_BYTES = 2048
+
+GENERIC_MIME_TYPES = {"application/octet-stream", "binary/octet-stream"}
+
+
+class EnclosureInfo(NamedTuple):
+    mime: str
+    length: int
+
+
+class EnclosuresCache:
+    """
+    Persistent url -> (mime, length) mapping, so media is probed only once.
+    Oldest entries are dropped when there are more than `max_entries`.
+    Shared by worker processes: WAL journal lets readers proceed while other process writes.
+    """
+
+    def __init__(self, path: str = ENCLOSURES_CACHE_PATH, max_entries: int = ENCLOSURES_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS enclosures (url TEXT PRIMARY KEY, mime TEXT, length INTEGER)")
+        self._conn.commit()
+
+    def get_many(self, urls: Iterable[str]) -> dict[str, EnclosureInfo]:
+        urls = list(urls)
+        res: dict[str, EnclosureInfo] = {}
+
+        with self._lock:
+            for i in range(0, len(urls), 500):  # Keep under sqlite variables limit
+                chunk = urls[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT url, mime, length FROM enclosures WHERE url IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                res.update({url: EnclosureInfo(mime, length) for url, mime, length in rows})
+        return res
+
+    def put(self, url: str, info: EnclosureInfo):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO enclosures VALUES (?, ?, ?)", (url, info.mime, info.length))
+            # Replaced rows get new rowid, so lowest ones are the oldest
+            self._conn.execute(
+                "DELETE FROM enclosures WHERE rowid <= (SELECT MAX(rowid) FROM enclosures) - ?", (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+enclosures_cache = EnclosuresCache()
+
+
+def _content_range_total(value: str | None) -> int | None:
+    # Example: "bytes 0-2047/146515"
+    match = re.search(r"/(\d+)$", value or "")
+    return int(match.group(1)) if match else None
+
+
+async def probe_enclosure(url: str, client: httpx.AsyncClient | None = None) -> EnclosureInfo | None:
+    """
+    Get media type and size without downloading the whole file:
+    HEAD request first, then small Range request if type or length are unknown
+    """
+    client = client or get_async_client()
+
+    try:
+        head = await client.head(url)
+        mime = head.headers.get("content-type", "").split(";")[0].strip()
+        length = head.headers.get("content-length")
+
+        if head.status_code == 200 and length and mime and mime not in GENERIC_MIME_TYPES:
+            ENCLOSURE_PROBES.inc(result="head")
+            return EnclosureInfo(mime, int(length))
+
+        # Body is streamed, as server may ignore Range header and send the whole file
+        async with client.stream("GET", url, headers={"Range": f"bytes=0-{ENCLOSURES_SNIFF_BYTES - 1}"}) as req:
+            if req.status_code == 206:
+                total = _content_range_total(req.headers.get("content-range"))
+            elif req.status_code == 200:  # Server ignored Range header
+                total = int(req.headers["content-length"]) if req.headers.get("content-length") else None
+            else:
+                total = None
+
+            if total is None:
+                ENCLOSURE_PROBES.inc(result="failed")
+                return None
+
+            content = b""
+            async for chunk in req.aiter_bytes():
+                content += chunk
+                if len(content) >= ENCLOSURES_SNIFF_BYTES:
+                    break
+    except httpx.HTTPError:
+        ENCLOSURE_PROBES.inc(result="failed")
+        return None
+
+    ENCLOSURE_PROBES.inc(result="range")
+    return EnclosureInfo(magic.from_buffer(content[:ENCLOSURES_SNIFF_BYTES], mime=True), total)
+
+
+async def probe_enclosures(
+    urls: Iterable[str],
+    max_workers: int = ENCLOSURES_MAX_WORKERS,
+    client: httpx.AsyncClient | None = None,
+) -> dict[str, EnclosureInfo]:
+    """
+    Probe all given media urls concurrently, at most `max_workers` at once.
+    Urls that failed to probe are absent in result.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    res = enclosures_cache.get_many(unique_urls)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def worker(url: str):
+        async with semaphore:
+            info = await probe_enclosure(url, client)
+
+        if info:
+            enclosures_cache.put(url, info)
+            res[url] = info
+
+    await asyncio.gather(*[worker(i) for i in unique_urls if i not in res])
+    return res
+
+
+def probe_enclosures_sync(urls: Iterable[str]) -> dict[str, EnclosureInfo]:
+    """
+    `probe_enclosures` for callers without running event loop.
+    Uses its own client, as pooled one is bound to the main loop.
+    """
+
+    async def inner():
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            return await probe_enclosures(urls, client=client)
+
+    return asyncio.run(inner())
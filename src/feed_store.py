@@ -0,0 +1,84 @@
+import hashlib
+import os
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+)
+
+from src.files import (
+    atomic_write,
+    evict_least_recently_used,
+)
+from src.utils import (
+    SRC_PATH,
+)
+
+FEED_STORE_PATH = os.getenv("FEED_STORE_PATH", os.path.join(SRC_PATH, "feeds"))
+FEED_STORE_MAX_BYTES = int(os.getenv("FEED_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class FeedStore:
+    """
+    Rendered feeds, stored under key derived from channel and normalized request params.
+
+    Files are written atomically (see `files.atomic_write`), so readers never see partially written feed.
+    Total size is bounded: least recently used files are evicted (see `files.evict_least_recently_used`).
+    """
+
+    def __init__(self, path: str = FEED_STORE_PATH, max_bytes: int = FEED_STORE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(*params) -> str:
+        return hashlib.sha256("|".join(str(getattr(i, "value", i)) for i in params).encode()).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.xml")
+
+    def open(self, key: str) -> BinaryIO | None:
+        """
+        :returns: Opened stored feed file, or None if it is not stored
+        """
+        path = self.path_for(key)
+        try:
+            f = open(path, "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:  # Evicted meanwhile, opened file is still readable
+            pass
+        return f
+
+    def write(self, key: str, chunks: Iterable[str]) -> str:
+        for _ in self.write_iter(key, chunks):
+            pass
+        return self.path_for(key)
+
+    def write_iter(self, key: str, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Pass chunks through, writing them to store.
+        File appears in store only if all chunks were consumed.
+        """
+        with atomic_write(self.path_for(key), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+
+        self.evict()
+
+    def evict(self):
+        evict_least_recently_used(self.path, self.max_bytes)
+
+
+def iter_file(f: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+feed_store = FeedStore()
@@ -0,0 +1,61 @@
+import contextlib
+import os
+import tempfile
+from typing import (
+    IO,
+    Any,
+    Iterator,
+)
+
+_TMP_SUFFIX = ".tmp"
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "wb", encoding: str | None = None) -> Iterator[IO[Any]]:
+    """
+    Write to temporary file in the same directory, and atomically rename it to `path` on success,
+    so readers (in any worker process) never see partially written file,
+    and already opened file stays readable even if replaced or evicted.
+    On error nothing is written.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=_TMP_SUFFIX)
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict_least_recently_used(path: str, max_bytes: int) -> tuple[int, int]:
+    """
+    Remove least recently used files of directory (file mtime is used as access time),
+    until their total size is within `max_bytes`. Files being written by `atomic_write` are skipped.
+
+    :returns: Count of removed files, and total size of remaining ones
+    """
+    entries = []
+    total = 0
+    with os.scandir(path) as it:
+        for i in it:
+            if not i.is_file() or i.name.endswith(_TMP_SUFFIX):
+                continue
+            try:
+                stat = i.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, i.path))
+            total += stat.st_size
+
+    evicted = 0
+    for _, size, file_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+            evicted += 1
+        except FileNotFoundError:  # Evicted by other worker
+            pass
+        total -= size
+    return evicted, total
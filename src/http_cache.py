@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import (
+    OrderedDict,
+)
+from typing import (
+    Any,
+    NamedTuple,
+)
+
+import httpx
+
+from src.files import (
+    atomic_write,
+    evict_least_recently_used,
+)
+from src.metrics import (
+    HTTP_CACHE_BYTES,
+    HTTP_CACHE_EVICTIONS,
+)
+
+# Headers not describing stored (already decoded) body
+_SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CachedResponse(NamedTuple):
+    url: str
+    status_code: int
+    headers: dict[str, str]
+    content: bytes
+
+    @classmethod
+    def from_response(cls, resp: Any) -> "CachedResponse":
+        """
+        :param resp: `requests` or `httpx` response
+        """
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in _SKIPPED_HEADERS}
+        return cls(str(resp.url), resp.status_code, headers, resp.content)
+
+    def encode(self) -> bytes:
+        meta = json.dumps({"url": self.url, "status_code": self.status_code, "headers": self.headers})
+        return meta.encode() + b"\n" + self.content
+
+    @classmethod
+    def decode(cls, data: bytes) -> "CachedResponse":
+        meta, content = data.split(b"\n", 1)
+        return cls(content=content, **json.loads(meta))
+
+    def to_httpx(self) -> httpx.Response:
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            request=httpx.Request("GET", self.url),
+        )
+
+
+class CacheBackend:
+    """
+    Bytes storage with per entry expiration and total size limited by `max_bytes`
+    (least recently used entries are evicted)
+    """
+
+    name = ""
+    report_metrics = True  # Off for backends storing not http responses
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def on_evicted(self, count: int, size: int):
+        """
+        :param size: Total size of entries left
+        """
+        if not self.report_metrics:
+            return
+        if count:
+            HTTP_CACHE_EVICTIONS.inc(count, backend=self.name)
+        HTTP_CACHE_BYTES.set(size, backend=self.name)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per process in-memory LRU
+    """
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            cached = self._data.get(key)
+            if not cached:
+                return None
+            if cached[0] <= time.monotonic():
+                self._size -= len(self._data.pop(key)[1])
+                return None
+            self._data.move_to_end(key)
+            return cached[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            if key in self._data:
+                self._size -= len(self._data.pop(key)[1])
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._size += len(value)
+
+            evicted = 0
+            while self._size > self.max_bytes and self._data:
+                self._size -= len(self._data.popitem(last=False)[1][1])
+                evicted += 1
+            size = self._size
+        self.on_evicted(evicted, size)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Persistent cache, shared by worker processes.
+    WAL journal lets readers proceed while other connection writes,
+    each thread uses its own connection.
+    """
+
+    name = "sqlite"
+    TOUCH_INTERVAL = 60  # Seconds, access time is updated not more often, so most reads don't write
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    expires REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    value BLOB NOT NULL
+                )
+                """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL is still consistent, commits skip fsync
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires, accessed FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+
+        if now - row[2] > self.TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        conn = self._conn()
+        now = time.time()
+
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, now + ttl, now, len(value), value),
+            )
+            evicted = conn.execute("DELETE FROM responses WHERE expires <= ?", (now,)).rowcount
+
+            size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if size > self.max_bytes:
+                victims = []
+                for victim_key, victim_size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if size <= self.max_bytes:
+                        break
+                    victims.append((victim_key,))
+                    size -= victim_size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                evicted += len(victims)
+        self.on_evicted(evicted, size)
+
+    def clear(self):
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Persistent cache, one atomically written file per entry, least recently used are evicted
+    (see `files.atomic_write`, `files.evict_least_recently_used`).
+    """
+
+    name = "filesystem"
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.path, f"{hashlib.sha256(key.encode()).hexdigest()}.cache")
+
+    def get(self, key: str) -> bytes | None:
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                expires, value = f.read().split(b"\n", 1)
+            if float(expires) <= time.time():
+                return None
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with atomic_write(self.path_for(key)) as f:
+            f.write(f"{time.time() + ttl}\n".encode())
+            f.write(value)
+        self.evict()
+
+    def evict(self):
+        evicted, total = evict_least_recently_used(self.path, self.max_bytes)
+        self.on_evicted(evicted, total)
+
+    def clear(self):
+        with os.scandir(self.path) as it:
+            for i in it:
+                if i.is_file():
+                    os.remove(i.path)
+
+
+def parse_ttl_rules(s: str) -> dict[str, float]:
+    """
+    :param s: Comma separated "<host>[/<path prefix>]=<seconds>",
+    e.g. "t.me=600,www.googleapis.com/youtube/v3/search=120"
+    """
+    res = {}
+    for rule in filter(None, (i.strip() for i in s.split(","))):
+        prefix, _, seconds = rule.rpartition("=")
+        res[prefix.strip()] = float(seconds)
+    return res
+
+
+class HttpCache:
+    """
+    Successful upstream responses, kept for TTL, chosen by longest matching "<host><path>" prefix
+    """
+
+    def __init__(self, backend: CacheBackend, default_ttl: float, ttl_rules: dict[str, float] | None = None):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        # Longest prefixes first
+        self.ttl_rules = sorted((ttl_rules or {}).items(), key=lambda i: len(i[0]), reverse=True)
+
+    @staticmethod
+    def key(url: str, params: dict | None = None) -> str:
+        """
+        :returns: Url with params merged into query (plain string ops, as api urls with long id lists are hot)
+        """
+        query = urllib.parse.urlencode({k: v for k, v in (params or {}).items() if v is not None})
+        if not query:
+            return url
+        return f"{url}{'&' if '?' in url else '?'}{query}"
+
+    def ttl_for(self, url: str) -> float:
+        parsed = urllib.parse.urlsplit(url)
+        target = f"{parsed.hostname}{parsed.path}"
+        return next((ttl for prefix, ttl in self.ttl_rules if target.startswith(prefix)), self.default_ttl)
+
+    def get(self, key: str) -> httpx.Response | None:
+        data = self.backend.get(key)
+        return CachedResponse.decode(data).to_httpx() if data is not None else None
+
+    def put(self, key: str, resp: Any):
+        """
+        :param resp: `requests` or `httpx` response, only successful ones are stored
+        """
+        if resp.status_code != 200:
+            return
+        ttl = self.ttl_for(key)
+        if ttl > 0:
+            self.backend.set(key, CachedResponse.from_response(resp).encode(), ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def make_backend(name: str, path: str, max_bytes: int, report_metrics: bool = True) -> CacheBackend:
+    """
+    :param name: "memory", "sqlite" or "filesystem"
+    :param path: Database file for "sqlite", directory for "filesystem"
+    :param report_metrics: Whether size and evictions are reported as http cache metrics
+    """
+    backend: CacheBackend
+    if name == "memory":
+        backend = MemoryCacheBackend(max_bytes)
+    elif name == "sqlite":
+        backend = SQLiteCacheBackend(path, max_bytes)
+    elif name == "filesystem":
+        backend = FileCacheBackend(path, max_bytes)
+    else:
+        raise Exception(f"Unknown cache backend: {name}")
+
+    backend.report_metrics = report_metrics
+    return backend
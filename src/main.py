@@ -1,6 +1,15 @@
+import asyncio
+import contextlib
 import datetime
 import functools
+from dataclasses import (
+    dataclass,
+)
 from typing import (
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
     Optional,
     Sequence,
 )
@@ -9,18 +18,62 @@ import fastapi
 import uvicorn
 from fastapi import (
     FastAPI,
+    Header,
     HTTPException,
+    Query,
+    Response,
+)
+from fastapi.concurrency import (
+    run_in_threadpool,
 )
 from fastapi.responses import (
-    FileResponse,
+    PlainTextResponse,
+    StreamingResponse,
 )
 
+from src.aggregate import (
+    AGGREGATE_MAX_CHANNELS,
+    AGGREGATE_MAX_CONCURRENCY,
+    ChannelsGroup,
+    merge_items,
+)
 from src.base import (
     ApiChannel,
     Item,
 )
+from src.conditional import (
+    FeedValidators,
+    feed_request_key,
+    feed_validators_cache,
+    is_not_modified,
+    make_feed_validators,
+)
+from src.enclosures import (
+    probe_enclosures,
+)
+from src.feed_store import (
+    FeedStore,
+    feed_store,
+    iter_file,
+)
+from src.metrics import (
+    FEED_ITEMS,
+    FEED_RESPONSES,
+    RENDER_SECONDS,
+    SERVED_BYTES,
+    registry,
+)
+from src.parsing import (
+    parse_pool,
+)
 from src.rss import (
-    channel_gen_rss,
+    stream_feed,
+)
+from src.scheduler import (
+    RefreshScheduler,
+)
+from src.singleflight import (
+    SingleFlight,
 )
 from src.tg_api import (
     TGApiChannel,
@@ -28,14 +81,247 @@ from src.tg_api import (
 from src.utils import (
     HTTP_HOST,
     HTTP_PORT,
+    HTTP_WORKERS,
     RssBridgeType,
     RssFormat,
+    close_async_client,
 )
 from src.yt_api import (
     YTApiChannel,
 )
 
-app = FastAPI()
+
+@dataclass(frozen=True)
+class FeedParams:
+    """
+    Normalized params of feed request, hashable to be used as scheduler key
+    """
+
+    username: str
+    bridge_type: RssBridgeType = RssBridgeType.TG
+    rss_format: Optional[RssFormat] = RssFormat.ATOM
+    count: int | None = None
+    requests: int | None = None
+    days: int | None = None
+    with_enclosures: bool | None = False
+
+    @property
+    def after_date(self) -> datetime.date | None:
+        return datetime.date.today() - datetime.timedelta(1) * self.days if self.days else None
+
+    @property
+    def request_key(self) -> str:
+        return feed_request_key(
+            self.username,
+            self.bridge_type,
+            self.rss_format,
+            self.count,
+            self.requests,
+            self.after_date,
+            self.with_enclosures,
+        )
+
+    @property
+    def fetch_key(self) -> str:
+        """Key of fetched items: requests differing only in rendering (format, enclosures) share them"""
+        return feed_request_key(self.username, self.bridge_type, self.count, self.requests, self.after_date)
+
+    @property
+    def channel_class(self) -> type[ApiChannel]:
+        if self.bridge_type is RssBridgeType.TG:
+            return TGApiChannel
+        if self.bridge_type is RssBridgeType.YT:
+            return YTApiChannel
+        raise HTTPException(
+            status_code=fastapi.status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="Unknown bridge_type",
+        )
+
+
+@dataclass(frozen=True)
+class AggregateParams:
+    """
+    Normalized params of aggregated feed request
+    """
+
+    channels: tuple[FeedParams, ...]  # Fetch params of each channel
+    rss_format: Optional[RssFormat] = RssFormat.ATOM
+    count: int | None = None
+    days: int | None = None
+    with_enclosures: bool | None = False
+
+    @classmethod
+    def from_specs(
+        cls,
+        channels_specs: Sequence[str],
+        rss_format: Optional[RssFormat] = RssFormat.ATOM,
+        count: int | None = None,
+        days: int | None = None,
+        with_enclosures: bool | None = False,
+    ) -> "AggregateParams":
+        """
+        :param channels_specs: "<bridge_type>:<username or link>" (e.g. "yt:UC..."), or telegram username or link
+        """
+        if not channels_specs or len(channels_specs) > AGGREGATE_MAX_CHANNELS:
+            raise HTTPException(
+                status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"From 1 to {AGGREGATE_MAX_CHANNELS} channels can be aggregated",
+            )
+
+        channels = []
+        for spec in dict.fromkeys(channels_specs):
+            prefix, sep, rest = spec.partition(":")
+            if prefix in {i.value for i in RssBridgeType}:
+                bridge, username = RssBridgeType(prefix), rest
+            elif not sep or rest.startswith("//"):  # Telegram username or link
+                bridge, username = RssBridgeType.TG, spec
+            else:
+                raise HTTPException(
+                    status_code=fastapi.status.HTTP_405_METHOD_NOT_ALLOWED,
+                    detail=f"Unknown bridge_type of channel: {spec}",
+                )
+            channels.append(FeedParams(username, bridge, count=count, days=days))
+
+        return cls(tuple(channels), rss_format=rss_format, count=count, days=days, with_enclosures=with_enclosures)
+
+    @property
+    def after_date(self) -> datetime.date | None:
+        return datetime.date.today() - datetime.timedelta(1) * self.days if self.days else None
+
+    @property
+    def request_key(self) -> str:
+        return feed_request_key(
+            "aggregate",
+            *(i.request_key for i in self.channels),
+            self.rss_format,
+            self.count,
+            self.after_date,
+            self.with_enclosures,
+        )
+
+    @property
+    def fetch_key(self) -> str:
+        return feed_request_key("aggregate", *(i.fetch_key for i in self.channels), self.count, self.after_date)
+
+    @property
+    def channel_classes(self) -> set[type[ApiChannel]]:
+        return {i.channel_class for i in self.channels}
+
+
+# Concurrent requests of the same items (in any format) share single fetch
+fetch_flight: SingleFlight[tuple[ApiChannel, Sequence[Item]]] = SingleFlight()
+
+
+def fetched_validators(params: FeedParams | AggregateParams, items: Sequence[Item]) -> FeedValidators:
+    """Validators depend on rendering params too, so they are derived per request from shared fetch result"""
+    validators = make_feed_validators(params.request_key, items)
+    feed_validators_cache.put(params.request_key, validators)
+    return validators
+
+
+async def fetch_feed(params: FeedParams) -> tuple[ApiChannel, Sequence[Item], FeedValidators]:
+    async def fetch():
+        channel = await params.channel_class.create(params.username)
+
+        items: Sequence[Item] = await channel.fetch_items_async(
+            entries_count=params.count,
+            max_requests=params.requests,
+            after_date=params.after_date,
+        )
+        FEED_ITEMS.observe(len(items), bridge_type=params.bridge_type)
+        return channel, items
+
+    channel, items = await fetch_flight.do(params.fetch_key, fetch)
+    return channel, items, fetched_validators(params, items)
+
+
+async def fetch_aggregate(params: AggregateParams) -> tuple[ApiChannel, Sequence[Item], FeedValidators]:
+    """
+    Fetch channels concurrently (at most AGGREGATE_MAX_CONCURRENCY at once) and merge their items
+    """
+    semaphore = asyncio.Semaphore(AGGREGATE_MAX_CONCURRENCY)
+
+    async def fetch_channel(channel_params: FeedParams):
+        async with semaphore:
+            return await fetch_feed(channel_params)
+
+    async def fetch():
+        results = await asyncio.gather(*[fetch_channel(i) for i in params.channels])
+
+        items = merge_items((i for _, i, _ in results), params.count, params.after_date)
+        return ChannelsGroup([i for i, _, _ in results]), items
+
+    channel, items = await fetch_flight.do(params.fetch_key, fetch)
+    return channel, items, fetched_validators(params, items)
+
+
+def feed_key(params: FeedParams | AggregateParams, validators: FeedValidators) -> str:
+    return FeedStore.key(params.request_key, validators.etag)
+
+
+async def render_feed(
+    params: FeedParams | AggregateParams,
+    channel: ApiChannel,
+    items: Sequence[Item],
+    validators: FeedValidators,
+):
+    """
+    :returns: Lazy iterator of feed chunks, see `stream_feed`
+    """
+    enclosures = None
+    if params.with_enclosures:
+        enclosures = await probe_enclosures(i.preview_media_url for i in items if i.preview_media_url)
+
+    chunks = stream_feed(
+        channel,
+        items,
+        rss_format=params.rss_format,
+        enclosures=enclosures,
+        updated=validators.last_modified,
+    )
+    return RENDER_SECONDS.time_iter(chunks, format=params.rss_format)
+
+
+async def refresh_feed(params: FeedParams | AggregateParams):
+    """
+    Fetch and pre-render feed, so next reader request is served from `feed_store`
+    """
+    if isinstance(params, AggregateParams):
+        channel, items, validators = await fetch_aggregate(params)
+    else:
+        channel, items, validators = await fetch_feed(params)
+
+    stored_feed = feed_store.open(feed_key(params, validators))
+    if stored_feed:
+        stored_feed.close()
+        return
+
+    chunks = await render_feed(params, channel, items, validators)
+    await run_in_threadpool(feed_store.write, feed_key(params, validators), chunks)
+
+
+def can_refresh(params: FeedParams | AggregateParams) -> bool:
+    """Background refresh must not spend upstream quota needed by reader requests"""
+    if isinstance(params, AggregateParams):
+        return all(i.can_refresh_in_background() for i in params.channel_classes)
+    return params.channel_class.can_refresh_in_background()
+
+
+refresh_scheduler: RefreshScheduler[FeedParams | AggregateParams] = RefreshScheduler(
+    refresh_feed, can_refresh=can_refresh
+)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI):
+    refresh_scheduler.start()
+    yield
+    await refresh_scheduler.stop()
+    await close_async_client()
+    parse_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 def raise_proper_http(func):
@@ -53,8 +339,51 @@ def raise_proper_http(func):
     return wrapper
 
 
+def feed_response(params: FeedParams | AggregateParams, chunks: Iterable, validators: FeedValidators):
+    return StreamingResponse(
+        SERVED_BYTES.size_iter(chunks, format=params.rss_format),
+        media_type="text/xml",
+        headers=validators.headers(),
+    )
+
+
+async def respond_feed(
+    params: FeedParams | AggregateParams,
+    fetch: Callable[[], Awaitable[tuple[ApiChannel, Sequence[Item], FeedValidators]]],
+    if_none_match: str | None = None,
+    if_modified_since: str | None = None,
+) -> Response:
+    # --- Recently fetched (or refreshed in background), no need to fetch again ---
+    known_validators = feed_validators_cache.get(params.request_key)
+    if known_validators:
+        if is_not_modified(known_validators, if_none_match, if_modified_since):
+            FEED_RESPONSES.inc(result="not_modified")
+            return Response(status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers=known_validators.headers())
+
+        stored_feed = feed_store.open(feed_key(params, known_validators))
+        if stored_feed:
+            FEED_RESPONSES.inc(result="stored")
+            return feed_response(params, iter_file(stored_feed), known_validators)
+
+    # Items are fetched in full before the first byte is sent: validators (and stored feed key) depend on all of them
+    channel, items, validators = await fetch()
+    if is_not_modified(validators, if_none_match, if_modified_since):
+        FEED_RESPONSES.inc(result="not_modified")
+        return Response(status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers=validators.headers())
+
+    stored_feed = feed_store.open(feed_key(params, validators))
+    if stored_feed:
+        FEED_RESPONSES.inc(result="stored")
+        return feed_response(params, iter_file(stored_feed), validators)
+
+    FEED_RESPONSES.inc(result="rendered")
+    # Sync iterator is consumed in threadpool, so serializing does not block event loop
+    chunks = await render_feed(params, channel, items, validators)
+    return feed_response(params, feed_store.write_iter(feed_key(params, validators), chunks), validators)
+
+
 # pylint: disable=too-many-arguments
-@app.get("/rss-feed/{username}", response_class=FileResponse)
+@app.get("/rss-feed/{username}", response_class=StreamingResponse)
 @raise_proper_http
 async def get_feed(
     username: str,
@@ -64,34 +393,57 @@ async def get_feed(
     requests: int | None = None,
     days: int | None = None,
     with_enclosures: bool | None = False,
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
 ):
-    channel_class: type[ApiChannel]
-    if bridge_type is RssBridgeType.TG:
-        channel_class = TGApiChannel
-    elif bridge_type is RssBridgeType.YT:
-        channel_class = YTApiChannel
-    else:
-        raise HTTPException(
-            status_code=fastapi.status.HTTP_405_METHOD_NOT_ALLOWED,
-            detail="Unknown bridge_type",
-        )
-
-    channel = channel_class(username)
+    params = FeedParams(username, bridge_type, rss_format, count, requests, days, with_enclosures)
+    response = await respond_feed(params, lambda: fetch_feed(params), if_none_match, if_modified_since)
+    refresh_scheduler.track(params)  # Only existing feeds are refreshed
+    return response
 
-    after_date = datetime.date.today() - datetime.timedelta(1) * days if days else None
-    items: Sequence[Item] = channel.fetch_items(entries_count=count, max_requests=requests, after_date=after_date)
 
-    path = channel_gen_rss(
-        channel=channel,
-        items=items,
+# pylint: disable=too-many-arguments
+@app.get("/rss-feed-aggregate", response_class=StreamingResponse)
+@raise_proper_http
+async def get_aggregated_feed(
+    channels: List[str] = Query(),
+    rss_format: Optional[RssFormat] = RssFormat.ATOM,
+    count: int | None = None,
+    days: int | None = None,
+    with_enclosures: bool | None = False,
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
+):
+    """
+    Single feed of several channels (possibly of different bridge types),
+    e.g. `?channels=durov&channels=yt:UC...&count=50`
+    """
+    params = AggregateParams.from_specs(
+        channels,
         rss_format=rss_format,
-        use_enclosures=with_enclosures,
+        count=count,
+        days=days,
+        with_enclosures=with_enclosures,
     )
+    response = await respond_feed(params, lambda: fetch_aggregate(params), if_none_match, if_modified_since)
+    refresh_scheduler.track(params)  # As a whole, so its stored feed is refreshed
+    return response
 
-    print(f"Generated RSS file: {path}")
 
-    return FileResponse(path=path, media_type="text/xml")
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in Prometheus text format
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app=app, host=HTTP_HOST, port=HTTP_PORT)
+    # Several workers are started by uvicorn only from import string.
+    # They share RUN_IDENTIFIER (through environment), upstream responses, rendered feeds, and `shared_cache`
+    uvicorn.run(
+        app="src.main:app" if HTTP_WORKERS > 1 else app,
+        host=HTTP_HOST,
+        port=HTTP_PORT,
+        workers=HTTP_WORKERS,
+    )
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+from collections import (
+    OrderedDict,
+)
+from typing import (
+    Any,
+)
+
+from src.http_cache import (
+    CacheBackend,
+)
+from src.utils import (
+    shared_cache,
+)
+
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", str(6 * 60 * 60)))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "1024"))
+
+
+class MetadataCache:
+    """
+    Recently fetched channels metadata (title, logo, description, ...),
+    so channel construction does not cost upstream request.
+    Entries expire after `ttl` seconds, least recently used are evicted above `max_entries`.
+
+    If `backend` is given, entries are kept there instead (JSON encoded, under `namespace` prefixed keys),
+    so they are shared by worker processes. Its size limit applies instead of `max_entries` then.
+    """
+
+    def __init__(
+        self,
+        ttl: float = METADATA_CACHE_TTL,
+        max_entries: int = METADATA_CACHE_MAX_ENTRIES,
+        backend: CacheBackend | None = None,
+        namespace: str = "metadata",
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self.namespace = namespace
+        self._data: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        if self.backend:
+            data = self.backend.get(f"{self.namespace}:{key}")
+            return json.loads(data) if data is not None else None
+
+        cached = self._data.get(key)
+        if not cached:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return cached[1]
+
+    def put(self, key: str, fields: dict[str, Any]):
+        if self.backend:
+            self.backend.set(f"{self.namespace}:{key}", json.dumps(fields).encode(), self.ttl)
+            return
+
+        self._data[key] = (time.monotonic() + self.ttl, fields)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+metadata_cache = MetadataCache(backend=shared_cache)
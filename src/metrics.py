@@ -0,0 +1,228 @@
+import bisect
+import functools
+import threading
+import time
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(8))  # 1KiB .. 16MiB
+
+LabelValues = tuple[str, ...]
+
+
+def _labels_text(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(s: str) -> str:
+    return s.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _number(x: float) -> str:
+    if x == float("inf"):
+        return "+Inf"
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()  # Observed from event loop and threadpool
+
+    def _values(self, labels: dict[str, object]) -> LabelValues:
+        return tuple(str(getattr(v, "value", v)) for v in (labels.get(i, "") for i in self.labels))
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n"
+        return header + "".join(f"{i}\n" for i in self.samples())
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._data: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._values(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._data.get(self._values(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            data = list(self._data.items())
+        for values, count in data:
+            yield f"{self.name}{_labels_text(self.labels, values)} {_number(count)}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._values(labels)
+        with self._lock:
+            self._data[key] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._data: dict[LabelValues, tuple[list[int], list[float]]] = {}  # Bucket counts, [sum]
+
+    def observe(self, value: float, **labels):
+        key = self._values(labels)
+        with self._lock:
+            counts, total = self._data.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        data = self._data.get(self._values(labels))
+        return sum(data[0]) if data else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            data = [(k, list(counts), total[0]) for k, (counts, total) in self._data.items()]
+        for values, counts, total in data:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels_text(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels_text(self.labels, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels_text(self.labels, values)} {cumulative}"
+
+    def time(self, **labels) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorator, observing duration of each call"""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+
+            return wrapper
+
+        return decorator
+
+    def time_iter(self, chunks: Iterable[T], **labels) -> Iterator[T]:
+        """
+        Pass chunks through, observing total time spent producing them
+        (time consumer spends between chunks is not counted)
+        """
+        spent = 0.0
+        it = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(it)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - start
+            yield chunk
+        self.observe(spent, **labels)
+
+    def size_iter(self, chunks: Iterable[T], **labels) -> Iterator[T]:
+        """Pass chunks (str or bytes) through, observing total size once all are consumed"""
+        size = 0
+        for chunk in chunks:
+            size += len(chunk.encode() if isinstance(chunk, str) else chunk)  # type: ignore
+            yield chunk
+        self.observe(size, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        return "".join(i.render() for i in self.metrics)
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labels))  # type: ignore
+
+
+def gauge(name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labels))  # type: ignore
+
+
+def histogram(name: str, documentation: str, labels: tuple[str, ...] = (), **kwargs) -> Histogram:
+    return registry.register(Histogram(name, documentation, labels, **kwargs))  # type: ignore
+
+
+UPSTREAM_REQUEST_SECONDS = histogram(
+    "rss_bridge_upstream_request_seconds", "Latency of requests to upstream, not served by cache", ("host",)
+)
+UPSTREAM_RESPONSES = counter(
+    "rss_bridge_upstream_responses_total", "Upstream responses by status code", ("host", "status")
+)
+HTTP_CACHE_REQUESTS = counter(
+    "rss_bridge_http_cache_requests_total", "Upstream requests served by http cache (hit) or not (miss)", ("result",)
+)
+HTTP_CACHE_EVICTIONS = counter(
+    "rss_bridge_http_cache_evictions_total", "Http cache entries evicted to keep size limit", ("backend",)
+)
+HTTP_CACHE_BYTES = gauge("rss_bridge_http_cache_bytes", "Size of http cache entries", ("backend",))
+PARSE_PAGE_SECONDS = histogram("rss_bridge_parse_page_seconds", "Time to parse single t.me page", ("parser",))
+FEED_ITEMS = histogram(
+    "rss_bridge_feed_items", "Items fetched per feed request", ("bridge_type",), buckets=COUNT_BUCKETS
+)
+RENDER_SECONDS = histogram("rss_bridge_render_seconds", "Time to render feed", ("format",))
+SERVED_BYTES = histogram("rss_bridge_served_bytes", "Size of served feed", ("format",), buckets=SIZE_BUCKETS)
+FEED_RESPONSES = counter(
+    "rss_bridge_feed_responses_total",
+    "Feed responses by how they were produced: not_modified, stored (pre-rendered) or rendered",
+    ("result",),
+)
+ENCLOSURE_PROBES = counter(
+    "rss_bridge_enclosure_probes_total", "Media probed for enclosure type and size, by request used", ("result",)
+)
+FEED_REFRESHES = counter(
+    "rss_bridge_feed_refreshes_total", "Background feed refreshes by result: done, failed or skipped", ("result",)
+)
+TG_PAGE_RETRIES = counter(
+    "rss_bridge_tg_page_retries_total", "Telegram pages fetched again, as they came without link to other messages"
+)
+YT_QUOTA_DEGRADED_FETCHES = counter(
+    "rss_bridge_yt_quota_degraded_fetches_total",
+    "Youtube channel fetches cut short by spent api quota and served from stored items, by rejected endpoint",
+    ("endpoint",),
+)
@@ -1,22 +1,104 @@
+import asyncio
 import datetime
-import functools
+import multiprocessing
 import re
+import time
+from concurrent.futures import (
+    ProcessPoolExecutor,
+)
+from html.parser import (
+    HTMLParser,
+)
 from typing import (
+    Any,
+    Callable,
+    Iterable,
     NamedTuple,
 )
 
 import bs4
 
+from src.metrics import (
+    PARSE_PAGE_SECONDS,
+)
 from src.utils import (
     DEFAULT_TZ,
+    TG_HTML_PARSER,
+    TG_PARSE_WORKERS,
     make_sure,
 )
 
+PREVIEW_IMAGE_CLASSES = [
+    "link_preview_right_image",
+    "link_preview_image",
+    "link_preview_video_thumb",
+]
+PREVIEW_IMAGE_STYLE_RE = re.compile(r"background-image:url\('(.*)'\)")
+
+
+# Class -> tag name of elements needed to build post fields ("*" for any tag).
+# All of them are looked up in a single walk over message wrapper, see `find_post_tags`
+POST_TAG_CLASSES: dict[str, str] = {
+    "tgme_widget_message_date": "a",
+    "tgme_widget_message_text": "div",
+    "tgme_widget_message_link_preview": "a",
+    **{i: "i" for i in PREVIEW_IMAGE_CLASSES},
+    "link_preview_title": "*",
+    "link_preview_description": "*",
+}
+
+
+def find_post_tags(
+    elements: Iterable,
+    get_name: Callable[[Any], str],
+    get_classes: Callable[[Any], Iterable[str]],
+) -> dict[str, Any]:
+    """
+    :param elements: Descendants of message wrapper in document order
+    :returns: First element for each class of POST_TAG_CLASSES found
+    """
+    found: dict[str, Any] = {}
+
+    for element in elements:
+        for class_name in get_classes(element):
+            tag_name = POST_TAG_CLASSES.get(class_name)
+            if tag_name and class_name not in found and (tag_name == "*" or tag_name == get_name(element)):
+                found[class_name] = element
+
+        if len(found) == len(POST_TAG_CLASSES):
+            break
+
+    return found
+
+
+def find_preview_image(tags: dict[str, Any]) -> Any:
+    """Preview image tag, preferring classes in PREVIEW_IMAGE_CLASSES order"""
+    return next((tags[i] for i in PREVIEW_IMAGE_CLASSES if i in tags), None)
+
+
+def parse_preview_image_style(style: str | None) -> str | None:
+    return PREVIEW_IMAGE_STYLE_RE.findall(style)[0] if style else None
 
-def derive_post_datetime(post_element: bs4.Tag) -> datetime.datetime | None:
-    post_date_parent_tag = post_element.findChild(name="a", attrs={"class": "tgme_widget_message_date"})
-    post_date_parent_tag = make_sure(post_date_parent_tag, bs4.Tag)
 
+def parse_post_id(data_post: str | None) -> int | None:
+    """
+    :param data_post: Message wrapper "data-post" attr, "<channel>/<message id>"
+    """
+    if not data_post:
+        return None
+    _, _, post_id = data_post.rpartition("/")
+    return int(post_id) if post_id.isdigit() else None
+
+
+def is_inside(element: Any, ancestor: Any, get_parent: Callable[[Any], Any]) -> bool:
+    while element is not None:
+        if element is ancestor:
+            return True
+        element = get_parent(element)
+    return False
+
+
+def derive_post_datetime(post_date_parent_tag: bs4.Tag | None) -> datetime.datetime | None:
     if not post_date_parent_tag:
         return None
 
@@ -37,24 +119,14 @@ def derive_post_datetime(post_element: bs4.Tag) -> datetime.datetime | None:
     return post_date
 
 
-def derive_post_url(post_element: bs4.Tag):
-    post_date_parent_tag = post_element.findChild(name="a", attrs={"class": "tgme_widget_message_date"})
-    post_date_parent_tag = make_sure(post_date_parent_tag, bs4.Tag)
-
-    if post_date_parent_tag:
-        post_href = post_date_parent_tag.get("href")
-        post_href = make_sure(post_href, str)
-    else:
-        post_href = None
-
-    return post_href
-
+def derive_post_url(post_date_parent_tag: bs4.Tag | None) -> str | None:
+    if post_date_parent_tag is None:
+        return None
+    return make_sure(post_date_parent_tag.get("href"), str)
 
-def derive_post_text(post_element: bs4.Tag) -> tuple[str, str] | None:
-    text_wrapper = post_element.findChild(name="div", attrs={"class": "tgme_widget_message_text"})
-    text_wrapper = make_sure(text_wrapper, bs4.PageElement)  # type: ignore
 
-    if not text_wrapper:
+def derive_post_text(text_wrapper: bs4.Tag | None) -> tuple[str, str] | None:
+    if text_wrapper is None:
         return None
 
     html_text = str(text_wrapper)
@@ -62,6 +134,27 @@ def derive_post_text(post_element: bs4.Tag) -> tuple[str, str] | None:
     return text, html_text
 
 
+class _TextCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.strings: list[str] = []
+
+    def handle_data(self, data: str):
+        data = data.strip()
+        if data:
+            self.strings.append(data)
+
+
+def html_to_text(html_text: str) -> str:
+    """
+    Same as `bs4_tag.get_text("\\n", strip=True)` of parsed `html_text`, without building a tree
+    """
+    collector = _TextCollector()
+    collector.feed(html_text)
+    collector.close()
+    return "\n".join(collector.strings)
+
+
 class PreviewAttrs(NamedTuple):
     url: str | None = None
     media_url: str | None = None
@@ -69,46 +162,348 @@ class PreviewAttrs(NamedTuple):
     title: str | None = None
 
 
-def derive_preview_attrs(post_element: bs4.Tag) -> PreviewAttrs:
-    link_preview_wrapper = post_element.findChild(name="a", attrs={"class": "tgme_widget_message_link_preview"})
-    link_preview_wrapper = make_sure(link_preview_wrapper, bs4.Tag)
+def derive_preview_attrs(tags: dict[str, bs4.Tag]) -> PreviewAttrs:
+    """
+    :param tags: Result of `find_post_tags` for message wrapper
+    """
+    link_preview_wrapper = tags.get("tgme_widget_message_link_preview")
 
-    if not link_preview_wrapper:
+    if link_preview_wrapper is None:
         return PreviewAttrs()
 
-    link_preview_url = link_preview_wrapper.get("href")
-    link_preview_url = make_sure(link_preview_url, str)
+    link_preview_url = make_sure(link_preview_wrapper.get("href"), str)
 
     # --- Trying to match different types of message preview
-    possible_image_tag_class = [
-        "link_preview_right_image",
-        "link_preview_image",
-        "link_preview_video_thumb",
-    ]
-    link_preview_img_tag_list = [post_element.findChild(name="i", attrs={"class": i}) for i in possible_image_tag_class]
-    # ---
-
-    link_preview_img_tag = functools.reduce(lambda a, b: a or b, link_preview_img_tag_list)
-    link_preview_img_tag = make_sure(link_preview_img_tag, bs4.Tag)
-
-    if link_preview_img_tag:
-        link_preview_img_tag_style = link_preview_img_tag.get("style")
-        link_preview_img_tag_style = make_sure(link_preview_img_tag_style, str)
-    else:
-        link_preview_img_tag_style = None
-
-    if link_preview_img_tag_style:
-        r = r"background-image:url\('(.*)'\)"
-        link_preview_img = re.findall(r, link_preview_img_tag_style)[0]
-    else:
-        link_preview_img = None
-
-    link_preview_title = str(link_preview_wrapper.find(attrs={"class": "link_preview_title"}))
-    link_preview_desc: str = str(link_preview_wrapper.find(attrs={"class": "link_preview_description"}))
+    link_preview_img_tag = find_preview_image(tags)
+    link_preview_img_tag_style = make_sure(link_preview_img_tag.get("style"), str) if link_preview_img_tag else None
+
+    def inside_preview(class_name: str) -> bs4.Tag | None:
+        tag = tags.get(class_name)
+        return tag if tag is not None and is_inside(tag, link_preview_wrapper, lambda i: i.parent) else None
 
     return PreviewAttrs(
         url=link_preview_url,
-        media_url=link_preview_img,
-        desc=link_preview_desc,
-        title=link_preview_title,
+        media_url=parse_preview_image_style(link_preview_img_tag_style),
+        desc=str(inside_preview("link_preview_description")),
+        title=str(inside_preview("link_preview_title")),
     )
+
+
+class PostFields(NamedTuple):
+    """
+    Fields of single TG channel message, independent of html parser used
+    """
+
+    url: str | None
+    pub_date: datetime.datetime | None
+    text: str
+    html: str
+    preview: PreviewAttrs
+
+
+class ChannelMetadata(NamedTuple):
+    title: str
+    logo_url: str | None
+    description: str
+
+
+class RawPost(NamedTuple):
+    """
+    Compact record of single message wrapper, holds no references to page tree
+    """
+
+    post_id: int | None
+    fields: PostFields | None  # None if post has no text
+
+
+class ParsedPage(NamedTuple):
+    posts: list[RawPost]  # Ordered as on page (oldest first)
+    has_more_tag: bool = False
+    next_page_href: str | None = None  # None if end of channel posts reached
+    metadata: ChannelMetadata | None = None  # None if page is not channel page
+    parse_seconds: float = 0.0  # Set if parsed in `ParsePool` worker, to be observed in parent process
+
+
+class TGPageParser:
+    """
+    Interface of html parsing backend for t.me/s/<channel> pages
+    """
+
+    name: str
+
+    def parse_page(self, html: str) -> ParsedPage:
+        """
+        Message wrappers are converted to `RawPost` records right away, so page tree can be freed after parsing
+        """
+        raise NotImplementedError
+
+    def raw_post(self, post_element: Any) -> RawPost:
+        return RawPost(self.post_id(post_element), self.extract_post(post_element))
+
+    def parse_metadata(self, html: str) -> ChannelMetadata | None:
+        raise NotImplementedError
+
+    def extract_post(self, post_element: Any) -> PostFields | None:
+        """:returns: None if post has no text"""
+        raise NotImplementedError
+
+    def post_id(self, post_element: Any) -> int | None:
+        """:returns: Channel message id of post"""
+        raise NotImplementedError
+
+
+class BS4PageParser(TGPageParser):
+    """
+    Pure python backend (bs4 with builtin html.parser)
+    """
+
+    name = "bs4"
+
+    @PARSE_PAGE_SECONDS.time(parser="bs4")
+    def parse_page(self, html: str) -> ParsedPage:
+        soup = bs4.BeautifulSoup(html, "html.parser")
+        metadata = self._metadata(soup)
+
+        # --- Get list of posts wrappers
+        posts_list = soup.findChildren(name="div", attrs={"class": "tgme_widget_message_wrap"}, recursive=True)
+        posts = [self.raw_post(i) for i in posts_list]
+
+        # --- Next messages page href parsing
+        messages_more_tag = soup.find(name="a", attrs={"class": "tme_messages_more"}, recursive=True)
+
+        has_more_tag = isinstance(messages_more_tag, bs4.Tag)
+        next_page_href = None
+        if isinstance(messages_more_tag, bs4.Tag) and not messages_more_tag.get("data-after"):  # Not end of posts
+            next_page_href = make_sure(messages_more_tag.get("href"), str)
+
+        # Break reference cycles, so tree is freed without waiting for gc.
+        # Top level children go first, as decompose of soup alone leaves most of the tree linked
+        for i in list(soup.contents):
+            if isinstance(i, bs4.Tag):
+                i.decompose()
+        soup.decompose()  # Parser state (builder, current tag, last string)
+        return ParsedPage(posts, has_more_tag=has_more_tag, next_page_href=next_page_href, metadata=metadata)
+
+    def parse_metadata(self, html: str) -> ChannelMetadata | None:
+        return self._metadata(bs4.BeautifulSoup(html, "html.parser"))
+
+    @staticmethod
+    def _metadata(soup: bs4.BeautifulSoup) -> ChannelMetadata | None:
+        channel_metadata_wrapper = make_sure(
+            soup.find(name="div", attrs={"class": "tgme_channel_info_header"}, recursive=True), bs4.Tag
+        )
+        if channel_metadata_wrapper is None:
+            return None
+
+        title_tag = make_sure(channel_metadata_wrapper.findChild(name="span"), bs4.Tag)
+        channel_title = title_tag.contents[0] if title_tag else ""
+
+        channel_img_tag = make_sure(channel_metadata_wrapper.findChild(name="img", recursive=True), bs4.Tag)
+        channel_img_url = make_sure(channel_img_tag.get("src"), str) if channel_img_tag else None
+
+        desc_tag = make_sure(
+            soup.findChild(name="div", attrs={"class": "tgme_channel_info_description"}, recursive=True), bs4.Tag
+        )
+        channel_desc = desc_tag.contents[0] if desc_tag and desc_tag.contents else ""
+
+        return ChannelMetadata(str(channel_title), channel_img_url, str(channel_desc))
+
+    def post_id(self, post_element: bs4.Tag) -> int | None:
+        message = post_element.find(attrs={"data-post": True})
+        return parse_post_id(make_sure(message.get("data-post"), str)) if isinstance(message, bs4.Tag) else None
+
+    def extract_post(self, post_element: bs4.Tag) -> PostFields | None:
+        tags = find_post_tags(
+            (i for i in post_element.descendants if isinstance(i, bs4.Tag)),
+            lambda i: i.name,
+            lambda i: i.get("class") or (),
+        )
+
+        text_attrs = derive_post_text(tags.get("tgme_widget_message_text"))
+        if text_attrs is None:
+            return None
+
+        post_date_parent_tag = tags.get("tgme_widget_message_date")
+
+        return PostFields(
+            url=derive_post_url(post_date_parent_tag),
+            pub_date=derive_post_datetime(post_date_parent_tag),
+            text=text_attrs[0],
+            html=text_attrs[1],
+            preview=derive_preview_attrs(tags),
+        )
+
+
+def _has_class_xpath(tag: str, class_name: str) -> str:
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+class LxmlPageParser(TGPageParser):
+    """
+    C parser backend, several times faster than bs4.
+    Produces same fields as BS4PageParser (html content is serialized in the same xhtml-like way)
+    """
+
+    name = "lxml"
+
+    def __init__(self):
+        # pylint: disable=import-outside-toplevel
+        import lxml.etree  # type: ignore  # noqa
+        import lxml.html  # type: ignore  # noqa
+
+        self._etree = lxml.etree
+        self._html = lxml.html
+
+        xpath = lxml.etree.XPath
+        self._posts = xpath(_has_class_xpath("div", "tgme_widget_message_wrap"))
+        self._more = xpath(_has_class_xpath("a", "tme_messages_more"))
+        self._metadata_header = xpath(_has_class_xpath("div", "tgme_channel_info_header"))
+        self._metadata_desc = xpath(_has_class_xpath("div", "tgme_channel_info_description"))
+
+    def _tostring(self, element) -> str:
+        return self._etree.tostring(element, encoding=str, method="xml", with_tail=False)
+
+    def _first_content(self, element) -> str:
+        """Same as str(bs4_tag.contents[0])"""
+        if element.text:
+            return element.text
+        children = list(element)
+        return self._tostring(children[0]) if children else ""
+
+    @PARSE_PAGE_SECONDS.time(parser="lxml")
+    def parse_page(self, html: str) -> ParsedPage:
+        root = self._html.fromstring(html)
+        posts = [self.raw_post(i) for i in self._posts(root)]
+        metadata = self._metadata(root)
+
+        more_tags = self._more(root)
+        next_page_href = more_tags[0].get("href") if more_tags and not more_tags[0].get("data-after") else None
+        return ParsedPage(posts, has_more_tag=bool(more_tags), next_page_href=next_page_href, metadata=metadata)
+
+    def parse_metadata(self, html: str) -> ChannelMetadata | None:
+        return self._metadata(self._html.fromstring(html))
+
+    def _metadata(self, root) -> ChannelMetadata | None:
+        headers = self._metadata_header(root)
+        if not headers:
+            return None
+
+        title_tag = next(headers[0].iter("span"), None)
+        title = self._first_content(title_tag) if title_tag is not None else ""
+
+        img_tag = next(headers[0].iter("img"), None)  # Channels without avatar have none
+        img_url = img_tag.get("src") if img_tag is not None else None
+
+        desc_tags = self._metadata_desc(root)
+        desc = self._first_content(desc_tags[0]) if desc_tags else ""
+
+        return ChannelMetadata(title, img_url, desc)
+
+    def post_id(self, post_element) -> int | None:
+        message = next(post_element.iterfind(".//*[@data-post]"), None)
+        return parse_post_id(message.get("data-post")) if message is not None else None
+
+    def extract_post(self, post_element) -> PostFields | None:
+        tags = find_post_tags(
+            post_element.iterdescendants(self._etree.Element),
+            lambda i: i.tag,
+            lambda i: (i.get("class") or "").split(),
+        )
+
+        text_wrapper = tags.get("tgme_widget_message_text")
+        if text_wrapper is None:
+            return None
+
+        text = "\n".join(s for s in (i.strip() for i in text_wrapper.itertext()) if s)
+
+        pub_date = None
+        post_url = None
+        date_tag = tags.get("tgme_widget_message_date")
+        if date_tag is not None:
+            post_url = date_tag.get("href")
+
+            children = list(date_tag)
+            if not date_tag.text and children and children[0].get("datetime"):
+                pub_date = datetime.datetime.fromisoformat(children[0].get("datetime")).replace(tzinfo=DEFAULT_TZ)
+
+        return PostFields(
+            url=post_url,
+            pub_date=pub_date,
+            text=text,
+            html=self._tostring(text_wrapper),
+            preview=self._extract_preview(tags),
+        )
+
+    def _extract_preview(self, tags: dict[str, Any]) -> PreviewAttrs:
+        preview = tags.get("tgme_widget_message_link_preview")
+        if preview is None:
+            return PreviewAttrs()
+
+        image_tag = find_preview_image(tags)
+
+        def inside_preview(class_name: str) -> str:
+            tag = tags.get(class_name)
+            if tag is None or not is_inside(tag, preview, lambda i: i.getparent()):
+                return str(None)
+            return self._tostring(tag)
+
+        return PreviewAttrs(
+            url=preview.get("href"),
+            media_url=parse_preview_image_style(image_tag.get("style") if image_tag is not None else None),
+            title=inside_preview("link_preview_title"),
+            desc=inside_preview("link_preview_description"),
+        )
+
+
+def get_page_parser(name: str = TG_HTML_PARSER) -> TGPageParser:
+    """
+    :param name: "lxml" or "bs4", falls back to "bs4" if lxml is not installed
+    """
+    if name == LxmlPageParser.name:
+        try:
+            return LxmlPageParser()
+        except ImportError:
+            print("lxml is not installed, using bs4 html parser")
+    return BS4PageParser()
+
+
+page_parser = get_page_parser()
+
+
+def _parse_page_in_worker(html: str) -> ParsedPage:
+    start = time.perf_counter()
+    page = page_parser.parse_page(html)
+    return page._replace(parse_seconds=time.perf_counter() - start)
+
+
+class ParsePool:
+    """
+    Optional process pool for pages parsing, which is CPU bound and holds GIL:
+    pages of large channels are parsed on all cores, while next pages are still being fetched.
+    Parsed pages hold only `RawPost` records, so they are passed back by pickling.
+    Parser processes are started on first use, pages are parsed in calling thread if `workers` is 0.
+    Metrics recorded in worker processes are not exported, so parse time is passed back with page.
+    """
+
+    def __init__(self, workers: int = TG_PARSE_WORKERS):
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def parse_page(self, html: str) -> ParsedPage:
+        if not self.workers:
+            return page_parser.parse_page(html)
+
+        if self._executor is None:
+            # Not forked, as parent process runs event loop and threadpool
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        page = await asyncio.get_running_loop().run_in_executor(self._executor, _parse_page_in_worker, html)
+        PARSE_PAGE_SECONDS.observe(page.parse_seconds, parser=page_parser.name)
+        return page
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+parse_pool = ParsePool()
@@ -1,114 +1,237 @@
-import os
-import random
+import datetime
+import email.utils
+import re
 from typing import (
+    Iterable,
+    Iterator,
+    Mapping,
     Sequence,
 )
-
-import magic
-from feedgen.feed import (  # type: ignore  # noqa
-    FeedGenerator,
+from xml.sax.saxutils import (
+    escape,
+    quoteattr,
 )
 
+from src.aggregate import (
+    ChannelsGroup,
+)
 from src.base import (
     ApiChannel,
     Item,
 )
+from src.enclosures import (
+    EnclosureInfo,
+    probe_enclosures_sync,
+)
+from src.feed_store import (
+    FeedStore,
+    feed_store,
+)
 from src.tg_api import (
     TGApiChannel,
 )
 from src.utils import (
     DEFAULT_RSS_FORMAT,
     RUN_IDENTIFIER,
-    SRC_PATH,
     TG_RSS_USE_HTML,
     RssFormat,
-    logged_get,
 )
 from src.yt_api import (
     YTApiChannel,
 )
 
+GENERATOR_NAME = "rss-bridge-python"
 
-# pylint: disable=too-many-locals, too-many-branches, too-many-statements
-def channel_gen_rss(
-    channel: ApiChannel,
-    items: Sequence[Item],
-    rss_format: RssFormat | None = DEFAULT_RSS_FORMAT,
-    use_enclosures: bool | None = False,
-):
-    channel_username = channel.username if channel.username else "unknown" + str(random.randint(0, 1000))
+# Chars not allowed in XML 1.0 documents
+_INVALID_XML_CHARS_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _text(s: str | None) -> str:
+    return escape(_INVALID_XML_CHARS_RE.sub("", s or ""))
+
+
+def _attr(s: str | None) -> str:
+    return quoteattr(_INVALID_XML_CHARS_RE.sub("", s or ""))
+
+
+def _atom_date(d: datetime.datetime) -> str:
+    return d.isoformat()
 
+
+def _rss_date(d: datetime.datetime) -> str:
+    return email.utils.format_datetime(d.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def feed_title(channel: ApiChannel, channel_username: str) -> str:
     title_indent_size = 22
     title_indent_string = " " * (title_indent_size - (min(title_indent_size, len(channel_username))))
     if isinstance(channel, TGApiChannel):
         title_prefix = "TELEGRAM"
     elif isinstance(channel, YTApiChannel):
         title_prefix = "YOUTUBE"
+    elif isinstance(channel, ChannelsGroup):
+        title_prefix = "AGGREGATE"
     else:
         raise Exception("Unknown channel class")
 
-    feed_title = f"{title_prefix} {RUN_IDENTIFIER} | {channel_username}{title_indent_string}| {channel.full_name}"
+    return f"{title_prefix} {RUN_IDENTIFIER} | {channel_username}{title_indent_string}| {channel.full_name}"
+
+
+def item_content(i: Item) -> tuple[str, str]:
+    """
+    Items without content (e.g. videos with empty description) get empty text,
+    as feed is streamed and response status is already sent when item is serialized
+
+    :returns: (content, atom content type)
+    """
+    if i.html_content and TG_RSS_USE_HTML:
+        return i.html_content, "html"
+    return i.text_content or "", "text"
+
+
+def _atom_entry(i: Item, enclosure: EnclosureInfo | None) -> str:
+    content, content_type = item_content(i)
+
+    res = "  <entry>\n"
+    res += f"    <id>{_text(i.url)}</id>\n"
+    res += f"    <title>{_text(i.title)}</title>\n"
+    if i.pub_date:
+        res += f"    <updated>{_atom_date(i.pub_date)}</updated>\n"
+        res += f"    <published>{_atom_date(i.pub_date)}</published>\n"
+    res += f"    <content type={_attr(content_type)}>{_text(content)}</content>\n"
+    res += f"    <link href={_attr(i.url)}/>\n"
+    if enclosure:
+        res += (
+            f'    <link href={_attr(i.preview_media_url)} rel="enclosure" '
+            f'type={_attr(enclosure.mime)} length="{enclosure.length}"/>\n'
+        )
+    return res + "  </entry>\n"
+
+
+def _rss_item(i: Item, enclosure: EnclosureInfo | None) -> str:
+    content, content_type = item_content(i)
+
+    res = (
+        "    <item>\n"
+        f"      <title>{_text(i.title)}</title>\n"
+        f"      <link>{_text(i.url)}</link>\n"
+        f'      <guid isPermaLink="false">{_text(i.url)}</guid>\n'
+        f"      <description>{_text(content)}</description>\n"
+    )
+    if content_type == "html":
+        res += f"      <content:encoded>{_text(content)}</content:encoded>\n"
+    if i.pub_date:
+        res += f"      <pubDate>{_rss_date(i.pub_date)}</pubDate>\n"
+    if enclosure:
+        res += (
+            f"      <enclosure url={_attr(i.preview_media_url)} "
+            f'length="{enclosure.length}" type={_attr(enclosure.mime)}/>\n'
+        )
+    return res + "    </item>\n"
+
+
+# pylint: disable=too-many-locals
+def stream_feed(
+    channel: ApiChannel,
+    items: Iterable[Item],
+    rss_format: RssFormat | None = DEFAULT_RSS_FORMAT,
+    enclosures: Mapping[str, EnclosureInfo] | None = None,
+    updated: datetime.datetime | None = None,
+) -> Iterator[str]:
+    """
+    Serialize feed incrementally: header first, then one chunk per item, as items are produced.
+
+    :param items: Ordered by pub_date descending (as returned by `fetch_items`)
+    :param updated: Feed update date, defaults to now (newest item date is better, if known beforehand)
+    """
+    channel_username = channel.username or "unknown"
+    title = feed_title(channel, channel_username)
     feed_url = channel.url
     feed_desc = channel.description
-
-    fg = FeedGenerator()
-
-    fg.id(feed_url)
-    fg.title(feed_title)
-    fg.author({"name": feed_title, "uri": feed_url})
-    fg.link(href=feed_url, rel="alternate")
-    fg.logo(channel.logo_url)
-    if feed_desc:
-        fg.subtitle(feed_desc)
-
-    for i in reversed(items):
-        link = i.url
-
-        if i.html_content and TG_RSS_USE_HTML:
-            content = i.html_content
-            content_type = "html"
-        elif i.text_content:
-            content = i.text_content
-            content_type = None
-        else:
-            raise Exception(f"Item {i} has no appropriate content")
-
-        fe = fg.add_entry()
-        fe.id(i.url)
-        fe.title(i.title)
-        fe.published(i.pub_date)
-        fe.content(content, type=content_type)
-        fe.link(href=link)
-
-        if use_enclosures and i.preview_media_url:
-            media_bytes = logged_get(i.preview_media_url).content
-
-            enclosure_type = magic.from_buffer(media_bytes, mime=True)
-            enclosure_len = len(media_bytes)
-
-            fe.link(
-                href=i.preview_media_url,
-                rel="enclosure",
-                type=enclosure_type,
-                length=str(enclosure_len),
+    updated = updated or datetime.datetime.now(datetime.timezone.utc)
+    enclosures = enclosures or {}
+
+    yield "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+    if rss_format is RssFormat.ATOM:
+        header = (
+            '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+            f"  <id>{_text(feed_url)}</id>\n"
+            f"  <title>{_text(title)}</title>\n"
+            f"  <updated>{_atom_date(updated)}</updated>\n"
+            f"  <author><name>{_text(title)}</name><uri>{_text(feed_url)}</uri></author>\n"
+            f'  <link href={_attr(feed_url)} rel="alternate"/>\n'
+            f"  <generator>{GENERATOR_NAME}</generator>\n"
+        )
+        if channel.logo_url:
+            header += f"  <logo>{_text(channel.logo_url)}</logo>\n"
+        if feed_desc:
+            header += f"  <subtitle>{_text(feed_desc)}</subtitle>\n"
+        yield header
+
+        for i in items:
+            yield _atom_entry(i, enclosures.get(i.preview_media_url or ""))
+
+        yield "</feed>\n"
+    elif rss_format is RssFormat.RSS:
+        header = (
+            '<rss xmlns:content="http://purl.org/rss/1.0/modules/content/" version="2.0">\n'
+            "  <channel>\n"
+            f"    <title>{_text(title)}</title>\n"
+            f"    <link>{_text(feed_url)}</link>\n"
+            f"    <description>{_text(feed_desc or title)}</description>\n"
+            f"    <generator>{GENERATOR_NAME}</generator>\n"
+            f"    <lastBuildDate>{_rss_date(updated)}</lastBuildDate>\n"
+        )
+        if channel.logo_url:
+            header += (
+                f"    <image><url>{_text(channel.logo_url)}</url>"
+                f"<title>{_text(title)}</title><link>{_text(feed_url)}</link></image>\n"
             )
+        yield header
 
-    dirname = os.path.join(SRC_PATH, "feeds")
-    if not os.path.exists(dirname):
-        os.mkdir(dirname)
+        for i in items:
+            yield _rss_item(i, enclosures.get(i.preview_media_url or ""))
 
-    dirname = os.path.join(dirname, channel_username)
-    if not os.path.exists(dirname):
-        os.mkdir(dirname)
-
-    if rss_format is RssFormat.RSS:
-        path = f"{dirname}/rss.xml"
-        func = fg.rss_file
-    elif rss_format is RssFormat.ATOM:
-        path = f"{dirname}/atom.xml"
-        func = fg.atom_file
+        yield "  </channel>\n</rss>\n"
     else:
         raise Exception("No rss_format specified")
 
-    func(path, pretty=True)
-    return path
+
+def channel_gen_rss(
+    channel: ApiChannel,
+    items: Sequence[Item],
+    rss_format: RssFormat | None = DEFAULT_RSS_FORMAT,
+    use_enclosures: bool | None = False,
+    enclosures: Mapping[str, EnclosureInfo] | None = None,
+):
+    """
+    Render feed to file in `feed_store`, see `stream_feed`
+
+    :param enclosures: Already probed media of items (see `probe_enclosures`),
+    probed here if not given and `use_enclosures` is set
+    :returns: Path of rendered file
+    """
+    if rss_format not in (RssFormat.ATOM, RssFormat.RSS):
+        raise Exception("No rss_format specified")
+
+    if use_enclosures and enclosures is None:
+        enclosures = probe_enclosures_sync(i.preview_media_url for i in items if i.preview_media_url)
+
+    key = FeedStore.key(
+        channel.store_key,
+        rss_format,
+        bool(use_enclosures),
+        *(f"{i.url}@{i.pub_date}" for i in items),
+    )
+
+    return feed_store.write(
+        key,
+        stream_feed(
+            channel,
+            items,
+            rss_format=rss_format,
+            enclosures=enclosures if use_enclosures else None,
+            updated=max((i.pub_date for i in items if i.pub_date), default=None),
+        ),
+    )
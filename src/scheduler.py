@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import (
+    dataclass,
+)
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    TypeVar,
+)
+
+from src.metrics import (
+    FEED_REFRESHES,
+)
+from src.utils import (
+    HTTP_CACHE_EXPIRE_AFTER,
+)
+
+logger = logging.getLogger(__name__)
+
+FEED_REFRESH_INTERVAL = float(os.getenv("FEED_REFRESH_INTERVAL", str(HTTP_CACHE_EXPIRE_AFTER.total_seconds())))
+FEED_REFRESH_JITTER = float(os.getenv("FEED_REFRESH_JITTER", "0.1"))  # Fraction of interval
+FEED_REFRESH_CONCURRENCY = int(os.getenv("FEED_REFRESH_CONCURRENCY", "4"))
+FEED_REFRESH_MAX_FEEDS = int(os.getenv("FEED_REFRESH_MAX_FEEDS", "100"))
+FEED_REFRESH_FORGET_AFTER = float(os.getenv("FEED_REFRESH_FORGET_AFTER", str(24 * 60 * 60)))
+
+K = TypeVar("K", bound=Hashable)
+
+
+@dataclass
+class TrackedFeed:
+    interval: float
+    next_refresh: float
+    last_requested: float
+    requests_count: int = 0
+
+
+class RefreshScheduler(Generic[K]):
+    """
+    Keeps recently requested feeds fresh in background:
+    each tracked feed is refreshed every `interval` seconds, at most `max_concurrency` refreshes at once.
+    Refresh is brought forward by random jitter (so refreshes don't align), so feed validators,
+    kept for `interval` after fetch, are renewed before they expire.
+    Feeds not requested for `forget_after` seconds are dropped, and only `max_feeds` most requested are kept.
+    Refresh of feed is skipped till next interval, while `can_refresh` (e.g. upstream quota check) denies it.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        refresh: Callable[[K], Awaitable],
+        interval: float = FEED_REFRESH_INTERVAL,
+        jitter: float = FEED_REFRESH_JITTER,
+        max_concurrency: int = FEED_REFRESH_CONCURRENCY,
+        max_feeds: int = FEED_REFRESH_MAX_FEEDS,
+        forget_after: float = FEED_REFRESH_FORGET_AFTER,
+        can_refresh: Callable[[K], bool] | None = None,
+    ):
+        self.refresh = refresh
+        self.can_refresh = can_refresh
+        self.interval = interval
+        self.jitter = jitter
+        self.max_feeds = max_feeds
+        self.forget_after = forget_after
+        self.max_concurrency = max_concurrency
+
+        self.feeds: dict[K, TrackedFeed] = {}
+        self._semaphore: asyncio.Semaphore | None = None  # Created in running loop
+        self._refreshing: set[K] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._loop_task: asyncio.Task | None = None
+
+    def _next_refresh(self, interval: float) -> float:
+        return time.monotonic() + interval * max(0.0, 1 - self.jitter * random.uniform(1, 2))
+
+    def track(self, key: K):
+        """Register feed request"""
+        now = time.monotonic()
+
+        feed = self.feeds.get(key)
+        if feed is None:
+            feed = self.feeds[key] = TrackedFeed(self.interval, self._next_refresh(self.interval), now)
+
+        feed.last_requested = now
+        feed.requests_count += 1
+
+        if len(self.feeds) > self.max_feeds:
+            least_popular = min(self.feeds, key=lambda i: (self.feeds[i].requests_count, self.feeds[i].last_requested))
+            del self.feeds[least_popular]
+
+    def due(self) -> list[K]:
+        now = time.monotonic()
+
+        for k in [k for k, v in self.feeds.items() if now - v.last_requested > self.forget_after]:
+            del self.feeds[k]
+
+        return [k for k, v in self.feeds.items() if v.next_refresh <= now and k not in self._refreshing]
+
+    async def _refresh(self, key: K):
+        assert self._semaphore
+        try:
+            async with self._semaphore:
+                await self.refresh(key)
+            FEED_REFRESHES.inc(result="done")
+        except Exception:  # Feed will be refreshed on next interval or reader request
+            FEED_REFRESHES.inc(result="failed")
+            logger.exception("Background refresh failed: %s", key)
+        finally:
+            self._refreshing.discard(key)
+            if key in self.feeds:
+                self.feeds[key].next_refresh = self._next_refresh(self.feeds[key].interval)
+
+    def run_due(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        for key in self.due():
+            if self.can_refresh and not self.can_refresh(key):
+                FEED_REFRESHES.inc(result="skipped")
+                self.feeds[key].next_refresh = self._next_refresh(self.feeds[key].interval)
+                continue
+
+            self._refreshing.add(key)
+            task = asyncio.create_task(self._refresh(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, tick: float):
+        while True:
+            self.run_due()
+            await asyncio.sleep(tick)
+
+    def start(self, tick: float = 1):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run(tick))
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        if self._loop_task:
+            tasks.append(self._loop_task)
+            self._loop_task = None
+
+        for i in tasks:
+            i.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._semaphore = None
@@ -0,0 +1,34 @@
+import asyncio
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key:
+    while call for a key is in flight, other callers wait for it and share its result (or exception)
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        fut = self._calls.get(key)
+
+        if fut is None:
+            fut = asyncio.ensure_future(func())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        # Cancelled caller (e.g. disconnected client) must not cancel call shared with others
+        return await asyncio.shield(fut)
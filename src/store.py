@@ -0,0 +1,144 @@
+import dataclasses
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import (
+    Any,
+    Iterable,
+    List,
+)
+
+from .utils import (
+    DEFAULT_TZ,
+    SRC_PATH,
+    date_to_datetime,
+)
+
+ITEM_STORE_PATH = os.getenv("ITEM_STORE_PATH", os.path.join(SRC_PATH, "items_store.sqlite"))
+
+
+def _date_key(d: datetime.datetime | None) -> str:
+    """Lexicographically sortable representation of item pub_date"""
+    return d.astimezone(DEFAULT_TZ).isoformat() if d else ""
+
+
+class ItemStore:
+    """
+    Persistent storage of already fetched channel items.
+
+    Invariant: items stored for channel are contiguous,
+    from some newest known item down to the oldest stored one.
+    Channel is marked `complete` if its history is stored down to the very first item.
+    Shared by worker processes: WAL journal lets readers proceed while other process writes.
+    """
+
+    def __init__(self, path: str = ITEM_STORE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                channel TEXT NOT NULL,
+                key TEXT NOT NULL,
+                pub_date TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (channel, key)
+            );
+            CREATE INDEX IF NOT EXISTS items_channel_pub_date ON items (channel, pub_date);
+            CREATE TABLE IF NOT EXISTS channels (
+                channel TEXT PRIMARY KEY,
+                complete INTEGER NOT NULL DEFAULT 0
+            );
+            """)
+        self._conn.commit()
+
+    def contains(self, channel: str, key: str | None) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM items WHERE channel = ? AND key = ?", (channel, key)).fetchone()
+        return row is not None
+
+    def is_complete(self, channel: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT complete FROM channels WHERE channel = ?", (channel,)).fetchone()
+        return bool(row and row[0])
+
+    def oldest_pub_date(self, channel: str) -> datetime.datetime | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(pub_date) FROM items WHERE channel = ? AND pub_date != ''", (channel,)
+            ).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def count_older(self, channel: str, before: datetime.datetime | None) -> int:
+        sql = "SELECT COUNT(*) FROM items WHERE channel = ?"
+        params: list = [channel]
+
+        if before:
+            sql += " AND pub_date < ?"
+            params.append(_date_key(before))
+
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return row[0]
+
+    def save(self, channel: str, items: Iterable, replace: bool = False, complete: bool | None = None):
+        """
+        :param replace: Drop previously stored channel items (they are not contiguous with given ones)
+        :param complete: Set channel history completeness flag, keep as is if None
+        """
+        rows = [
+            (channel, i.url, _date_key(i.pub_date), json.dumps(dataclasses.asdict(i), default=_date_key)) for i in items
+        ]
+
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM items WHERE channel = ?", (channel,))
+                self._conn.execute("DELETE FROM channels WHERE channel = ?", (channel,))
+
+            self._conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", rows)
+
+            if complete is not None:
+                self._conn.execute("INSERT OR REPLACE INTO channels VALUES (?, ?)", (channel, int(complete)))
+
+    def query(
+        self,
+        channel: str,
+        item_class: Any,
+        before: datetime.datetime | None = None,
+        after_date: datetime.date | None = None,
+        limit: int | None = None,
+    ) -> List:
+        """
+        :param item_class: `base.Item` subclass (not imported, as base module depends on this one)
+        :returns: Stored items ordered by pub_date descending
+        """
+        sql = "SELECT data FROM items WHERE channel = ?"
+        params: list = [channel]
+
+        if before:
+            sql += " AND pub_date < ?"
+            params.append(_date_key(before))
+        if after_date:
+            sql += " AND pub_date >= ?"
+            params.append(_date_key(date_to_datetime(after_date)))
+
+        sql += " ORDER BY pub_date DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        res = []
+        for (data,) in rows:
+            fields = json.loads(data)
+            if fields.get("pub_date"):
+                fields["pub_date"] = datetime.datetime.fromisoformat(fields["pub_date"])
+            res.append(item_class.from_fields(fields))
+        return res
+
+
+item_store: ItemStore | None = ItemStore() if ITEM_STORE_PATH else None
@@ -1,14 +1,15 @@
+import asyncio
 import datetime
+import math
 import re
 from dataclasses import (
     dataclass,
 )
 from typing import (
-    List,
+    Deque,
     Optional,
 )
 
-import bs4
 import fastapi
 from fastapi import (
     HTTPException,
@@ -18,54 +19,77 @@ from .base import (
     ApiChannel,
     Item,
 )
+from .metrics import (
+    TG_PAGE_RETRIES,
+)
 from .parsing import (
-    PreviewAttrs,
-    derive_post_datetime,
-    derive_post_text,
-    derive_post_url,
-    derive_preview_attrs,
+    ChannelMetadata,
+    ParsedPage,
+    RawPost,
+    html_to_text,
+    page_parser,
+    parse_pool,
 )
 from .utils import (
     TG_BASE_URL,
+    TG_PARALLEL_PAGES,
     TG_RSS_HTML_APPEND_PREVIEW,
+    date_to_datetime,
     form_preview_html_text,
     logged_get,
+    logged_get_async,
     shortened_text,
 )
 
+TG_PAGE_SIZE = 20  # Max messages count on t.me/s/<channel> page
+_BEFORE_CURSOR_RE = re.compile(r"[?&]before=(\d+)")
+
+
+def before_cursor(url: str | None) -> int | None:
+    """
+    :returns: Message id, page with messages older than it is requested by url
+    """
+    match = _BEFORE_CURSOR_RE.search(url or "")
+    return int(match.group(1)) if match else None
+
 
-@dataclass
+@dataclass(slots=True)
 class TGPost(Item):
+    html: str = ""  # Message text wrapper html, text content is derived from it
+    preview_html: str | None = None  # Appended to html content, see TG_RSS_HTML_APPEND_PREVIEW
     preview_link_url: str | None = None
 
+    @property
+    def html_content(self) -> str:
+        return self.html + self.preview_html if self.preview_html else self.html
+
+    @property
+    def text_content(self) -> str:
+        return html_to_text(self.html)
+
     @classmethod
-    def from_raw_data(cls, data: bs4.Tag) -> Optional["TGPost"]:
+    def from_raw_data(cls, data: RawPost) -> Optional["TGPost"]:
         """
-        :param data: bs4 Tag element that is wrapper of single TG channel message
+        :param data: Record of single TG channel message, see `parsing.TGPageParser.parse_page`
         """
 
-        message_datetime: datetime.datetime | None = derive_post_datetime(data)
-        post_url: str | None = derive_post_url(data)
-
-        text_attrs = derive_post_text(data)
-        if text_attrs is None:  # No text in post
+        post_fields = data.fields
+        if post_fields is None:  # No text in post
             return None
 
-        text, html_content = text_attrs
-        link_preview_attrs: PreviewAttrs = derive_preview_attrs(data)
+        link_preview_attrs = post_fields.preview
 
+        preview_html = None
         if TG_RSS_HTML_APPEND_PREVIEW:
             if link_preview_attrs.title and link_preview_attrs.desc:
-                html_content += form_preview_html_text(link_preview_attrs.title, link_preview_attrs.desc)
-
-        title = shortened_text(text, 50)
+                preview_html = form_preview_html_text(link_preview_attrs.title, link_preview_attrs.desc) or None
 
         return cls(
-            url=post_url,
-            pub_date=message_datetime,
-            title=title,
-            text_content=text,
-            html_content=html_content,
+            url=post_fields.url,
+            pub_date=post_fields.pub_date,
+            title=shortened_text(post_fields.text, 50),
+            html=post_fields.html,
+            preview_html=preview_html,
             preview_link_url=link_preview_attrs.url,
             preview_media_url=link_preview_attrs.media_url,
         )
@@ -83,10 +107,12 @@ class TGApiChannel(ApiChannel):
     ItemClass: type[Item] = TGPost
 
     SUPPORT_FILTER_BY_DATE = False
-    q: List[bs4.element.Tag] = []
+    q: Deque[RawPost]  # Messages records, see parsing.TGPageParser
     next_url: str | None = None
+    _prefetched_page: ParsedPage | None = None  # First page, fetched with metadata
+    _date_window_cursor: int | None = None  # Cursor of last page with items newer than after_date
 
-    def __init__(self, url_or_alias: str):
+    def __init__(self, url_or_alias: str, with_metadata: bool = True):
         name_match = re.search("[^/]+(?=/$|$)", url_or_alias)
         if not name_match:
             raise Exception
@@ -96,80 +122,186 @@ class TGApiChannel(ApiChannel):
         self.username = channel_username or url_or_alias
         url = f"https://t.me/s/{channel_username}"
 
-        self.next_url = url  # TODO make it common in ApiChannel
-        super().__init__(url=url)
+        super().__init__(url=url, with_metadata=with_metadata)
 
     def fetch_metadata(self):
+        """
+        Metadata is parsed from first page of channel posts, page is kept to be used by next fetch_items
+        """
         super().fetch_metadata()
 
         req = logged_get(self.url)
-        soup = bs4.BeautifulSoup(req.text, "html.parser")
+        self.on_first_page(page_parser.parse_page(req.text))
 
-        # --- Parse channel title ---
-        channel_metadata_wrapper = soup.find(name="div", attrs={"class": "tgme_channel_info_header"}, recursive=True)
+    async def fetch_metadata_async(self):
+        await super().fetch_metadata_async()
 
-        if channel_metadata_wrapper is None:
+        req = await logged_get_async(self.url)
+        self.on_first_page(await parse_pool.parse_page(req.text))
+
+    def on_first_page(self, page: ParsedPage):
+        self.set_metadata(page.metadata)
+        self._prefetched_page = page
+
+    def set_metadata(self, metadata: ChannelMetadata | None):
+        if metadata is None:
             raise HTTPException(
                 status_code=fastapi.status.HTTP_404_NOT_FOUND,
                 detail=f"Telegram: channel with username @{self.username} not found",
             )
-        channel_title = channel_metadata_wrapper.findChild(name="span").contents[0]
 
-        channel_img_url = channel_metadata_wrapper.findChild(name="img", recursive=True)
-        channel_img_url = channel_img_url.get("src")
+        self.full_name = metadata.title
+        self.logo_url = metadata.logo_url
+        self.description = metadata.description
+        self.cache_metadata()
 
-        try:
-            channel_desc = soup.findChild(
-                name="div",
-                attrs={"class": "tgme_channel_info_description"},
-                recursive=True,
-            ).contents[0]
-        except AttributeError:
-            channel_desc = ""
+    # --- Iterator related funcs ---
+    def reset_fetch_fields(self):
+        super().reset_fetch_fields()
+        self.next_url = self.url
+        self._prefetched_page = None
+        self._date_window_cursor = None
 
-        self.full_name = str(channel_title)
-        self.logo_url = channel_img_url
-        self.description = str(channel_desc)
+    def _take_prefetched_page(self, fetch_url: str) -> ParsedPage | None:
+        page, self._prefetched_page = self._prefetched_page, None
+        return page if fetch_url == self.url else None
 
-    # --- Iterator related funcs ---
     # @lru_cache
     # @limit_requests(count=1)  # TODO Limit fetch_items count if no attr applied
-    def on_fetch_new_chunk(self, fetch_url: str, retry_more=True):  # -> Optional[str]:
+    def on_fetch_new_chunk(self, fetch_url: str, retry_more=True):
         """
         :param fetch_url: Link to previous channel posts.
-        :param retry_more Flag indicates whether this func can be called recursively again or not
+        :param retry_more Flag indicates whether page without link to next page can be fetched again
         example: https://t.me/s/notboring_tech?before=2422
-
-        :return: Next fetch_url for fetching next page of posts
         """
-        print("TG: NEW CHUNK | ", end="")
-        req = logged_get(fetch_url)
-        soup = bs4.BeautifulSoup(req.text, "html.parser")
+        page = self._take_prefetched_page(fetch_url) if retry_more else None
+        if page is None:
+            req = logged_get(fetch_url)
+            page = page_parser.parse_page(req.text)
+
+        if not page.has_more_tag and retry_more:
+            TG_PAGE_RETRIES.inc()
+            self.on_fetch_new_chunk(fetch_url, retry_more=False)  # Try to fetch_items again
+            return
+        self.on_page(page)
+
+    async def on_fetch_new_chunk_async(self, fetch_url: str, retry_more=True):
+        page = self._take_prefetched_page(fetch_url) if retry_more else None
+        if page is None:
+            req = await logged_get_async(fetch_url)
+            page = await parse_pool.parse_page(req.text)
+
+        if not page.has_more_tag and retry_more:
+            TG_PAGE_RETRIES.inc()
+            await self.on_fetch_new_chunk_async(fetch_url, retry_more=False)
+            return
+        self.on_page(page)
+
+    def on_page(self, page: ParsedPage):
+        """
+        Push page posts to queue and set self.next_url (None if there is no next page)
+        """
+        self.q.extend(reversed(page.posts))
+        if page.metadata and self._fetched_count == 0:  # Keep cached metadata fresh
+            self.set_metadata(page.metadata)
+        self.next_url = f"{TG_BASE_URL}{page.next_page_href}" if page.next_page_href else None
+
+    def fetch_next(self):
+        return self.on_fetch_new_chunk(self.next_url)
+
+    def _pages_needed(self, cursor: int) -> int:
+        limits = [self.max_requests, TG_PARALLEL_PAGES]
 
-        # --- Get list of posts wrappers
-        posts_list = soup.findChildren(name="div", attrs={"class": "tgme_widget_message_wrap"}, recursive=True)
+        _, entries_count, _ = self._fetch_query
+        if entries_count:
+            missing = entries_count - self._fetched_count - len(self.q)
+            limits.append(max(1, math.ceil(missing / TG_PAGE_SIZE)))
+        if self._date_window_cursor is not None:
+            limits.append(max(1, (cursor - self._date_window_cursor) // TG_PAGE_SIZE + 1))
 
-        self.q.extend(reversed(posts_list))  # TODO convert to dataclass on the fly
+        return int(min(limits))
 
-        # --- Next messages page href parsing
-        messages_more_tag = soup.find(name="a", attrs={"class": "tme_messages_more"}, recursive=True)
+    async def _is_page_in_date_window(self, cursor: int, cutoff: datetime.datetime) -> bool:
+        req = await logged_get_async(self.url, params={"before": cursor})
+        page = await parse_pool.parse_page(req.text)
+        if not page.posts:
+            return False
 
-        if not messages_more_tag:
-            if retry_more:
-                print("Retrying fetch_items...")
-                self.on_fetch_new_chunk(fetch_url, retry_more=False)  # Try to fetch_items again
+        dates = [i.fields.pub_date for i in page.posts if i.fields and i.fields.pub_date]
+        return not dates or max(dates) >= cutoff
 
-        if isinstance(messages_more_tag, bs4.Tag):
-            if messages_more_tag.get("data-after"):  # We reached end of posts list
-                self.next_url = None
+    async def seek_date_async(self, cursor: int, after_date: datetime.date) -> int:
+        """
+        Find last page with messages newer than after_date, by exponential search and bisection over pages
+        `before=cursor - k * TG_PAGE_SIZE` (same cursors as predicted by parallel fetch,
+        so probed pages inside date window are reused from responses cache).
+
+        :returns: Cursor of last page of date window
+        """
+        cutoff = date_to_datetime(after_date)
+
+        lo = 0  # Page inside window
+        hi = (cursor - 2) // TG_PAGE_SIZE + 1  # Page outside window (after last channel page)
+        step = max(1, TG_PARALLEL_PAGES - 1)  # First probe is last page of first parallel batch
+
+        while lo + step < hi:
+            if not await self._is_page_in_date_window(cursor - (lo + step) * TG_PAGE_SIZE, cutoff):
+                hi = lo + step
+                break
+            lo += step
+            step *= 2
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if await self._is_page_in_date_window(cursor - mid * TG_PAGE_SIZE, cutoff):
+                lo = mid
             else:
-                next_page_href = messages_more_tag.get("href")
-                next_page_link = f"{TG_BASE_URL}{next_page_href}"
+                hi = mid
 
-                self.next_url = next_page_link
+        return cursor - lo * TG_PAGE_SIZE
 
-    def fetch_next(self):
-        return self.on_fetch_new_chunk(self.next_url)
+    async def fetch_next_async(self):
+        """
+        Message ids are dense, so cursors of following pages are predicted as `before - k * TG_PAGE_SIZE`,
+        and up to TG_PARALLEL_PAGES pages are fetched at once.
+        Overlapping messages (predicted cursor above lowest id of previous page) are skipped,
+        on gap (cursor below it, e.g. page had less messages) the rest of pages is dropped and paging continues
+        from real link of last used page.
+        Date window end is sought beforehand (see `seek_date_async`), so pages older than after_date are not fetched.
+        """
+        cursor = before_cursor(self.next_url)
+        if cursor is None:
+            return await self.on_fetch_new_chunk_async(self.next_url)
+
+        _, _, after_date = self._fetch_query
+        if after_date and self._date_window_cursor is None and TG_PARALLEL_PAGES > 1 and self.max_requests == math.inf:
+            self._date_window_cursor = await self.seek_date_async(cursor, after_date)
+
+        pages_count = self._pages_needed(cursor)
+        if pages_count <= 1:
+            return await self.on_fetch_new_chunk_async(self.next_url)
+
+        async def fetch_page(page_cursor: int) -> ParsedPage:
+            req = await logged_get_async(self.url, params={"before": page_cursor})
+            return await parse_pool.parse_page(req.text)
+
+        # Each page is parsed as soon as it is received (by parse_pool workers, if enabled), result keeps cursors order
+        cursors = [c for c in (cursor - i * TG_PAGE_SIZE for i in range(pages_count)) if c > 1]
+        pages = await asyncio.gather(*[fetch_page(c) for c in cursors])
+        self.max_requests -= len(cursors) - 1  # One request is counted by caller
+
+        if not pages[0].has_more_tag:
+            TG_PAGE_RETRIES.inc()
+            return await self.on_fetch_new_chunk_async(self.next_url, retry_more=False)
+
+        lowest_id: int | None = cursor  # Messages below it are not fetched yet
+        for page_cursor, page in zip(cursors, pages):
+            if lowest_id is None or page_cursor < lowest_id or not page.has_more_tag:
+                break
+
+            posts = [i for i in page.posts if (i.post_id or 0) < lowest_id]
+            self.on_page(page._replace(posts=posts))
+            lowest_id = before_cursor(self.next_url)
 
     def is_iteration_ended(self):
         return not self.next_url
@@ -5,6 +5,7 @@ import os
 import random
 import re
 import time
+import urllib.parse
 from ssl import (
     SSLError,
 )
@@ -14,38 +15,72 @@ from typing import (
 )
 
 import dotenv
+import httpx
 import pytz
-import requests_cache
+import requests
+
+from src.http_cache import (
+    CacheBackend,
+    HttpCache,
+    make_backend,
+    parse_ttl_rules,
+)
+from src.metrics import (
+    HTTP_CACHE_REQUESTS,
+    UPSTREAM_REQUEST_SECONDS,
+    UPSTREAM_RESPONSES,
+)
 
 DEFAULT_TZ = pytz.UTC
 SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-RUN_IDENTIFIER = random.randint(1, 1000)
 
 dotenv_vars = dotenv.load_dotenv(".env")
 
+# Part of feed titles and ETags. Exported to environment, so worker processes spawned by uvicorn share it
+RUN_IDENTIFIER = os.environ.setdefault("RUN_IDENTIFIER", str(random.randint(1, 1000)))
+
 HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
 HTTP_PORT = int(os.getenv("HTTP_PORT", "8081"))
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "1"))
 
 USE_YT_API = bool(os.getenv("USE_YT_API", "False"))
 
 if USE_YT_API:
     YT_API_KEY = os.getenv("YT_API_KEY", None)
+    # Keys are rotated, when daily quota of one is spent
+    YT_API_KEYS = [i.strip() for i in os.getenv("YT_API_KEYS", YT_API_KEY or "").split(",") if i.strip()]
 
-    if not YT_API_KEY:
-        raise Exception("No Youtube API key specified in env: `YT_API_KEY`")
+    if not YT_API_KEYS:
+        raise Exception("No Youtube API key specified in env: `YT_API_KEY` or `YT_API_KEYS`")
+    YT_API_KEY = YT_API_KEYS[0]
 
     YT_API_MAX_RESULTS_PER_PAGE = os.getenv("YT_API_MAX_RESULTS_PER_PAGE", None)
     YT_BASE_API_SEARCH_URL = os.getenv("YT_BASE_API_SEARCH_URL", None)
     YT_BASE_API_VIDEOS_URL = os.getenv("YT_BASE_API_VIDEOS_URL", None)
+    YT_BASE_API_CHANNELS_URL: str | None = os.getenv(
+        "YT_BASE_API_CHANNELS_URL", "https://www.googleapis.com/youtube/v3/channels"
+    )
+    YT_BASE_API_PLAYLIST_ITEMS_URL: str | None = os.getenv(
+        "YT_BASE_API_PLAYLIST_ITEMS_URL", "https://www.googleapis.com/youtube/v3/playlistItems"
+    )
 else:
     YT_API_KEY = None
+    YT_API_KEYS = []
     YT_API_MAX_RESULTS_PER_PAGE = None
     YT_BASE_API_SEARCH_URL = None
     YT_BASE_API_VIDEOS_URL = None
+    YT_BASE_API_CHANNELS_URL = None
+    YT_BASE_API_PLAYLIST_ITEMS_URL = None
+
+# "playlist": page channel uploads playlist (1 quota unit per page), "search": page search api (100 units per page)
+YT_FETCH_ENGINE = os.getenv("YT_FETCH_ENGINE", "playlist")
 
 TG_BASE_URL = os.getenv("TG_BASE_URL", None)
 TG_RSS_USE_HTML = bool(os.getenv("TG_RSS_USE_HTML", "False"))
 TG_RSS_HTML_APPEND_PREVIEW = bool(os.getenv("TG_RSS_HTML_APPEND_PREVIEW", "False"))
+TG_HTML_PARSER = os.getenv("TG_HTML_PARSER", "lxml")  # "lxml" or "bs4"
+TG_PARALLEL_PAGES = int(os.getenv("TG_PARALLEL_PAGES", "4"))  # Pages fetched at once, 1 to page serially
+TG_PARSE_WORKERS = int(os.getenv("TG_PARSE_WORKERS", "0"))  # Parser processes, 0 to parse in event loop thread
 
 
 def yt_id_to_url(x):
@@ -111,21 +146,127 @@ def shortened_text(s: str, max_chars=20) -> str:
     return s[: min(len(s), max_chars)].strip().replace("\n", " ") + "..."
 
 
-session = requests_cache.CachedSession(
-    "demo_cache",
-    cache_control=True,
-    expire_after=datetime.timedelta(minutes=5),
+HTTP_CACHE_EXPIRE_AFTER = datetime.timedelta(minutes=5)
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "20"))
+ASYNC_HTTP_TIMEOUT = float(os.getenv("ASYNC_HTTP_TIMEOUT", "15"))
+
+# Backend of upstream responses cache: "memory", "sqlite" or "filesystem"
+HTTP_CACHE_BACKEND = os.getenv("HTTP_CACHE_BACKEND", "sqlite")
+HTTP_CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH", os.path.join(SRC_PATH, "http_cache" + (".sqlite" if HTTP_CACHE_BACKEND == "sqlite" else ""))
+)
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# TTL (seconds) per upstream host and path prefix, e.g. "t.me=600,www.googleapis.com/youtube/v3/search=120"
+HTTP_CACHE_TTLS = parse_ttl_rules(os.getenv("HTTP_CACHE_TTLS", ""))
+
+http_cache = HttpCache(
+    make_backend(HTTP_CACHE_BACKEND, HTTP_CACHE_PATH, HTTP_CACHE_MAX_BYTES),
+    default_ttl=HTTP_CACHE_EXPIRE_AFTER.total_seconds(),
+    ttl_rules=HTTP_CACHE_TTLS,
+)
+
+# Backend of state, that must be consistent across worker processes (channels metadata, feed validators).
+# Per process "memory" is enough for single worker
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "sqlite" if HTTP_WORKERS > 1 else "memory")
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(SRC_PATH, "shared_cache" + (".sqlite" if SHARED_CACHE_BACKEND == "sqlite" else "")),
 )
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+shared_cache: CacheBackend | None = (
+    None
+    if SHARED_CACHE_BACKEND == "memory"
+    else make_backend(SHARED_CACHE_BACKEND, SHARED_CACHE_PATH, SHARED_CACHE_MAX_BYTES, report_metrics=False)
+)
+session = requests.Session()
+
+
+def observe_upstream_response(url: str, status_code: int, seconds: float | None):
+    """
+    :param seconds: Request latency, None if response is served by http cache
+    """
+    host = urllib.parse.urlsplit(url).hostname or ""
+    UPSTREAM_RESPONSES.inc(host=host, status=status_code)
+    HTTP_CACHE_REQUESTS.inc(result="miss" if seconds is not None else "hit")
+    if seconds is not None:
+        UPSTREAM_REQUEST_SECONDS.observe(seconds, host=host)
+
+
+def cached_response(url, params: dict | None = None) -> httpx.Response | None:
+    """
+    :returns: Response, that `logged_get` (or `logged_get_async`) would return without request
+    """
+    return http_cache.get(HttpCache.key(url, params))
+
+
+def logged_get(url, params: dict | None = None, **kwargs):
+    """
+    GET through `http_cache`
 
+    :returns: `httpx` response if served by cache, `requests` response otherwise
+    """
+    key = HttpCache.key(url, params)
 
-def logged_get(url, **kwargs):
-    print("REQUEST -> ", end="")
+    cached = http_cache.get(key)
+    if cached:
+        observe_upstream_response(key, cached.status_code, None)
+        return cached
+
+    start = time.perf_counter()
     try:
-        req = session.get(url, **kwargs)
+        req = session.get(key, **kwargs)
     except SSLError as exc:
         raise Exception("No connection to the internet") from exc
 
-    print(f"[{req.status_code}] {req.url} | ")
+    observe_upstream_response(key, req.status_code, time.perf_counter() - start)
+    http_cache.put(key, req)
+    return req
+
+
+_async_client: httpx.AsyncClient | None = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return process-wide pooled async http client, creating it on first use"""
+    global _async_client  # pylint: disable=global-statement
+
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=ASYNC_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=ASYNC_HTTP_MAX_CONNECTIONS),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client  # pylint: disable=global-statement
+
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+
+
+async def logged_get_async(url, params: dict | None = None, **kwargs) -> httpx.Response:
+    """
+    Non-blocking version of `logged_get`
+    """
+    key = HttpCache.key(url, params)
+
+    cached = http_cache.get(key)
+    if cached:
+        observe_upstream_response(key, cached.status_code, None)
+        return cached
+
+    start = time.perf_counter()
+    try:
+        req = await get_async_client().get(key, **kwargs)
+    except httpx.ConnectError as exc:
+        raise Exception("No connection to the internet") from exc
+
+    observe_upstream_response(key, req.status_code, time.perf_counter() - start)
+    http_cache.put(key, req)
     return req
 
 
@@ -1,7 +1,10 @@
+import asyncio
 import dataclasses
+import os
 import re
 from typing import (
-    List,
+    Deque,
+    Iterable,
     Optional,
 )
 
@@ -15,27 +18,53 @@ from .base import (
     ApiItem,
     Item,
 )
+from .metadata_cache import (
+    MetadataCache,
+)
+from .metrics import (
+    YT_QUOTA_DEGRADED_FETCHES,
+)
 from .utils import (
-    YT_API_KEY,
     YT_API_MAX_RESULTS_PER_PAGE,
+    YT_BASE_API_CHANNELS_URL,
+    YT_BASE_API_PLAYLIST_ITEMS_URL,
     YT_BASE_API_SEARCH_URL,
     YT_BASE_API_VIDEOS_URL,
+    YT_FETCH_ENGINE,
+    cached_response,
     is_youtube_channel_id,
     is_youtube_link,
     logged_get,
+    logged_get_async,
+    shared_cache,
     shortened_text,
     yt_channel_id_to_url,
     yt_datetime_to_str_param,
     yt_id_to_url,
     yt_str_param_to_datetime,
 )
+from .yt_quota import (
+    QuotaExceeded,
+    endpoint_cost,
+    endpoint_name,
+    yt_quota,
+)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class YTVideo(Item):
+    description: str | None = None
+
+    @property
+    def text_content(self) -> str | None:
+        return self.description
+
     @classmethod
     def from_raw_data(cls, json: dict) -> Optional["YTVideo"]:
-        video_id = json["id"]["videoId"]
+        """
+        :param json: Item of search api (id is object) or videos api (id is string) response
+        """
+        video_id = json["id"] if isinstance(json["id"], str) else json["id"]["videoId"]
         url = f"https://www.youtube.com/watch?v={video_id}"
 
         date_str = json["snippet"]["publishedAt"]
@@ -49,7 +78,7 @@ class YTVideo(Item):
             url=url,
             pub_date=pub_date,
             title=title,
-            text_content=description,
+            description=description,
             preview_media_url=preview_img_url,
         )
 
@@ -57,6 +86,136 @@ class YTVideo(Item):
         return f"{self.url} | {shortened_text(self.title, 30)} | {self.pub_date}"
 
 
+YT_API_MAX_IDS_PER_REQUEST = 50
+YT_VIDEOS_CACHE_TTL = float(os.getenv("YT_VIDEOS_CACHE_TTL", str(60 * 60)))
+YT_VIDEOS_CACHE_MAX_ENTRIES = int(os.getenv("YT_VIDEOS_CACHE_MAX_ENTRIES", "10000"))
+
+# Raw videos api items by video id
+videos_cache = MetadataCache(
+    ttl=YT_VIDEOS_CACHE_TTL, max_entries=YT_VIDEOS_CACHE_MAX_ENTRIES, backend=shared_cache, namespace="yt_videos"
+)
+
+
+YT_API_KEY_HEADER = "X-Goog-Api-Key"  # Key is passed in header, so cached responses are shared by keys
+YT_QUOTA_ERRORS = ("quotaExceeded", "dailyLimitExceeded", "rateLimitExceeded")
+
+
+def is_quota_error(req) -> bool:
+    if req.status_code != 403:
+        return False
+    try:
+        errors = req.json()["error"].get("errors") or []
+    except (ValueError, KeyError, AttributeError):
+        return False
+    return any(i.get("reason") in YT_QUOTA_ERRORS for i in errors)
+
+
+def yt_get(url: str | None, params: dict):
+    """
+    `logged_get` for api calls: key with enough quota is used, call units are spent in `yt_quota` beforehand,
+    key is rotated if api reports its quota is spent.
+
+    :raises QuotaExceeded: If no key can afford the call
+    """
+    cached = cached_response(url, params)
+    if cached:
+        return cached
+
+    cost, endpoint = endpoint_cost(url or ""), endpoint_name(url or "")
+    for _ in yt_quota.keys:
+        key = yt_quota.acquire(cost, endpoint)
+        req = logged_get(url, params=params, headers={YT_API_KEY_HEADER: key})
+        if not is_quota_error(req):
+            return req
+        yt_quota.exhaust(key)
+    raise QuotaExceeded(cost, endpoint)
+
+
+async def yt_get_async(url: str | None, params: dict):
+    cached = cached_response(url, params)
+    if cached:
+        return cached
+
+    cost, endpoint = endpoint_cost(url or ""), endpoint_name(url or "")
+    for _ in yt_quota.keys:
+        key = yt_quota.acquire(cost, endpoint)
+        req = await logged_get_async(url, params=params, headers={YT_API_KEY_HEADER: key})
+        if not is_quota_error(req):
+            return req
+        yt_quota.exhaust(key)
+    raise QuotaExceeded(cost, endpoint)
+
+
+def check_yt_response(req):
+    """
+    :param req: `requests` or `httpx` response of api call
+    """
+    if req.status_code == 200:
+        return
+    if req.status_code == 403:  # Forbidden
+        msg = req.json()["error"]["message"]
+        raise Exception(f"=== YT API FORBIDDEN === | {msg}")
+    raise Exception(f"=== YT API ERROR === | [{req.status_code}] {req.url}")
+
+
+def videos_params(video_ids: list[str]) -> dict:
+    return {
+        "id": ",".join(video_ids),
+        "part": "snippet",
+    }
+
+
+def on_videos_response(req) -> dict[str, dict]:
+    """
+    :param req: `requests` or `httpx` response of videos api call
+    :returns: Raw videos items by id, also put to `videos_cache`.
+    Private and deleted videos are not returned by api.
+    """
+    check_yt_response(req)
+
+    videos = {i["id"]: i for i in req.json().get("items", [])}
+    for video_id, video in videos.items():
+        videos_cache.put(video_id, video)
+    return videos
+
+
+def split_cached_videos(video_ids: Iterable[str]) -> tuple[dict[str, dict], list[list[str]]]:
+    """
+    :returns: Cached raw videos by id, and batches of other ids (YT_API_MAX_IDS_PER_REQUEST ids per api call)
+    """
+    cached: dict[str, dict] = {}
+    missing: list[str] = []
+    for video_id in dict.fromkeys(video_ids):
+        video = videos_cache.get(video_id)
+        if video is None:
+            missing.append(video_id)
+        else:
+            cached[video_id] = video
+
+    batches = [missing[i : i + YT_API_MAX_IDS_PER_REQUEST] for i in range(0, len(missing), YT_API_MAX_IDS_PER_REQUEST)]
+    return cached, batches
+
+
+def fetch_videos_json(video_ids: Iterable[str]) -> dict[str, dict]:
+    """
+    :returns: Raw videos api items by id, missing for private and deleted videos
+    """
+    res, batches = split_cached_videos(video_ids)
+    for batch in batches:
+        res.update(on_videos_response(yt_get(YT_BASE_API_VIDEOS_URL, params=videos_params(batch))))
+    return res
+
+
+async def fetch_videos_json_async(video_ids: Iterable[str]) -> dict[str, dict]:
+    res, batches = split_cached_videos(video_ids)
+    responses = await asyncio.gather(
+        *[yt_get_async(YT_BASE_API_VIDEOS_URL, params=videos_params(batch)) for batch in batches]
+    )
+    for req in responses:
+        res.update(on_videos_response(req))
+    return res
+
+
 class ApiFieldsEnum:
     PAGE_TOKEN = "pageToken"
     NEXT_PAGE_TOKEN = "nextPageToken"
@@ -67,12 +226,17 @@ class ApiFieldsEnum:
 class YTApiChannel(ApiChannel):
     ItemClass: type[Item] = YTVideo
 
-    SUPPORT_FILTER_BY_DATE = True
-    q: List[dict] = []
+    # Uploads playlist is ordered by date, but can't be filtered by it: after_date is checked on client side
+    USE_UPLOADS_PLAYLIST = YT_FETCH_ENGINE == "playlist"
+    SUPPORT_FILTER_BY_DATE = not USE_UPLOADS_PLAYLIST
+    # url (channel id) is found by metadata search
+    METADATA_FIELDS = ("url", "uploads_playlist_id", *ApiChannel.METADATA_FIELDS)
+    q: Deque[dict]  # Video ids api items, see base.ApiChannel.q
     next_page_token: str = ""
     metadata_search_string = None
+    uploads_playlist_id: str | None = None
 
-    def __init__(self, s: str):
+    def __init__(self, s: str, with_metadata: bool = True):
         self.metadata_search_string = s
 
         if is_youtube_link(s):
@@ -83,7 +247,11 @@ class YTApiChannel(ApiChannel):
             # url will be fetched as metadata
             _url = None
 
-        super().__init__(url=_url)  # type: ignore
+        super().__init__(url=_url, with_metadata=with_metadata)  # type: ignore
+
+    @classmethod
+    def can_refresh_in_background(cls) -> bool:
+        return yt_quota.has_spare()
 
     @property
     def id(self):
@@ -99,26 +267,48 @@ class YTApiChannel(ApiChannel):
     def username(self):
         return self.full_name
 
+    @property
+    def metadata_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.metadata_search_string}"
+
     def is_fetched_metadata(self):
         return self.username is not None  # TODO Check for existing data from DB
 
     def fetch_metadata(self):
+        """
+        Search (100 quota units) is used only if channel id is not known, channel details are fetched by id (1 unit)
+        """
         super().fetch_metadata()
 
+        if self.id is None:
+            req = yt_get(YT_BASE_API_SEARCH_URL, params=self.metadata_params())
+            self.parse_metadata(req.json())
+        if self.id is not None and self.needs_channel_details():
+            req = yt_get(YT_BASE_API_CHANNELS_URL, params=self.channel_details_params())
+            self.parse_channel_details(req)
+
+    async def fetch_metadata_async(self):
+        await super().fetch_metadata_async()
+
+        if self.id is None:
+            req = await yt_get_async(YT_BASE_API_SEARCH_URL, params=self.metadata_params())
+            self.parse_metadata(req.json())
+        if self.id is not None and self.needs_channel_details():
+            req = await yt_get_async(YT_BASE_API_CHANNELS_URL, params=self.channel_details_params())
+            self.parse_channel_details(req)
+
+    def metadata_params(self) -> dict:
         if not self.metadata_search_string:
             raise Exception("No string for metadata search is given")
 
-        req = logged_get(
-            url=YT_BASE_API_SEARCH_URL,
-            params={
-                "q": self.metadata_search_string,
-                "key": YT_API_KEY,
-                "part": "snippet",
-                "type": "channel",
-            },
-        )
+        return {
+            "q": self.metadata_search_string,
+            "part": "snippet",
+            "type": "channel",
+        }
 
-        items = req.json()["items"]
+    def parse_metadata(self, json: dict):
+        items = json["items"]
         if len(items) == 0:
             raise HTTPException(
                 fastapi.status.HTTP_404_NOT_FOUND,
@@ -131,6 +321,34 @@ class YTApiChannel(ApiChannel):
         self.full_name = channel_json["snippet"]["title"]
         self.description = channel_json["snippet"]["description"]
         self.logo_url = channel_json["snippet"]["thumbnails"]["default"]["url"]
+        self.cache_metadata()
+
+    def needs_channel_details(self) -> bool:
+        return not self.full_name or (self.USE_UPLOADS_PLAYLIST and not self.uploads_playlist_id)
+
+    def channel_details_params(self) -> dict:
+        return {
+            "id": self.id,
+            "part": "snippet,contentDetails",
+        }
+
+    def parse_channel_details(self, req):
+        check_yt_response(req)
+
+        items = req.json().get("items")
+        if not items:
+            raise HTTPException(
+                fastapi.status.HTTP_404_NOT_FOUND,
+                f"Youtube API: Channel with id '{self.id}' not found",
+            )
+
+        channel_json = items[0]
+
+        self.full_name = channel_json["snippet"]["title"]
+        self.description = channel_json["snippet"]["description"]
+        self.logo_url = channel_json["snippet"]["thumbnails"]["default"]["url"]
+        self.uploads_playlist_id = channel_json["contentDetails"]["relatedPlaylists"]["uploads"]
+        self.cache_metadata()
 
     # --- Iterator related funcs ---
     def reset_fetch_fields(self):
@@ -138,9 +356,8 @@ class YTApiChannel(ApiChannel):
         self.next_page_token = ""
         self._published_after_param = None
 
-    def fetch_next_page(self, page_token: str | None = None):
+    def page_params(self, page_token: str | None = None) -> dict:
         _params = {
-            "key": YT_API_KEY,
             "channelId": self.id,
             "maxResults": YT_API_MAX_RESULTS_PER_PAGE,
             "order": "date",
@@ -154,26 +371,100 @@ class YTApiChannel(ApiChannel):
         if self._published_after_param and self.SUPPORT_FILTER_BY_DATE:
             _params.update({ApiFieldsEnum.PUBLISHED_AFTER: yt_datetime_to_str_param(self._published_after_param)})
 
-        req = logged_get(YT_BASE_API_SEARCH_URL, params=_params)
+        return _params
+
+    def on_page_response(self, req):
+        """
+        :param req: `requests` or `httpx` response of search api call
+        """
+        check_yt_response(req)
+
+        json = req.json()
+        self.next_page_token = json.get(ApiFieldsEnum.NEXT_PAGE_TOKEN, None)
+        self.q.extend(json.get("items"))
+
+    def playlist_page_params(self, page_token: str | None = None) -> dict:
+        _params = {
+            "playlistId": self.uploads_playlist_id,
+            "maxResults": YT_API_MAX_IDS_PER_REQUEST,
+            "part": "contentDetails",
+        }
 
-        if req.status_code == 200:
-            json = req.json()
-            json_items = json.get("items")
+        if page_token:
+            _params.update({ApiFieldsEnum.PAGE_TOKEN: page_token})
 
-            self.next_page_token = json.get(ApiFieldsEnum.NEXT_PAGE_TOKEN, None)
-            self.q.extend(json_items)
-        elif req.status_code == 403:  # Forbidden
-            msg = req.json()["error"]["message"]
-            raise Exception(f"=== YT API FORBIDDEN === | {msg}")
+        return _params
+
+    def on_playlist_page_response(self, req) -> list[str]:
+        """
+        :param req: `requests` or `httpx` response of playlistItems api call
+        :returns: Ids of page videos, newest first
+        """
+        check_yt_response(req)
+
+        json = req.json()
+        self.next_page_token = json.get(ApiFieldsEnum.NEXT_PAGE_TOKEN, None)
+        return [i["contentDetails"]["videoId"] for i in json.get("items", [])]
+
+    def on_videos(self, video_ids: list[str], videos: dict[str, dict]):
+        """
+        Push videos to queue in playlist order.
+        Private and deleted videos (still listed in playlist) are not returned by videos api, so are skipped.
+        """
+        self.q.extend(videos[i] for i in video_ids if i in videos)
+
+    def fetch_next_page(self, page_token: str | None = None):
+        if not self.USE_UPLOADS_PLAYLIST:
+            req = yt_get(YT_BASE_API_SEARCH_URL, params=self.page_params(page_token))
+            self.on_page_response(req)
+            return
+
+        req = yt_get(YT_BASE_API_PLAYLIST_ITEMS_URL, params=self.playlist_page_params(page_token))
+        video_ids = self.on_playlist_page_response(req)
+        self.on_videos(video_ids, fetch_videos_json(video_ids))
+
+    async def fetch_next_page_async(self, page_token: str | None = None):
+        if not self.USE_UPLOADS_PLAYLIST:
+            req = await yt_get_async(YT_BASE_API_SEARCH_URL, params=self.page_params(page_token))
+            self.on_page_response(req)
+            return
+
+        req = await yt_get_async(YT_BASE_API_PLAYLIST_ITEMS_URL, params=self.playlist_page_params(page_token))
+        video_ids = self.on_playlist_page_response(req)
+        self.on_videos(video_ids, await fetch_videos_json_async(video_ids))
+
+    def on_quota_exceeded(self, exc: QuotaExceeded):
+        """
+        Stop paging and serve already fetched and stored items, fail only if there is nothing to serve
+        """
+        has_stored = self.item_store and self.item_store.oldest_pub_date(self.store_key) is not None
+        if not (self._fetched_count or self.q or has_stored):
+            raise exc
+
+        YT_QUOTA_DEGRADED_FETCHES.inc(endpoint=exc.endpoint)
+        self._is_upstream_unavailable = True
 
     def fetch_next(self):
-        return self.fetch_next_page(self.next_page_token)
+        try:
+            self.fetch_next_page(self.next_page_token)
+        except QuotaExceeded as e:
+            self.on_quota_exceeded(e)
+
+    async def fetch_next_async(self):
+        try:
+            await self.fetch_next_page_async(self.next_page_token)
+        except QuotaExceeded as e:
+            self.on_quota_exceeded(e)
 
     def is_iteration_ended(self):
         return self.next_page_token is None
 
 
 class YTApiVideo(ApiItem):
+    """
+    Single video, use `fetch_many` to get many videos with few api calls
+    """
+
     ItemClassType = YTVideo
 
     def __init__(self, video_id: str):
@@ -185,12 +476,29 @@ class YTApiVideo(ApiItem):
         self.fetch_data()
 
     def fetch_data(self):
-        _params = {
-            "key": YT_API_KEY,
-            "id": self.id,
-            "part": "snippet",
-        }
+        video = fetch_videos_json([self.id]).get(self.id)
+        if video is None:
+            raise HTTPException(fastapi.status.HTTP_404_NOT_FOUND, f"Youtube API: Video '{self.id}' not found")
+
+        self.item_object = self.ItemClassType.from_raw_data(video)
+        return self.item_object
 
-        req = logged_get(YT_BASE_API_VIDEOS_URL, params=_params)
+    @classmethod
+    def fetch_many(cls, video_ids: Iterable[str]) -> dict[str, YTVideo]:
+        """
+        :returns: Videos by id, private and deleted videos are missing
+        """
+        return cls.items_from_json(fetch_videos_json(video_ids))
+
+    @classmethod
+    async def fetch_many_async(cls, video_ids: Iterable[str]) -> dict[str, YTVideo]:
+        return cls.items_from_json(await fetch_videos_json_async(video_ids))
 
-        self.item_object = self.ItemClassType.from_raw_data(req.json())  # TODO What?
+    @classmethod
+    def items_from_json(cls, videos: dict[str, dict]) -> dict[str, YTVideo]:
+        res = {}
+        for video_id, video in videos.items():
+            item = cls.ItemClassType.from_raw_data(video)
+            if item:
+                res[video_id] = item
+        return res
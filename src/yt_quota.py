@@ -0,0 +1,169 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from collections import (
+    deque,
+)
+from typing import (
+    Deque,
+    Iterator,
+)
+
+import fastapi
+from fastapi import (
+    HTTPException,
+)
+
+from src.utils import (
+    HTTP_WORKERS,
+    SRC_PATH,
+    YT_API_KEYS,
+)
+
+YT_API_DAILY_QUOTA = int(os.getenv("YT_API_DAILY_QUOTA", "10000"))  # Units per key
+# Fraction of daily quota kept for cheap (1 unit) calls, so paging of known channels keeps working
+YT_API_QUOTA_RESERVE = float(os.getenv("YT_API_QUOTA_RESERVE", "0.1"))
+# Database of spent units, shared by worker processes (kept in memory of single process by default)
+YT_API_QUOTA_PATH = os.getenv(
+    "YT_API_QUOTA_PATH", os.path.join(SRC_PATH, "yt_quota.sqlite") if HTTP_WORKERS > 1 else ""
+)
+
+QUOTA_WINDOW = 24 * 60 * 60
+
+# Units spent by single call of api endpoint (last url path segment)
+ENDPOINT_COSTS = {
+    "search": 100,
+    "channels": 1,
+    "playlistItems": 1,
+    "videos": 1,
+}
+
+
+def endpoint_name(url: str) -> str:
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+def endpoint_cost(url: str) -> int:
+    return ENDPOINT_COSTS.get(endpoint_name(url), 1)
+
+
+class QuotaExceeded(HTTPException):
+    def __init__(self, cost: int, endpoint: str = ""):
+        self.endpoint = endpoint  # Of rejected call
+        super().__init__(
+            status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Youtube API: daily quota is spent (call costs {cost} units)",
+        )
+
+
+class QuotaManager:
+    """
+    Tracks units spent by each api key over rolling day, picks key to use for next call and spends call units on it.
+    Calls of expensive endpoints are rejected beforehand if they would cut into reserve of cheap calls.
+    If `path` is given, spent units are recorded in SQLite database there, so all worker processes see them.
+    """
+
+    def __init__(
+        self,
+        keys: list[str] = YT_API_KEYS,
+        daily_quota: int = YT_API_DAILY_QUOTA,
+        reserve: float = YT_API_QUOTA_RESERVE,
+        path: str = "",
+    ):
+        self.keys = keys
+        self.daily_quota = daily_quota
+        self.reserve = int(daily_quota * reserve)
+        self._spent: dict[str, Deque[tuple[float, int]]] = {k: deque() for k in keys}
+
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS spent (key TEXT NOT NULL, time REAL NOT NULL, cost INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS spent_key_time ON spent (key, time)")
+            self._conn.commit()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """
+        Quota is read and spent by other threads and processes: database is locked for writing right away
+        (not on first write), so check of units left and their spending are atomic
+        """
+        with self._lock:
+            if not self._conn:
+                yield
+                return
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _spent_units(self, key: str) -> int:
+        if self._conn:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(cost), 0) FROM spent WHERE key = ? AND time > ?",
+                (key, time.time() - QUOTA_WINDOW),
+            ).fetchone()
+            return row[0]
+
+        spent = self._spent[key]
+        expired = time.time() - QUOTA_WINDOW
+        while spent and spent[0][0] <= expired:
+            spent.popleft()
+        return sum(cost for _, cost in spent)
+
+    def _record(self, key: str, cost: int):
+        now = time.time()
+        if self._conn:
+            self._conn.execute("DELETE FROM spent WHERE time <= ?", (now - QUOTA_WINDOW,))
+            self._conn.execute("INSERT INTO spent VALUES (?, ?, ?)", (key, now, cost))
+            return
+
+        self._spent[key].append((now, cost))
+
+    def spent(self, key: str) -> int:
+        with self._lock:
+            return self._spent_units(key)
+
+    def remaining(self, key: str) -> int:
+        return self.daily_quota - self.spent(key)
+
+    def has_spare(self) -> bool:
+        """Whether some key has units left beyond reserve, i.e. optional calls won't take units needed by readers"""
+        return any(self.remaining(k) > self.reserve for k in self.keys)
+
+    def acquire(self, cost: int, endpoint: str = "") -> str:
+        """
+        Pick key with most units left, that can afford the call, and spend call units on it
+
+        :returns: Key to make the call with
+        :raises QuotaExceeded: If no key can afford the call
+        """
+        min_left = self.reserve if cost > 1 else 0
+        with self._transaction():
+            left, key = max(((self.daily_quota - self._spent_units(k), k) for k in self.keys), default=(0, None))
+            if key is None or left - cost < min_left:
+                raise QuotaExceeded(cost, endpoint)
+            self._record(key, cost)
+        return key
+
+    def spend(self, key: str, cost: int):
+        with self._transaction():
+            self._record(key, cost)
+
+    def exhaust(self, key: str):
+        """Mark key as spent for a day, e.g. when api reports quota error"""
+        with self._transaction():
+            self._record(key, max(0, self.daily_quota - self._spent_units(key)))
+
+
+yt_quota = QuotaManager(path=YT_API_QUOTA_PATH)
@@ -0,0 +1,98 @@
+import pytest
+
+from src import (
+    utils,
+    yt_api,
+)
+from src.base import (
+    ApiChannel,
+)
+from src.feed_store import (
+    feed_store,
+)
+from src.http_cache import (
+    HttpCache,
+    MemoryCacheBackend,
+)
+from src.metadata_cache import (
+    MetadataCache,
+)
+from src.store import (
+    ItemStore,
+)
+from src.yt_quota import (
+    QuotaManager,
+)
+from tests.fake_upstream import (
+    FakeSession,
+    FakeTelegram,
+    FakeYouTube,
+    async_client_for,
+)
+
+
+@pytest.fixture(autouse=True)
+def isolated_item_store(monkeypatch, tmp_path):
+    store = ItemStore(str(tmp_path / "items_store.sqlite"))
+    monkeypatch.setattr(ApiChannel, "item_store", store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def isolated_feed_store(monkeypatch, tmp_path):
+    path = tmp_path / "feeds"
+    path.mkdir()
+    monkeypatch.setattr(feed_store, "path", str(path))
+    return feed_store
+
+
+@pytest.fixture(autouse=True)
+def isolated_http_cache(monkeypatch):
+    cache = HttpCache(MemoryCacheBackend(16 * 1024 * 1024), default_ttl=utils.HTTP_CACHE_EXPIRE_AFTER.total_seconds())
+    monkeypatch.setattr(utils, "http_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_metadata_cache(monkeypatch):
+    cache = MetadataCache()
+    monkeypatch.setattr(ApiChannel, "metadata_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_videos_cache(monkeypatch):
+    cache = MetadataCache()
+    monkeypatch.setattr(yt_api, "videos_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_yt_quota(monkeypatch):
+    quota = QuotaManager(keys=["x"])
+    monkeypatch.setattr(yt_api, "yt_quota", quota)
+    return quota
+
+
+@pytest.fixture
+def fake_tg(monkeypatch):
+    fake = FakeTelegram(posts_count=50)
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(fake.handle))
+    monkeypatch.setattr(utils, "session", FakeSession(fake.handle))
+    utils.http_cache.clear()
+
+    yield fake
+    utils.http_cache.clear()
+
+
+@pytest.fixture
+def fake_yt(monkeypatch):
+    fake = FakeYouTube()
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(fake.handle))
+    monkeypatch.setattr(utils, "session", FakeSession(fake.handle))
+    utils.http_cache.clear()
+
+    yield fake
+    utils.http_cache.clear()
@@ -0,0 +1,269 @@
+"""
+Local stand-in for t.me, used by offline tests instead of real network calls
+"""
+
+import datetime
+import html
+from typing import (
+    Callable,
+)
+
+import httpx
+
+from src.utils import (
+    DEFAULT_TZ,
+)
+
+TG_PAGE_SIZE = 20
+
+
+class FakeTelegram:
+    """
+    Renders t.me/s/<username> pages with `posts_count` messages (ids 1..posts_count).
+    Every 7th message has no text (media only), every 3rd has link preview.
+    """
+
+    def __init__(
+        self,
+        username: str = "fake_channel",
+        posts_count: int = 50,
+        first_post_date: datetime.datetime = datetime.datetime(2023, 1, 1, tzinfo=DEFAULT_TZ),
+        post_interval: datetime.timedelta = datetime.timedelta(hours=6),
+        with_more_tag: bool = True,
+        deleted_ids: set[int] | None = None,
+        with_avatar: bool = True,
+    ):
+        self.username = username
+        self.posts_count = posts_count
+        self.first_post_date = first_post_date
+        self.post_interval = post_interval
+        self.with_more_tag = with_more_tag  # Small channels pages have no link to other messages
+        self.deleted_ids = deleted_ids or set()
+        self.with_avatar = with_avatar
+        self.requested_urls: list[str] = []
+
+    def post_date(self, post_id: int) -> datetime.datetime:
+        return self.first_post_date + (post_id - 1) * self.post_interval
+
+    def post_text(self, post_id: int) -> str | None:
+        if post_id % 7 == 0:
+            return None
+        return f"Post number {post_id}\nSecond line of <{post_id}> & more"
+
+    def render_post(self, post_id: int) -> str:
+        post_url = f"https://t.me/{self.username}/{post_id}"
+        text = self.post_text(post_id)
+
+        text_html = ""
+        if text is not None:
+            lines = "<br/>".join(html.escape(i) for i in text.split("\n"))
+            text_html = f'<div class="tgme_widget_message_text js-message_text" dir="auto">{lines}</div>'
+
+        preview_html = ""
+        if post_id % 3 == 0:
+            preview_html = (
+                f'<a class="tgme_widget_message_link_preview" href="https://example.com/{post_id}">'
+                f'<i class="link_preview_right_image" '
+                f"style=\"background-image:url('https://cdn.example.com/{post_id}.jpg')\"></i>"
+                f'<div class="link_preview_site_name" dir="auto">Example</div>'
+                f'<div class="link_preview_title" dir="auto">Preview {post_id}</div>'
+                f'<div class="link_preview_description" dir="auto">Description {post_id}</div>'
+                f"</a>"
+            )
+
+        date_str = self.post_date(post_id).replace(tzinfo=None).isoformat() + "+00:00"
+
+        return (
+            f'<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+            f'<div class="tgme_widget_message text_not_supported_wrap js-widget_message" '
+            f'data-post="{self.username}/{post_id}">'
+            f'<div class="tgme_widget_message_bubble">'
+            f"{text_html}{preview_html}"
+            f'<div class="tgme_widget_message_footer compact js-message_footer">'
+            f'<div class="tgme_widget_message_info short js-message_info">'
+            f'<span class="tgme_widget_message_views">{post_id * 10}</span>'
+            f'<span class="tgme_widget_message_meta">'
+            f'<a class="tgme_widget_message_date" href="{post_url}">'
+            f'<time datetime="{date_str}" class="time">00:00</time></a>'
+            f"</span></div></div></div></div></div>\n"
+        )
+
+    def render_page(self, before: int | None = None) -> str:
+        """
+        Last TG_PAGE_SIZE existing messages older than `before`
+        """
+        existing = [i for i in range(1, self.posts_count + 1) if i not in self.deleted_ids]
+        page_ids = [i for i in existing if before is None or i < before][-TG_PAGE_SIZE:]
+        lo, hi = (page_ids[0], page_ids[-1]) if page_ids else (1, 0)
+
+        if not self.with_more_tag:
+            more = ""
+        elif page_ids and lo > existing[0]:
+            more = (
+                f'<a class="tme_messages_more js-messages_more" data-before="{lo}" '
+                f'href="/s/{self.username}?before={lo}"></a>'
+            )
+        else:
+            more = (
+                f'<a class="tme_messages_more js-messages_more" data-after="{hi}" '
+                f'href="/s/{self.username}?after={hi}"></a>'
+            )
+
+        posts = "".join(self.render_post(i) for i in page_ids)
+        avatar = '<img src="https://cdn.example.com/logo.jpg">' if self.with_avatar else ""
+
+        return (
+            "<!DOCTYPE html><html><head><title>Fake channel</title></head><body>"
+            '<div class="tgme_channel_info">'
+            '<div class="tgme_channel_info_header">'
+            f'<i class="tgme_page_photo_image">{avatar}</i>'
+            f'<div class="tgme_channel_info_header_title"><span dir="auto">Fake {self.username}</span></div>'
+            "</div>"
+            '<div class="tgme_channel_info_description">Channel used in tests</div>'
+            "</div>"
+            '<section class="tgme_channel_history js-message_history">'
+            f"{more}\n{posts}"
+            "</section></body></html>"
+        )
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requested_urls.append(str(request.url))
+
+        if request.url.path != f"/s/{self.username}":
+            return httpx.Response(404, text="<html></html>", request=request)
+
+        before = request.url.params.get("before")
+        return httpx.Response(200, text=self.render_page(int(before) if before else None), request=request)
+
+
+def async_client_for(handler: Callable) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class FakeSession:
+    """
+    Replaces `src.utils.session` for sync code path
+    """
+
+    def __init__(self, handler: Callable):
+        self.handler = handler
+
+    def get(self, url, params=None, headers=None, **_):
+        request = httpx.Request("GET", url, params=params, headers=headers)
+        return self.handler(request)
+
+
+class FakeYouTube:
+    """
+    Serves YouTube Data API (search, channels, playlistItems, videos) for single channel with `videos_count` videos
+    (ids v1..v<videos_count>, one per `video_interval`). Counts used quota units.
+    """
+
+    QUOTA_COSTS = {"search": 100, "channels": 1, "playlistItems": 1, "videos": 1}
+
+    def __init__(
+        self,
+        channel_id: str = "UCfakeChannelId0000000001",
+        videos_count: int = 120,
+        first_video_date: datetime.datetime = datetime.datetime(2023, 1, 1, tzinfo=DEFAULT_TZ),
+        video_interval: datetime.timedelta = datetime.timedelta(days=1),
+        private_ids: set[int] | None = None,
+        keys_quota: dict[str, int] | None = None,
+    ):
+        self.channel_id = channel_id
+        self.videos_count = videos_count
+        self.first_video_date = first_video_date
+        self.video_interval = video_interval
+        self.private_ids = private_ids or set()
+        self.requested_urls: list[str] = []
+        self.quota_used = 0
+        self.keys_quota = keys_quota  # Units left for api keys, not limited if None
+        self.used_keys: list[str] = []
+
+    @property
+    def uploads_playlist_id(self) -> str:
+        return "UU" + self.channel_id[2:]
+
+    def video_date(self, n: int) -> datetime.datetime:
+        return self.first_video_date + (n - 1) * self.video_interval
+
+    def video_snippet(self, n: int) -> dict:
+        return {
+            "publishedAt": self.video_date(n).isoformat().replace("+00:00", "Z"),
+            "title": f"Video {n}",
+            "description": f"Description of video {n}",
+            "thumbnails": {"medium": {"url": f"https://i.example.com/v{n}.jpg"}},
+        }
+
+    def channel_snippet(self) -> dict:
+        return {
+            "title": "Fake YT channel",
+            "description": "Channel used in tests",
+            "thumbnails": {"default": {"url": "https://i.example.com/logo.jpg"}},
+        }
+
+    def page(self, ids: list[int], params) -> tuple[list[int], str | None]:
+        offset = int(params.get("pageToken") or 0)
+        limit = int(params.get("maxResults") or 5)
+        next_token = str(offset + limit) if offset + limit < len(ids) else None
+        return ids[offset : offset + limit], next_token
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requested_urls.append(str(request.url))
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        cost = self.QUOTA_COSTS.get(endpoint, 0)
+
+        key = request.headers.get("x-goog-api-key", "")
+        self.used_keys.append(key)
+        if self.keys_quota is not None:
+            if self.keys_quota.get(key, 0) < cost:
+                error = {"message": "Quota exceeded", "errors": [{"reason": "quotaExceeded"}]}
+                return httpx.Response(403, json={"error": error}, request=request)
+            self.keys_quota[key] -= cost
+        self.quota_used += cost
+        params = request.url.params
+        newest_first = list(range(self.videos_count, 0, -1))
+
+        if endpoint == "channels":
+            if params.get("id") != self.channel_id:
+                return httpx.Response(200, json={"items": []}, request=request)
+            item = {
+                "id": self.channel_id,
+                "snippet": self.channel_snippet(),
+                "contentDetails": {"relatedPlaylists": {"uploads": self.uploads_playlist_id}},
+            }
+            return httpx.Response(200, json={"items": [item]}, request=request)
+
+        if endpoint == "search" and params.get("type") == "channel":
+            item = {"id": {"channelId": self.channel_id}, "snippet": self.channel_snippet()}
+            return httpx.Response(200, json={"items": [item]}, request=request)
+
+        if endpoint == "search":
+            published_after = params.get("publishedAfter")
+            ids = [
+                n
+                for n in newest_first
+                if n not in self.private_ids
+                and (not published_after or self.video_date(n).isoformat().replace("+00:00", "Z") >= published_after)
+            ]
+            page, next_token = self.page(ids, params)
+            items = [{"id": {"videoId": f"v{n}"}, "snippet": self.video_snippet(n)} for n in page]
+            return httpx.Response(200, json={"items": items, "nextPageToken": next_token}, request=request)
+
+        if endpoint == "playlistItems":
+            if params.get("playlistId") != self.uploads_playlist_id:
+                return httpx.Response(404, json={"error": {"message": "Playlist not found"}}, request=request)
+            page, next_token = self.page(newest_first, params)
+            items = [{"contentDetails": {"videoId": f"v{n}"}} for n in page]
+            return httpx.Response(200, json={"items": items, "nextPageToken": next_token}, request=request)
+
+        if endpoint == "videos":
+            ids = [int(i[1:]) for i in params.get("id", "").split(",") if i[1:].isdigit()]
+            videos = [
+                {"id": f"v{n}", "snippet": self.video_snippet(n)}
+                for n in ids
+                if 1 <= n <= self.videos_count and n not in self.private_ids
+            ]
+            return httpx.Response(200, json={"items": videos}, request=request)
+
+        return httpx.Response(404, json={"error": {"message": "Not found"}}, request=request)
@@ -0,0 +1,189 @@
+import asyncio
+from typing import (
+    Callable,
+)
+
+import httpx
+
+from src import (
+    tg_api,
+    utils,
+)
+from src.base import (
+    ApiChannel,
+)
+from src.metrics import (
+    PARSE_PAGE_SECONDS,
+)
+from src.parsing import (
+    ParsePool,
+    page_parser,
+)
+from src.tg_api import (
+    TGApiChannel,
+)
+from tests.fake_upstream import (
+    TG_PAGE_SIZE,
+    FakeTelegram,
+    async_client_for,
+)
+
+
+def test_async_fetch_same_as_sync(fake_tg, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+
+    sync_channel = TGApiChannel(fake_tg.username)
+    sync_items = sync_channel.fetch_items(entries_count=30)
+
+    async def inner():
+        channel = await TGApiChannel.create(fake_tg.username)
+        return channel, await channel.fetch_items_async(entries_count=30)
+
+    async_channel, async_items = asyncio.run(inner())
+
+    assert async_channel.full_name == sync_channel.full_name == f"Fake {fake_tg.username}"
+    assert len(async_items) == 30
+    assert [i.url for i in async_items] == [i.url for i in sync_items]
+    assert all(a.pub_date > b.pub_date for a, b in zip(async_items, async_items[1:]))
+
+
+def test_async_fetch_all(fake_tg):
+    async def inner():
+        channel = await TGApiChannel.create(fake_tg.username)
+        return await channel.fetch_items_async(fetch_all=True)
+
+    items = asyncio.run(inner())
+    assert len(items) == len([i for i in range(1, 51) if fake_tg.post_text(i)])
+
+
+def test_async_fetch_all_with_parse_pool(fake_tg, monkeypatch):
+    fake_tg.posts_count = 200
+    pool = ParsePool(workers=2)
+    monkeypatch.setattr(tg_api, "parse_pool", pool)
+    parsed_before = PARSE_PAGE_SECONDS.count(parser=page_parser.name)
+
+    async def inner():
+        channel = await TGApiChannel.create(fake_tg.username)
+        return await channel.fetch_items_async(fetch_all=True)
+
+    try:
+        items = asyncio.run(inner())
+        assert pool._executor is not None  # pylint: disable=protected-access
+    finally:
+        pool.shutdown()
+
+    # Observed in this process, though parsed in workers
+    assert PARSE_PAGE_SECONDS.count(parser=page_parser.name) - parsed_before == len(fake_tg.requested_urls)
+
+    expected = [i for i in range(200, 0, -1) if fake_tg.post_text(i)]
+    assert [i.url for i in items] == [f"https://t.me/{fake_tg.username}/{i}" for i in expected]
+
+
+class InFlight:
+    """
+    Slow handler of stand-in requests, counting most requests awaited at once
+    """
+
+    def __init__(self, handle: Callable[[httpx.Request], httpx.Response], delay: float = 0.01):
+        self.handle = handle
+        self.delay = delay
+        self.current = 0
+        self.max = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.current += 1
+        self.max = max(self.max, self.current)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.current -= 1
+        return self.handle(request)
+
+
+def test_async_fetch_does_not_block(monkeypatch):
+    channels = [FakeTelegram(username=f"chan{i}") for i in range(5)]
+    by_path = {f"/s/{c.username}": c for c in channels}
+    in_flight = InFlight(lambda request: by_path[request.url.path].handle(request))
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(in_flight))
+    utils.http_cache.clear()
+
+    async def fetch(username):
+        channel = await TGApiChannel.create(username)
+        return await channel.fetch_items_async()
+
+    async def inner():
+        return await asyncio.gather(*[fetch(c.username) for c in channels])
+
+    results = asyncio.run(inner())
+
+    assert all(len(r) > 0 for r in results)
+    assert in_flight.max == len(channels)  # Each channel waits for upstream while others do
+
+
+def fetch_all_tracked(fake: FakeTelegram, monkeypatch) -> tuple[list[str], int, int]:
+    """
+    :returns: Urls of fetched items, count of requests, and most requests awaited at once
+    """
+    in_flight = InFlight(fake.handle)
+    monkeypatch.setattr(utils, "_async_client", async_client_for(in_flight))
+    utils.http_cache.clear()
+    fake.requested_urls.clear()
+
+    async def inner():
+        channel = await TGApiChannel.create(fake.username)
+        return await channel.fetch_items_async(fetch_all=True)
+
+    items = asyncio.run(inner())
+    return [i.url for i in items], len(fake.requested_urls), in_flight.max
+
+
+def test_parallel_pages_same_as_serial(monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    fake = FakeTelegram(posts_count=200)
+
+    monkeypatch.setattr(tg_api, "TG_PARALLEL_PAGES", 1)
+    serial_urls, serial_requests, serial_in_flight = fetch_all_tracked(fake, monkeypatch)
+
+    monkeypatch.setattr(tg_api, "TG_PARALLEL_PAGES", 4)
+    urls, requests, in_flight = fetch_all_tracked(fake, monkeypatch)
+
+    assert urls == serial_urls
+    assert len(urls) == len([i for i in range(1, 201) if fake.post_text(i)])
+    assert requests == serial_requests
+    assert serial_in_flight == 1
+    assert 1 < in_flight <= 4
+
+
+def test_parallel_pages_with_deleted_messages(monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    monkeypatch.setattr(tg_api, "TG_PARALLEL_PAGES", 4)
+    deleted = {*range(150, 158), 131, 97, *range(40, 75)}
+    fake = FakeTelegram(posts_count=200, deleted_ids=deleted)
+
+    urls, _, _ = fetch_all_tracked(fake, monkeypatch)
+
+    expected_ids = [i for i in range(200, 0, -1) if i not in deleted and fake.post_text(i)]
+    assert urls == [f"https://t.me/{fake.username}/{i}" for i in expected_ids]
+
+
+def test_date_window_sought(monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    fake = FakeTelegram(posts_count=2000)
+    after_date = fake.post_date(1801).date()
+
+    async def inner():
+        channel = await TGApiChannel.create(fake.username)
+        return await channel.fetch_items_async(after_date=after_date)
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(fake.handle))
+    utils.http_cache.clear()
+    items = asyncio.run(inner())
+
+    expected_ids = [i for i in range(2000, 1800, -1) if fake.post_text(i)]
+    assert [i.url for i in items] == [f"https://t.me/{fake.username}/{i}" for i in expected_ids]
+
+    cursors = sorted({tg_api.before_cursor(i) or fake.posts_count + 1 for i in fake.requested_urls}, reverse=True)
+    window_cursors = [i for i in cursors if i > 1801 - TG_PAGE_SIZE]
+    assert len(window_cursors) == 11  # All pages of window are fetched once
+    assert len(cursors) - len(window_cursors) <= 8  # Probes outside of window are logarithmic
@@ -0,0 +1,33 @@
+from benchmarks.bench import (
+    BASELINE_PATH,
+    SPEEDUPS,
+    Upstream,
+    check_speedups,
+    load_baseline,
+    measure_memory,
+    memory_stages,
+    offline_env,
+    stages,
+)
+
+
+def test_benchmark_stages_run_offline():
+    upstream = Upstream()
+    with offline_env(upstream):
+        bench_stages = stages(upstream)
+        for func in bench_stages.values():
+            func()
+
+    bench_memory_stages = memory_stages()
+    assert all(measure_memory(i) > 0 for i in bench_memory_stages.values())
+
+    assert all(fast in bench_stages and slow in bench_stages for fast, slow, _ in SPEEDUPS)
+
+    # Baseline is updated with stages
+    assert set(bench_stages) | set(bench_memory_stages) == set(load_baseline(BASELINE_PATH))
+
+
+def test_speedups_checked():
+    speedups = [("fast", "slow", 3.0), ("fast", "missing", 2.0)]
+    assert check_speedups({"fast": 1.0, "slow": 4.0}, speedups) == []
+    assert check_speedups({"fast": 1.0, "slow": 2.0}, speedups) == ["fast"]
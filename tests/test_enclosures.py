@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src import (
+    enclosures,
+)
+from src.enclosures import (
+    EnclosureInfo,
+    EnclosuresCache,
+    probe_enclosures,
+)
+from src.metrics import (
+    ENCLOSURE_PROBES,
+)
+
+GIF_BYTES = b"GIF89a" + b"\x00" * 4000
+
+
+@pytest.fixture
+def media_server(monkeypatch, tmp_path):
+    monkeypatch.setattr(enclosures, "enclosures_cache", EnclosuresCache(str(tmp_path / "enclosures.sqlite")))
+    requests: list[tuple[str, str, str | None]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.method, request.url.path, request.headers.get("range")))
+
+        if request.url.path == "/with_headers.jpg":
+            return httpx.Response(200, headers={"content-type": "image/jpeg", "content-length": "12345"})
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-type": "application/octet-stream"})
+        return httpx.Response(
+            206,
+            content=GIF_BYTES[:2048],
+            headers={"content-range": f"bytes 0-2047/{len(GIF_BYTES)}"},
+        )
+
+    yield httpx.AsyncClient(transport=httpx.MockTransport(handler)), requests
+
+
+def test_probe_enclosures(media_server):
+    client, requests = media_server
+    urls = ["https://cdn.example.com/with_headers.jpg", "https://cdn.example.com/no_headers"] * 3
+    probes_before = ENCLOSURE_PROBES.value(result="head"), ENCLOSURE_PROBES.value(result="range")
+
+    res = asyncio.run(probe_enclosures(urls, client=client))
+
+    assert res == {
+        "https://cdn.example.com/with_headers.jpg": EnclosureInfo("image/jpeg", 12345),
+        "https://cdn.example.com/no_headers": EnclosureInfo("image/gif", len(GIF_BYTES)),
+    }
+    assert ("GET", "/no_headers", "bytes=0-2047") in requests
+    assert not any(method == "GET" and path == "/with_headers.jpg" for method, path, _ in requests)
+    assert (ENCLOSURE_PROBES.value(result="head"), ENCLOSURE_PROBES.value(result="range")) == (
+        probes_before[0] + 1,
+        probes_before[1] + 1,
+    )
+
+    # --- Probed urls are served from cache ---
+
+    requests.clear()
+    assert asyncio.run(probe_enclosures(urls, client=client)) == res
+    assert not requests
+
+
+def test_probe_enclosure_range_ignored():
+    chunks_sent = []
+
+    async def body():
+        for _ in range(100):
+            chunks_sent.append(1)
+            yield GIF_BYTES[:1024]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "HEAD":
+            return httpx.Response(200)
+        return httpx.Response(200, content=body(), headers={"content-length": str(100 * 1024)})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    res = asyncio.run(enclosures.probe_enclosure("https://cdn.example.com/big.gif", client))
+
+    assert res == EnclosureInfo("image/gif", 100 * 1024)
+    assert len(chunks_sent) < 100  # Only head of the file is read
+
+
+def test_enclosures_cache_max_entries(tmp_path):
+    cache = EnclosuresCache(str(tmp_path / "enclosures.sqlite"), max_entries=2)
+    for i in range(3):
+        cache.put(f"https://cdn.example.com/{i}", EnclosureInfo("image/jpeg", i))
+
+    urls = [f"https://cdn.example.com/{i}" for i in range(3)]
+    assert set(cache.get_many(urls)) == set(urls[1:])
@@ -0,0 +1,174 @@
+import asyncio
+import datetime
+import os
+
+import feedparser  # type: ignore
+import httpx
+from fastapi.testclient import (
+    TestClient,
+)
+
+from src import (
+    main,
+    utils,
+)
+from src.main import (
+    AggregateParams,
+    FeedParams,
+    app,
+    refresh_feed,
+)
+from src.scheduler import (
+    RefreshScheduler,
+)
+from src.utils import (
+    RssBridgeType,
+)
+from tests.fake_upstream import (
+    FakeTelegram,
+    async_client_for,
+)
+
+client = TestClient(app)
+
+
+def test_conditional_feed_request(fake_tg):
+    url = f"/rss-feed/{fake_tg.username}?count=10"
+
+    resp = client.get(url)
+    assert resp.status_code == 200
+    etag = resp.headers["etag"]
+    assert resp.headers["last-modified"]
+
+    fake_tg.requested_urls.clear()
+
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert not fake_tg.requested_urls
+
+    resp = client.get(url, headers={"If-Modified-Since": resp.headers["last-modified"]})
+    assert resp.status_code == 304
+
+    resp = client.get(f"/rss-feed/{fake_tg.username}?count=11", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+
+def test_concurrent_identical_requests_coalesced(monkeypatch):
+    delay = 0.1
+    fake = FakeTelegram()
+
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delay)
+        return fake.handle(request)
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(slow_handler))
+    utils.http_cache.clear()
+
+    async def inner():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            return await asyncio.gather(*[c.get(f"/rss-feed/{fake.username}?count=5") for _ in range(10)])
+
+    responses = asyncio.run(inner())
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.headers["etag"] for r in responses}) == 1
+    assert len(fake.requested_urls) == 1  # Metadata page is reused as first items page
+
+
+def test_concurrent_requests_in_different_formats_share_fetch(monkeypatch):
+    fake = FakeTelegram()
+
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.1)
+        return fake.handle(request)
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(slow_handler))
+    utils.http_cache.clear()
+
+    async def inner():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            urls = [f"/rss-feed/{fake.username}?count=5&rss_format={i}" for i in ("atom", "rss", "atom", "rss")]
+            return await asyncio.gather(*[c.get(i) for i in urls])
+
+    responses = asyncio.run(inner())
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.headers["etag"] for r in responses}) == 2  # Validators still differ by format
+    assert len(fake.requested_urls) == 1
+
+
+def test_rendered_feed_is_reused(fake_tg, isolated_feed_store):
+    url = f"/rss-feed/{fake_tg.username}?count=10&rss_format=rss"
+
+    first = client.get(url)
+    second = client.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+    assert len(os.listdir(isolated_feed_store.path)) == 1
+
+
+def test_refreshed_feed_served_without_fetch(fake_tg):
+    params = FeedParams(fake_tg.username, count=7)
+    asyncio.run(refresh_feed(params))
+    fake_tg.requested_urls.clear()
+
+    resp = client.get(f"/rss-feed/{fake_tg.username}?count=7")
+
+    assert resp.status_code == 200
+    assert resp.headers["etag"]
+    assert resp.content.count(b"<entry>") == 7
+    assert not fake_tg.requested_urls
+
+
+def test_only_existing_feeds_tracked(fake_tg, monkeypatch):
+    scheduler: RefreshScheduler[FeedParams] = RefreshScheduler(refresh_feed)
+    monkeypatch.setattr(main, "refresh_scheduler", scheduler)
+
+    assert client.get("/rss-feed/no_such_channel?count=5").status_code != 200
+    assert client.get(f"/rss-feed/{fake_tg.username}?count=5").status_code == 200
+
+    assert list(scheduler.feeds) == [FeedParams(fake_tg.username, count=5)]
+
+
+def test_aggregated_feed(monkeypatch):
+    fakes = {
+        i.username: i
+        for i in [
+            FakeTelegram("first_channel", posts_count=40, post_interval=datetime.timedelta(hours=5)),
+            FakeTelegram("second_channel", posts_count=40, post_interval=datetime.timedelta(hours=7)),
+        ]
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        username = request.url.path.split("/")[2]
+        return fakes[username].handle(request)
+
+    monkeypatch.setattr(utils, "_async_client", async_client_for(handler))
+    utils.http_cache.clear()
+    scheduler: RefreshScheduler[FeedParams | AggregateParams] = RefreshScheduler(refresh_feed)
+    monkeypatch.setattr(main, "refresh_scheduler", scheduler)
+
+    count = 25
+    resp = client.get(f"/rss-feed-aggregate?channels=first_channel&channels=tg:second_channel&count={count}")
+    assert resp.status_code == 200
+
+    # Tracked as a whole, so refresh updates the feed readers get
+    aggregate = AggregateParams.from_specs(["first_channel", "tg:second_channel"], count=count)
+    assert list(scheduler.feeds) == [aggregate]
+
+    feed = feedparser.parse(resp.content)
+    assert len(feed.entries) == count
+
+    dates = [i.published_parsed for i in feed.entries]
+    assert dates == sorted(dates, reverse=True)
+    assert {i.link.split("/")[3] for i in feed.entries} == set(fakes)
+
+    resp = client.get(f"/rss-feed-aggregate?count={count}", params={"channels": ["unknown:first_channel"]})
+    assert resp.status_code == 405
+
+    yt_link = "https://www.youtube.com/channel/UC1234"
+    params = AggregateParams.from_specs([f"yt:{yt_link}", "https://t.me/first_channel"])
+    assert params.channels == (FeedParams(yt_link, RssBridgeType.YT), FeedParams("https://t.me/first_channel"))
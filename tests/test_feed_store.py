@@ -0,0 +1,45 @@
+import os
+import time
+
+import pytest
+
+from src.feed_store import (
+    FeedStore,
+)
+
+
+def test_write_is_atomic(tmp_path):
+    store = FeedStore(str(tmp_path / "store"), max_bytes=10**6)
+    key = store.key("channel", "atom")
+
+    def chunks():
+        yield "<feed>"
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        store.write(key, chunks())
+
+    assert store.open(key) is None
+    assert not os.listdir(store.path)
+
+    store.write(key, ["<feed>", "</feed>"])
+    stored = store.open(key)
+
+    store.write(key, ["<feed>new</feed>"])  # Already opened file is not affected
+    assert stored.read() == b"<feed></feed>"
+    stored.close()
+
+
+def test_lru_eviction(tmp_path):
+    store = FeedStore(str(tmp_path / "store"), max_bytes=250)
+
+    for i in range(3):
+        store.write(store.key(i), ["x" * 100])
+        os.utime(store.path_for(store.key(i)), (time.time() - 100 + i, time.time() - 100 + i))
+
+    assert store.open(store.key(0)) is None  # Oldest evicted
+    store.open(store.key(1)).close()  # Now most recently used
+
+    store.write(store.key(3), ["x" * 100])
+    assert store.open(store.key(2)) is None
+    assert {i for i in range(4) if os.path.exists(store.path_for(store.key(i)))} == {1, 3}
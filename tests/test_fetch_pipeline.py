@@ -0,0 +1,49 @@
+from src.tg_api import (
+    TGApiChannel,
+)
+
+
+def test_long_run_of_skipped_posts(fake_tg, monkeypatch):
+    fake_tg.posts_count = 1500
+    monkeypatch.setattr(fake_tg, "post_text", lambda post_id: "Text" if post_id > 1490 else None)
+
+    channel = TGApiChannel(fake_tg.username)
+    items = channel.fetch_items(fetch_all=True)  # Deeper than recursion limit, if items are skipped recursively
+
+    assert [i.url for i in items] == [f"https://t.me/{fake_tg.username}/{i}" for i in range(1500, 1490, -1)]
+
+
+def test_items_yielded_lazily(fake_tg):
+    channel = TGApiChannel(fake_tg.username)
+    fake_tg.requested_urls.clear()
+
+    items = channel.iter_items(fetch_all=True)
+    assert next(items).url == f"https://t.me/{fake_tg.username}/50"
+    assert not fake_tg.requested_urls  # First page is fetched with metadata
+
+    assert len(list(items)) == len([i for i in range(1, 50) if fake_tg.post_text(i)])
+
+
+def test_page_without_more_tag(fake_tg):
+    fake_tg.posts_count = 15
+    fake_tg.with_more_tag = False
+
+    channel = TGApiChannel(fake_tg.username)
+    urls = [i.url for i in channel.fetch_items(fetch_all=True)]
+
+    assert len(urls) == len(set(urls)) == len([i for i in range(1, 16) if fake_tg.post_text(i)])
+
+
+def test_metadata_page_reused_and_cached(fake_tg):
+    channel = TGApiChannel(fake_tg.username)
+    channel.fetch_items(entries_count=5)
+    assert fake_tg.requested_urls == [channel.url]
+
+    fake_tg.requested_urls.clear()
+    cached = TGApiChannel(fake_tg.username)
+    assert (cached.full_name, cached.logo_url, cached.description) == (
+        channel.full_name,
+        channel.logo_url,
+        channel.description,
+    )
+    assert not fake_tg.requested_urls
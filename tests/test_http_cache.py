@@ -0,0 +1,77 @@
+import time
+
+import httpx
+import pytest
+
+from src import (
+    utils,
+)
+from src.http_cache import (
+    HttpCache,
+    make_backend,
+    parse_ttl_rules,
+)
+from tests.fake_upstream import (
+    FakeSession,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite", "filesystem"])
+def backend(request, tmp_path):
+    return make_backend(request.param, str(tmp_path / "http_cache"), max_bytes=3000)
+
+
+def test_backend_expiration_and_lru_eviction(backend):
+    backend.set("expired", b"x", ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get("expired") is None
+
+    for i in range(3):
+        backend.set(f"k{i}", bytes([i]) * 900, ttl=60)
+        time.sleep(0.01)  # Distinct access times
+    assert backend.get("k0") == bytes([0]) * 900
+
+    if backend.name == "sqlite":
+        backend.TOUCH_INTERVAL = 0
+        assert backend.get("k0")
+
+    time.sleep(0.01)
+    backend.set("k3", b"3" * 900, ttl=60)  # Over the limit, least recently used is evicted
+
+    assert backend.get("k1") is None
+    assert backend.get("k0") is not None
+    assert backend.get("k3") == b"3" * 900
+
+
+def test_ttl_rules():
+    cache = HttpCache(
+        make_backend("memory", "", 1024),
+        default_ttl=300,
+        ttl_rules=parse_ttl_rules("t.me=600, www.googleapis.com/youtube/v3/search=120,www.googleapis.com=900"),
+    )
+
+    assert cache.ttl_for("https://t.me/s/channel?before=10") == 600
+    assert cache.ttl_for("https://www.googleapis.com/youtube/v3/search?q=x") == 120
+    assert cache.ttl_for("https://www.googleapis.com/youtube/v3/videos") == 900
+    assert cache.ttl_for("https://example.com/") == 300
+
+
+def test_logged_get_served_from_cache(monkeypatch):
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        if request.url.path == "/missing":
+            return httpx.Response(404, request=request)
+        return httpx.Response(200, json={"page": request.url.params["page"]}, request=request)
+
+    monkeypatch.setattr(utils, "session", FakeSession(handler))
+
+    assert utils.logged_get("https://example.com/api", params={"page": 1}).json() == {"page": "1"}
+    cached = utils.logged_get("https://example.com/api?page=1")
+    assert (cached.status_code, cached.json()) == (200, {"page": "1"})
+    assert len(requested) == 1
+
+    utils.logged_get("https://example.com/missing")
+    utils.logged_get("https://example.com/missing")
+    assert len(requested) == 3  # Errors are not cached
@@ -0,0 +1,63 @@
+from src import (
+    utils,
+)
+from src.tg_api import (
+    TGApiChannel,
+    TGPost,
+)
+
+
+def test_refresh_stops_at_stored_item(fake_tg):
+    fake_tg.posts_count = 100
+    channel = TGApiChannel(fake_tg.username)
+
+    all_items = channel.fetch_items(fetch_all=True)
+    assert len(all_items) == len([i for i in range(1, 101) if fake_tg.post_text(i)])
+
+    # --- New posts appeared, history is already stored ---
+
+    fake_tg.posts_count = 103
+    fake_tg.requested_urls.clear()
+    utils.http_cache.clear()  # Cached pages expired
+
+    refreshed = channel.fetch_items(fetch_all=True)
+    assert len(fake_tg.requested_urls) == 1
+    assert [i.url for i in refreshed] == [i.url for i in channel.fetch_items(fetch_all=True)]
+    assert [i.url for i in refreshed[3:]] == [i.url for i in all_items]
+
+    fake_tg.requested_urls.clear()
+    utils.http_cache.clear()
+    assert len(channel.fetch_items(entries_count=50)) == 50
+    assert len(fake_tg.requested_urls) == 1
+
+
+def test_store_is_not_used_when_insufficient(fake_tg):
+    channel = TGApiChannel(fake_tg.username)
+    channel.fetch_items(entries_count=5)
+
+    fake_tg.requested_urls.clear()
+    utils.http_cache.clear()
+    items = channel.fetch_items(entries_count=30)
+
+    assert len(items) == 30
+    assert len(fake_tg.requested_urls) == 2
+    assert all(a.pub_date > b.pub_date for a, b in zip(items, items[1:]))
+
+
+def test_gap_replaces_stored_items(fake_tg, isolated_item_store):
+    channel = TGApiChannel(fake_tg.username)
+    channel.fetch_items(entries_count=5)
+
+    fake_tg.posts_count = 120
+    items = channel.fetch_items(entries_count=10)
+
+    assert isolated_item_store.count_older(channel.store_key, None) == 10
+    assert [i.url for i in isolated_item_store.query(channel.store_key, channel.ItemClass)] == [i.url for i in items]
+
+
+def test_stored_items_restored(fake_tg, isolated_item_store):
+    channel = TGApiChannel(fake_tg.username)
+    items = channel.fetch_items(entries_count=10)
+    assert not hasattr(items[0], "__dict__")  # Slotted
+
+    assert isolated_item_store.query(channel.store_key, TGPost) == items
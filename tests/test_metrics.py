@@ -0,0 +1,95 @@
+import asyncio
+
+from fastapi.testclient import (
+    TestClient,
+)
+
+from src.main import (
+    app,
+)
+from src.metrics import (
+    FEED_ITEMS,
+    FEED_RESPONSES,
+    HTTP_CACHE_REQUESTS,
+    PARSE_PAGE_SECONDS,
+    RENDER_SECONDS,
+    SERVED_BYTES,
+    TG_PAGE_RETRIES,
+    UPSTREAM_REQUEST_SECONDS,
+    UPSTREAM_RESPONSES,
+    Histogram,
+)
+from src.tg_api import (
+    TGApiChannel,
+)
+
+client = TestClient(app)
+
+
+def test_histogram_exposition():
+    histogram = Histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1))
+    for i in (0.05, 0.1, 0.5, 3):
+        histogram.observe(i, stage="parse")
+
+    assert histogram.render().splitlines() == [
+        "# HELP test_seconds Test histogram",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="parse",le="0.1"} 2',
+        'test_seconds_bucket{stage="parse",le="1"} 3',
+        'test_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'test_seconds_sum{stage="parse"} 3.65',
+        'test_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_feed_request_metrics(fake_tg):
+    before = {
+        "upstream": UPSTREAM_REQUEST_SECONDS.count(host="t.me"),
+        "responses": UPSTREAM_RESPONSES.value(host="t.me", status="200"),
+        "misses": HTTP_CACHE_REQUESTS.value(result="miss"),
+        "hits": HTTP_CACHE_REQUESTS.value(result="hit"),
+        "parse": PARSE_PAGE_SECONDS.count(parser="lxml"),
+        "items": FEED_ITEMS.count(bridge_type="tg"),
+        "render": RENDER_SECONDS.count(format="rss"),
+        "served": SERVED_BYTES.count(format="rss"),
+        "rendered": FEED_RESPONSES.value(result="rendered"),
+        "stored": FEED_RESPONSES.value(result="stored"),
+    }
+
+    resp = client.get(f"/rss-feed/{fake_tg.username}?count=30&rss_format=rss")
+    assert resp.status_code == 200
+    pages = len(fake_tg.requested_urls)
+
+    assert UPSTREAM_REQUEST_SECONDS.count(host="t.me") - before["upstream"] == pages
+    assert UPSTREAM_RESPONSES.value(host="t.me", status="200") - before["responses"] == pages
+    assert HTTP_CACHE_REQUESTS.value(result="miss") - before["misses"] == pages
+    assert PARSE_PAGE_SECONDS.count(parser="lxml") - before["parse"] >= pages
+    assert FEED_ITEMS.count(bridge_type="tg") - before["items"] == 1
+    assert RENDER_SECONDS.count(format="rss") - before["render"] == 1
+    assert SERVED_BYTES.count(format="rss") - before["served"] == 1
+    assert FEED_RESPONSES.value(result="rendered") - before["rendered"] == 1
+
+    resp = client.get(f"/rss-feed/{fake_tg.username}?count=30&rss_format=rss")
+    assert resp.status_code == 200
+    assert FEED_RESPONSES.value(result="stored") - before["stored"] == 1
+
+    resp = client.get(f"/rss-feed/{fake_tg.username}?count=31&rss_format=rss")  # Pages are cached
+    assert resp.status_code == 200
+    assert HTTP_CACHE_REQUESTS.value(result="hit") - before["hits"] >= 1
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'rss_bridge_served_bytes_count{format="rss"}' in metrics.text
+    assert 'rss_bridge_upstream_responses_total{host="t.me",status="200"}' in metrics.text
+
+
+def test_tg_page_retries_counted(fake_tg):
+    fake_tg.with_more_tag = False  # Page without link to other messages is fetched again
+    before = TG_PAGE_RETRIES.value()
+
+    TGApiChannel(fake_tg.username).fetch_items()
+    assert TG_PAGE_RETRIES.value() - before == 1
+
+    asyncio.run(TGApiChannel(fake_tg.username).fetch_items_async(entries_count=10))
+    assert TG_PAGE_RETRIES.value() - before == 2
@@ -0,0 +1,73 @@
+import datetime
+import gc
+
+import bs4
+import pytest
+
+from src.parsing import (
+    BS4PageParser,
+    LxmlPageParser,
+    html_to_text,
+)
+from tests.fake_upstream import (
+    FakeTelegram,
+)
+
+lxml_parser = LxmlPageParser()
+bs4_parser = BS4PageParser()
+
+
+@pytest.mark.parametrize("before, with_avatar", [(None, True), (41, True), (15, True), (None, False)])
+def test_lxml_parser_parity(before, with_avatar):
+    html = FakeTelegram(posts_count=60, with_avatar=with_avatar).render_page(before)
+
+    bs4_page = bs4_parser.parse_page(html)
+    lxml_page = lxml_parser.parse_page(html)
+
+    assert lxml_page.has_more_tag == bs4_page.has_more_tag
+    assert lxml_page.next_page_href == bs4_page.next_page_href
+    assert len(lxml_page.posts) == len(bs4_page.posts) > 0
+
+    assert lxml_page.posts == bs4_page.posts
+    assert all(i.post_id is not None for i in bs4_page.posts)
+    assert any(i.fields is None for i in bs4_page.posts)  # Posts without text
+    assert any(i.fields and i.fields.preview.media_url for i in bs4_page.posts)  # Posts with preview image
+    assert all(html_to_text(i.fields.html) == i.fields.text for i in lxml_page.posts if i.fields)
+
+    assert lxml_parser.parse_metadata(html) == bs4_parser.parse_metadata(html)
+    assert lxml_page.metadata == bs4_page.metadata == bs4_parser.parse_metadata(html)
+    assert bool(lxml_page.metadata and lxml_page.metadata.logo_url) == with_avatar
+
+
+def test_lxml_parser_metadata_not_found():
+    assert lxml_parser.parse_metadata("<html><body></body></html>") is None
+    assert bs4_parser.parse_metadata("<html><body></body></html>") is None
+
+
+def count_tree_elements() -> int:
+    """Elements of bs4 trees (empty soup object, collected by gc later, is not counted)"""
+    return sum(isinstance(i, bs4.PageElement) and not isinstance(i, bs4.BeautifulSoup) for i in gc.get_objects())
+
+
+def plain_values(value) -> bool:
+    """Record consists of builtin values only (e.g. no str subclasses with links to page tree)"""
+    if isinstance(value, tuple):
+        return all(plain_values(i) for i in value)
+    return value is None or type(value) in (str, int, datetime.datetime)
+
+
+@pytest.mark.parametrize("parser", [bs4_parser, lxml_parser], ids=["bs4", "lxml"])
+def test_page_tree_released_after_parsing(parser):
+    html = FakeTelegram(posts_count=60).render_page()
+
+    gc.collect()
+    gc.disable()  # Tree must be freed by reference counting
+    try:
+        before = count_tree_elements()
+        page = parser.parse_page(html)
+        after = count_tree_elements()
+    finally:
+        gc.enable()
+
+    assert after == before
+    assert all(plain_values(i) for i in page.posts)
@@ -0,0 +1,51 @@
+import feedparser  # type: ignore  # noqa
+import pytest
+
+from src.enclosures import (
+    EnclosureInfo,
+)
+from src.rss import (
+    stream_feed,
+)
+from src.tg_api import (
+    TGApiChannel,
+)
+from src.utils import (
+    RssFormat,
+)
+from src.yt_api import (
+    YTVideo,
+)
+
+
+@pytest.mark.parametrize("rss_format", [RssFormat.ATOM, RssFormat.RSS])
+def test_stream_feed_is_parsed_by_feedparser(fake_tg, rss_format):
+    channel = TGApiChannel(fake_tg.username)
+    items = channel.fetch_items(entries_count=15)
+    items[0].title = "Control \x0b chars & <tags>"
+
+    enclosures = {i.preview_media_url: EnclosureInfo("image/jpeg", 100) for i in items if i.preview_media_url}
+    assert enclosures
+
+    chunks = list(stream_feed(channel, iter(items), rss_format=rss_format, enclosures=enclosures))
+    assert len(chunks) == len(items) + 3  # Declaration, header, entries, footer
+
+    parsed = feedparser.parse("".join(chunks))
+    assert not parsed.bozo
+    assert parsed.feed.title.endswith(channel.full_name)
+    assert [i.link for i in parsed.entries] == [i.url for i in items]
+    assert parsed.entries[0].title == "Control  chars & <tags>"
+
+    for entry, item in zip(parsed.entries, items):
+        assert entry.published_parsed[:6] == item.pub_date.utctimetuple()[:6]
+        assert bool(entry.get("enclosures")) == bool(item.preview_media_url)
+
+
+@pytest.mark.parametrize("rss_format", [RssFormat.ATOM, RssFormat.RSS])
+def test_stream_feed_item_without_content(fake_tg, rss_format):
+    channel = TGApiChannel(fake_tg.username)
+    items = [YTVideo(url="https://example.com/1", pub_date=None, title="No description", description="")]
+
+    parsed = feedparser.parse("".join(stream_feed(channel, items, rss_format=rss_format)))
+    assert not parsed.bozo
+    assert [i.title for i in parsed.entries] == ["No description"]
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from src.conditional import (
+    FeedValidatorsCache,
+)
+from src.metrics import (
+    FEED_REFRESHES,
+)
+from src.scheduler import (
+    RefreshScheduler,
+)
+
+
+def test_tracked_feeds_refreshed_with_concurrency_cap():
+    refreshed: list[str] = []
+    running = 0
+    max_running = 0
+
+    async def refresh(key: str):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        refreshed.append(key)
+
+    async def inner():
+        scheduler = RefreshScheduler(refresh, interval=0.05, jitter=0, max_concurrency=2)
+        for i in "abcde":
+            scheduler.track(i)
+
+        scheduler.start(tick=0.01)
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+
+    asyncio.run(inner())
+
+    assert set(refreshed) == set("abcde")
+    assert refreshed.count("a") > 1
+    assert max_running == 2
+
+
+def test_unpopular_and_stale_feeds_forgotten():
+    async def refresh(_):
+        pass
+
+    scheduler = RefreshScheduler(refresh, max_feeds=2, forget_after=0.05)
+    scheduler.track("popular")
+    scheduler.track("popular")
+    scheduler.track("old")
+    scheduler.track("new")
+    assert set(scheduler.feeds) == {"popular", "new"}
+
+    asyncio.run(asyncio.sleep(0.06))
+    scheduler.track("popular")
+    scheduler.due()
+    assert set(scheduler.feeds) == {"popular"}
+
+
+def test_refresh_due_before_validators_expire():
+    async def refresh(_):
+        pass
+
+    scheduler = RefreshScheduler(refresh)
+    ttl = FeedValidatorsCache().ttl
+    for i in range(100):
+        scheduler.track(i)
+
+    now = time.monotonic()
+    assert all(now < i.next_refresh < now + ttl for i in scheduler.feeds.values())
+
+
+def test_refresh_failures_counted_and_logged(caplog):
+    async def refresh(key: str):
+        if key == "broken":
+            raise ValueError("upstream is down")
+
+    async def inner():
+        scheduler = RefreshScheduler(refresh, interval=0.05, jitter=0)
+        scheduler.track("ok")
+        scheduler.track("broken")
+
+        scheduler.start(tick=0.01)
+        await asyncio.sleep(0.08)
+        await scheduler.stop()
+
+    before = {i: FEED_REFRESHES.value(result=i) for i in ("done", "failed")}
+    asyncio.run(inner())
+
+    failed = FEED_REFRESHES.value(result="failed") - before["failed"]
+    assert failed >= 1
+    assert FEED_REFRESHES.value(result="done") - before["done"] >= 1
+    assert [i.exc_info[0] for i in caplog.records if "broken" in i.getMessage()] == [ValueError] * int(failed)
+
+
+def test_denied_refresh_skipped():
+    refreshed: list[str] = []
+
+    async def refresh(key: str):
+        refreshed.append(key)
+
+    async def inner():
+        scheduler = RefreshScheduler(refresh, interval=0.03, jitter=0, can_refresh=lambda key: key != "denied")
+        scheduler.track("allowed")
+        scheduler.track("denied")
+
+        scheduler.start(tick=0.01)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+    before = FEED_REFRESHES.value(result="skipped")
+    asyncio.run(inner())
+
+    assert "allowed" in refreshed and "denied" not in refreshed
+    assert FEED_REFRESHES.value(result="skipped") - before >= 1
@@ -0,0 +1,117 @@
+import concurrent.futures
+import datetime
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from src import (
+    utils,
+)
+from src.conditional import (
+    FeedValidators,
+    FeedValidatorsCache,
+)
+from src.enclosures import (
+    EnclosureInfo,
+    EnclosuresCache,
+)
+from src.http_cache import (
+    make_backend,
+)
+from src.metadata_cache import (
+    MetadataCache,
+)
+from src.store import (
+    ItemStore,
+)
+from src.yt_quota import (
+    QuotaExceeded,
+    QuotaManager,
+)
+
+
+def test_run_identifier_inherited_by_workers():
+    assert os.environ["RUN_IDENTIFIER"] == utils.RUN_IDENTIFIER
+
+    worker = subprocess.run(
+        [sys.executable, "-c", "from src.utils import RUN_IDENTIFIER; print(RUN_IDENTIFIER)"],
+        cwd=utils.SRC_PATH,
+        env={**os.environ, "PYTHONPATH": utils.SRC_PATH},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert worker.stdout.strip() == utils.RUN_IDENTIFIER
+
+
+@pytest.mark.parametrize("backend_name", ["sqlite", "filesystem"])
+def test_caches_shared_by_workers(tmp_path, backend_name):
+    path = str(tmp_path / "shared_cache")
+    # Each worker process opens its own backend
+    worker_a, worker_b = (make_backend(backend_name, path, 1024 * 1024, report_metrics=False) for _ in range(2))
+
+    validators = FeedValidators('W/"abc"', datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+    FeedValidatorsCache(backend=worker_a).put("durov|rss", validators)
+    assert FeedValidatorsCache(backend=worker_b).get("durov|rss") == validators
+    assert FeedValidatorsCache(backend=worker_b).get("durov|atom") is None
+
+    MetadataCache(backend=worker_a).put("TGApiChannel:durov", {"full_name": "Durov", "logo_url": None})
+    assert MetadataCache(backend=worker_b).get("TGApiChannel:durov") == {"full_name": "Durov", "logo_url": None}
+    assert MetadataCache(backend=worker_b, namespace="yt_videos").get("TGApiChannel:durov") is None
+
+
+def test_quota_shared_by_workers(tmp_path):
+    path = str(tmp_path / "yt_quota.sqlite")
+    worker_a, worker_b = (QuotaManager(keys=["x"], daily_quota=150, reserve=0, path=path) for _ in range(2))
+
+    assert worker_a.acquire(100) == "x"
+    assert worker_b.remaining("x") == 50
+
+    with pytest.raises(QuotaExceeded):
+        worker_b.acquire(100)
+
+    worker_b.exhaust("x")
+    assert worker_a.remaining("x") == 0
+
+
+def test_quota_not_overspent_by_concurrent_workers(tmp_path):
+    path = str(tmp_path / "yt_quota.sqlite")
+    workers = [QuotaManager(keys=["x"], daily_quota=500, reserve=0, path=path) for _ in range(8)]
+    barrier = threading.Barrier(len(workers))
+
+    def call(worker: QuotaManager) -> bool:
+        barrier.wait()
+        try:
+            worker.acquire(100)
+        except QuotaExceeded:
+            return False
+        return True
+
+    with concurrent.futures.ThreadPoolExecutor(len(workers)) as executor:
+        acquired = list(executor.map(call, workers))
+
+    assert sum(acquired) == 5
+    assert workers[0].remaining("x") == 0
+
+
+def test_stores_shared_by_workers(tmp_path):
+    items_a, items_b = (ItemStore(str(tmp_path / "items_store.sqlite")) for _ in range(2))
+    enclosures_a, enclosures_b = (EnclosuresCache(str(tmp_path / "enclosures.sqlite")) for _ in range(2))
+    url = "https://cdn.example.com/a.jpg"
+
+    # Pending write of one worker does not block reads of other one
+    # pylint: disable=protected-access
+    with items_a._conn, enclosures_a._conn:
+        items_a._conn.execute("BEGIN EXCLUSIVE")
+        items_a._conn.execute("INSERT INTO channels VALUES (?, 1)", ("durov",))
+        enclosures_a._conn.execute("BEGIN EXCLUSIVE")
+        enclosures_a._conn.execute("INSERT INTO enclosures VALUES (?, ?, ?)", (url, "image/jpeg", 10))
+
+        assert not items_b.is_complete("durov")
+        assert not enclosures_b.get_many([url])
+
+    assert items_b.is_complete("durov")
+    assert enclosures_b.get_many([url]) == {url: EnclosureInfo("image/jpeg", 10)}
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from src import (
+    utils,
+    yt_api,
+)
+from src.base import (
+    ApiChannel,
+)
+from src.metrics import (
+    YT_QUOTA_DEGRADED_FETCHES,
+)
+from src.yt_api import (
+    YTApiChannel,
+    YTApiVideo,
+)
+from src.yt_quota import (
+    QuotaExceeded,
+    QuotaManager,
+)
+
+
+def expected_urls(fake_yt, ids) -> list[str]:
+    return [f"https://www.youtube.com/watch?v=v{i}" for i in ids if i not in fake_yt.private_ids]
+
+
+def test_uploads_playlist_fetch(fake_yt, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    fake_yt.private_ids = {7, 100}
+
+    channel = YTApiChannel(fake_yt.channel_id)
+    items = channel.fetch_items(fetch_all=True)
+
+    assert [i.url for i in items] == expected_urls(fake_yt, range(fake_yt.videos_count, 0, -1))
+    assert items[0].title == f"Video {fake_yt.videos_count}"
+    assert channel.full_name == "Fake YT channel"
+    assert not any("/search" in i for i in fake_yt.requested_urls)
+    assert fake_yt.quota_used == 1 + 3 * 2  # Channel details, then playlist page and videos for each 50 videos
+
+
+def test_uploads_playlist_after_date(fake_yt, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    after_date = fake_yt.video_date(fake_yt.videos_count - 29).date()
+
+    async def inner():
+        channel = await YTApiChannel.create(fake_yt.channel_id)
+        return await channel.fetch_items_async(after_date=after_date)
+
+    items = asyncio.run(inner())
+
+    assert [i.url for i in items] == expected_urls(fake_yt, range(fake_yt.videos_count, fake_yt.videos_count - 30, -1))
+    assert fake_yt.quota_used == 1 + 2  # Single page is enough
+
+
+def test_same_items_as_search(fake_yt, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    after_date = fake_yt.video_date(60).date()
+
+    playlist_items = YTApiChannel(fake_yt.channel_id).fetch_items(after_date=after_date)
+
+    monkeypatch.setattr(YTApiChannel, "USE_UPLOADS_PLAYLIST", False)
+    monkeypatch.setattr(YTApiChannel, "SUPPORT_FILTER_BY_DATE", True)
+    search_items = YTApiChannel(fake_yt.channel_id).fetch_items(after_date=after_date)
+
+    assert playlist_items == search_items
+    assert len(search_items) == fake_yt.videos_count - 59
+
+
+def test_channel_search_cached(fake_yt):
+    channel = YTApiChannel("fake channel")
+    assert channel.url.endswith(fake_yt.channel_id)
+    assert channel.uploads_playlist_id == fake_yt.uploads_playlist_id
+    assert fake_yt.quota_used == 100 + 1
+
+    fake_yt.requested_urls.clear()
+    cached = YTApiChannel("fake channel")
+    assert (cached.url, cached.full_name, cached.uploads_playlist_id) == (
+        channel.url,
+        channel.full_name,
+        channel.uploads_playlist_id,
+    )
+    assert not fake_yt.requested_urls
+
+
+def test_videos_fetched_in_batches_and_cached(fake_yt):
+    video_ids = [f"v{i}" for i in range(1, 121)] + ["v5", "missing"]
+    fake_yt.private_ids = {3}
+
+    videos = YTApiVideo.fetch_many(video_ids)
+    assert set(videos) == {f"v{i}" for i in range(1, 121)} - {"v3"}
+    assert videos["v10"].title == "Video 10"
+    assert videos["v10"].pub_date == fake_yt.video_date(10)
+    assert fake_yt.quota_used == 3
+
+    assert YTApiVideo("v42").item_object == videos["v42"]
+    assert asyncio.run(YTApiVideo.fetch_many_async(["v1", "v2"])) == {"v1": videos["v1"], "v2": videos["v2"]}
+    assert fake_yt.quota_used == 3
+
+
+def test_channel_refresh_reuses_cached_videos(fake_yt, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    YTApiChannel(fake_yt.channel_id).fetch_items(fetch_all=True)
+
+    fake_yt.quota_used = 0
+    fake_yt.videos_count += 2
+    utils.http_cache.clear()  # Cached playlist pages expired
+    items = YTApiChannel(fake_yt.channel_id).fetch_items(fetch_all=True)
+
+    assert len(items) == fake_yt.videos_count
+    assert fake_yt.quota_used == 3 + 1  # Playlist pages, and videos call for new videos only
+
+
+def test_quota_keys_rotated(fake_yt, monkeypatch):
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    monkeypatch.setattr(yt_api, "yt_quota", QuotaManager(keys=["a", "b"], daily_quota=100, reserve=0))
+    fake_yt.keys_quota = {"a": 100, "b": 2}  # Key "b" is spent by someone else
+
+    items = YTApiChannel(fake_yt.channel_id).fetch_items(fetch_all=True)
+
+    assert len(items) == fake_yt.videos_count
+    assert set(fake_yt.used_keys) == {"a", "b"}
+    assert yt_api.yt_quota.remaining("b") == 0
+    assert yt_api.yt_quota.remaining("a") == fake_yt.keys_quota["a"]
+    assert fake_yt.quota_used == 7
+
+
+def test_expensive_call_rejected_by_reserve(fake_yt, monkeypatch):
+    monkeypatch.setattr(yt_api, "yt_quota", QuotaManager(keys=["x"], daily_quota=150, reserve=0.5))
+
+    with pytest.raises(QuotaExceeded):
+        YTApiChannel("fake channel")
+    assert not fake_yt.requested_urls
+
+    YTApiChannel(fake_yt.channel_id).fetch_items(entries_count=10)  # Cheap calls still work
+
+
+def test_background_refresh_stops_at_reserve(monkeypatch):
+    monkeypatch.setattr(yt_api, "yt_quota", QuotaManager(keys=["x"], daily_quota=100, reserve=0.2))
+    assert YTApiChannel.can_refresh_in_background()
+
+    yt_api.yt_quota.spend("x", 79)
+    assert YTApiChannel.can_refresh_in_background()
+
+    yt_api.yt_quota.spend("x", 1)  # Rest is kept for reader requests
+    assert not YTApiChannel.can_refresh_in_background()
+    assert ApiChannel.can_refresh_in_background()
+
+
+def test_stored_items_served_when_quota_spent(fake_yt, monkeypatch):
+    channel = YTApiChannel(fake_yt.channel_id)
+    stored = channel.fetch_items(entries_count=60)
+
+    fake_yt.videos_count += 5
+    utils.http_cache.clear()
+    yt_api.yt_quota.exhaust("x")
+    degraded = YT_QUOTA_DEGRADED_FETCHES.value(endpoint="playlistItems")
+    assert channel.fetch_items(entries_count=60) == stored
+    assert YT_QUOTA_DEGRADED_FETCHES.value(endpoint="playlistItems") == degraded + 1
+
+    monkeypatch.setattr(ApiChannel, "item_store", None)
+    with pytest.raises(QuotaExceeded):
+        channel.fetch_items(entries_count=60)